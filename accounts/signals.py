@@ -2,6 +2,7 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from django.core.mail import EmailMessage
+from core.mails import mettre_en_file
 from django.utils.crypto import get_random_string
 from django.conf import settings
 
@@ -36,5 +37,5 @@ def send_random_password(sender, instance, created, **kwargs):
             bcc=cci_destinataires
         )
 
-        email.send()
+        mettre_en_file(email, origine='accounts.User', confidentiel=True)
 
@@ -50,8 +50,14 @@ class ContratAdmin(admin.ModelAdmin):
     list_display = ("reference", "client", "date_signature", "mode_paiement", "taux_ras_tva", "taux_ras_is")
     search_fields = ("reference", "client__nom")
     list_filter = ("mode_paiement",)
+    list_select_related = ("client",)
     readonly_fields = ('created_by','updated_by')
 
+    def delete_queryset(self, request, queryset):
+        # Suppression unitaire : Contrat.delete() remet à jour le parent (dernier avenant)
+        for contrat in queryset:
+            contrat.delete()
+
 
 
 class EtatFactureListFilter(admin.SimpleListFilter):
@@ -66,11 +72,9 @@ class EtatFactureListFilter(admin.SimpleListFilter):
 
     def queryset(self, request, queryset):
         if self.value() == "payee":
-            ids = [f.pk for f in queryset.filter(paiement__isnull=False) if f.paiement and f.paiement.est_solde]
-            return queryset.filter(pk__in=ids)
+            return queryset.filter(est_payee=True)
         if self.value() == "non_payee":
-            ids = [f.pk for f in queryset if not (f.paiement and f.paiement.est_solde)]
-            return queryset.filter(pk__in=ids)
+            return queryset.filter(est_payee=False)
         return queryset
 
 
@@ -79,6 +83,11 @@ class FactureAdmin(admin.ModelAdmin):
     list_display = ("contrat", "numero", "date_emission", "date_echeance", "etat_facture")
     search_fields = ("contrat__reference",)
     list_filter = ("date_echeance", EtatFactureListFilter)
+    list_select_related = ("contrat",)
+
+    def get_queryset(self, request):
+        # État de paiement calculé en base (filtre et colonne "État de paiement")
+        return super().get_queryset(request).avec_etat_paiement()
 
     def etat_facture(self, obj):
         if obj.fact_payee:
@@ -114,13 +123,10 @@ class FactureAdmin(admin.ModelAdmin):
                 contrat_id = facture.contrat_id if facture else None
             else:
                 contrat_id = None
+            paiements = Paiement.objects.non_soldes()
             if contrat_id:
-                client_id = Facture.objects.filter(contrat_id=contrat_id).values_list('contrat__client_id', flat=True).first()
-                all_paiements = Paiement.objects.filter(client_id=client_id)
-            else:
-                all_paiements = Paiement.objects.all()
-            non_solde_ids = [p.id for p in all_paiements if not p.est_solde]
-            kwargs["queryset"] = Paiement.objects.filter(id__in=non_solde_ids)
+                paiements = paiements.filter(client_id=facture.contrat.client_id)
+            kwargs["queryset"] = paiements
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 @admin.register(Paiement)
@@ -129,3 +135,10 @@ class PaiementAdmin(admin.ModelAdmin):
     search_fields = ("client__nom",)
     list_filter = ("date_encaissement",)
     readonly_fields = ('created_by','updated_by')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('client', 'compte_bancaire').avec_solde()
+
+    @admin.display(boolean=True, ordering='est_regle', description="Soldé")
+    def est_solde(self, obj):
+        return obj.est_solde
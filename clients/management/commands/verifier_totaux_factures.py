@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Commande Django: Contrôle (et reprend) les totaux stockés des factures clients.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from clients.models import get_ecarts_totaux_factures, recalculer_totaux_factures
+
+
+class Command(BaseCommand):
+    help = "Compare les totaux stockés de chaque facture client à la somme de ses lignes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--corriger',
+            action='store_true',
+            help="Recalcule les totaux erronés depuis les lignes (reprise des données)",
+        )
+
+    def handle(self, *args, **options):
+        ecarts = get_ecarts_totaux_factures()
+
+        if not ecarts:
+            self.stdout.write(self.style.SUCCESS("Aucun écart : tous les totaux de factures sont cohérents."))
+            return
+
+        for facture, totaux in ecarts:
+            self.stdout.write(
+                f"Facture {facture.numero or facture.pk} : net à payer {facture.net_a_payer} "
+                f"- lignes {totaux['net_a_payer']}"
+            )
+
+        if not options['corriger']:
+            self.stdout.write(self.style.WARNING(
+                f"{len(ecarts)} facture(s) en écart. Relancer avec --corriger pour les rectifier."
+            ))
+            return
+
+        with transaction.atomic():
+            nombre = recalculer_totaux_factures([facture.pk for facture, _ in ecarts])
+
+        self.stdout.write(self.style.SUCCESS(f"{nombre} facture(s) corrigée(s)."))
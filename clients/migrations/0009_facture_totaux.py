@@ -0,0 +1,77 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:00
+
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import migrations, models
+
+CHAMPS_TOTAUX = ('montant_ht', 'montant_tva', 'montant_ttc', 'montant_ras_tva', 'montant_ras_is', 'net_a_payer')
+
+
+def calculer_totaux(apps, schema_editor):
+    # Mêmes formules que les propriétés de LigneFacture (absentes des modèles historiques)
+    Facture = apps.get_model('clients', 'Facture')
+    LigneFacture = apps.get_model('clients', 'LigneFacture')
+
+    totaux = {}
+    for ligne in LigneFacture.objects.only('facture_id', 'montant_ht', 'base_tva', 'taux_tva', 'taux_ras_tva', 'taux_ras_is'):
+        montant_tva = ligne.base_tva * ligne.taux_tva / 100
+        montant_ttc = ligne.montant_ht + montant_tva
+        montant_ras_tva = montant_tva * ligne.taux_ras_tva / 100
+        montant_ras_is = ligne.montant_ht * ligne.taux_ras_is / 100
+        montants = (
+            ligne.montant_ht, montant_tva, montant_ttc, montant_ras_tva, montant_ras_is,
+            montant_ttc - montant_ras_tva - montant_ras_is,
+        )
+        cumul = totaux.setdefault(ligne.facture_id, [Decimal('0')] * len(CHAMPS_TOTAUX))
+        for i, montant in enumerate(montants):
+            cumul[i] += montant
+
+    factures = []
+    for facture in Facture.objects.only('pk'):
+        if facture.pk not in totaux:
+            # Sans ligne : les totaux par défaut (0) sont exacts
+            continue
+        for champ, valeur in zip(CHAMPS_TOTAUX, totaux[facture.pk]):
+            setattr(facture, champ, valeur.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+        factures.append(facture)
+    Facture.objects.bulk_update(factures, CHAMPS_TOTAUX, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0008_contrat_statut'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facture',
+            name='montant_ht',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14, verbose_name='Montant HT'),
+        ),
+        migrations.AddField(
+            model_name='facture',
+            name='montant_tva',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14, verbose_name='Montant TVA'),
+        ),
+        migrations.AddField(
+            model_name='facture',
+            name='montant_ttc',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14, verbose_name='Montant TTC'),
+        ),
+        migrations.AddField(
+            model_name='facture',
+            name='montant_ras_tva',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14, verbose_name='Montant RAS TVA'),
+        ),
+        migrations.AddField(
+            model_name='facture',
+            name='montant_ras_is',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14, verbose_name='Montant RAS IS'),
+        ),
+        migrations.AddField(
+            model_name='facture',
+            name='net_a_payer',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14, verbose_name='Net à payer'),
+        ),
+        migrations.RunPython(calculer_totaux, migrations.RunPython.noop),
+    ]
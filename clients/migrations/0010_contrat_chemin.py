@@ -0,0 +1,49 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+def calculer_chemins(apps, schema_editor):
+    Contrat = apps.get_model('clients', 'Contrat')
+    contrats = {c.pk: c for c in Contrat.objects.only('pk', 'parent_id', 'reference')}
+    parents = {c.parent_id for c in contrats.values() if c.parent_id}
+
+    def chemins(contrat):
+        if not hasattr(contrat, '_chemins'):
+            if contrat.parent_id is None:
+                contrat._chemins = ('', contrat.reference)
+            else:
+                chemin, references = chemins(contrats[contrat.parent_id])
+                contrat._chemins = (f"{chemin or '/'}{contrat.parent_id}/", f"{references}-{contrat.reference}")
+        return contrat._chemins
+
+    for contrat in contrats.values():
+        contrat.chemin, contrat.chemin_references = chemins(contrat)
+        contrat.est_feuille = contrat.pk not in parents
+    Contrat.objects.bulk_update(contrats.values(), ['chemin', 'chemin_references', 'est_feuille'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0009_facture_totaux'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contrat',
+            name='chemin',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='contrat',
+            name='chemin_references',
+            field=models.CharField(blank=True, default='', editable=False, max_length=1000),
+        ),
+        migrations.AddField(
+            model_name='contrat',
+            name='est_feuille',
+            field=models.BooleanField(default=True, editable=False, verbose_name='Dernier avenant'),
+        ),
+        migrations.RunPython(calculer_chemins, migrations.RunPython.noop),
+    ]
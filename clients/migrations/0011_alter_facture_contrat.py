@@ -0,0 +1,19 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0010_contrat_chemin'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='facture',
+            name='contrat',
+            field=models.ForeignKey(limit_choices_to={'est_feuille': True, 'is_solde': False}, on_delete=django.db.models.deletion.CASCADE, related_name='factures', to='clients.contrat'),
+        ),
+    ]
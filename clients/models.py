@@ -1,12 +1,13 @@
+from decimal import Decimal, ROUND_HALF_UP
 from django.db import models
+from django.db.models import BooleanField, DecimalField, Exists, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from core.models import AuditModel
 from core.choices import TYPE_MODE_PAIEMENT
 from fournisseurs.models import CompteTresorerie
-from datetime import timedelta
-from dateutil.relativedelta import relativedelta
-from calendar import monthrange
+from core.echeances import calculer_echeance, calculer_echeances
 
 class Client(AuditModel):
     id_cpt = models.CharField(max_length=8, unique=True)
@@ -104,47 +105,99 @@ class Contrat(AuditModel):
         verbose_name="Date de l'accord du CA"
     )
 
+    # Chaîne d'avenants matérialisée, maintenue par save() :
+    # - chemin : identifiants des ancêtres depuis la racine, ex. "/3/8/" (vide pour un contrat racine)
+    # - chemin_references : références de la racine jusqu'à ce contrat, ex. "C01-AV1-AV2"
+    # - est_feuille : le contrat n'a pas d'avenant (seul contrat facturable de sa chaîne)
+    chemin = models.CharField(max_length=255, blank=True, default='', editable=False)
+    chemin_references = models.CharField(max_length=1000, blank=True, default='', editable=False)
+    est_feuille = models.BooleanField(default=True, editable=False, verbose_name="Dernier avenant")
+
     def __str__(self):
-        # Construit la chaîne complète de références depuis le contrat racine jusqu'à ce contrat
-        chain = []
-        contrat = self
-        while contrat is not None:
-            chain.append(contrat.reference)
-            contrat = contrat.parent
-        return '-'.join(reversed(chain))
+        # Chaîne complète de références depuis le contrat racine jusqu'à ce contrat
+        return self.chemin_references or self.reference
 
     @property
     def is_avenant(self):
         return self.parent is not None
 
     def save(self, *args, **kwargs):
+        from django.core.exceptions import ValidationError
 
         # Validation métier AVANT save
         if self.client and self.client.partie_liee and self.statut == "autorise" and not self.date_accord_ca:
-            from django.core.exceptions import ValidationError
             raise ValidationError("La date de l'accord du CA est obligatoire pour les clients parties liées lorsque le contrat est autorisé.")
 
-        # Cas avenant
-        if self.parent is not None:
-            self.is_actif = True
-            super().save(*args, **kwargs)
-
-            # Désactiver le parent
-            Contrat.objects.filter(pk=self.parent.pk).update(is_actif=False)
+        ancien = self.etat_precedent
+        if self.parent is not None and self.pk and (self.parent.pk == self.pk or f"/{self.pk}/" in self.parent.chemin):
+            raise ValidationError("Un contrat ne peut pas être l'avenant de lui-même ou de l'un de ses avenants.")
 
-        else:
-            # 🔑 IMPORTANT : sauvegarder d'abord pour avoir un PK
-            super().save(*args, **kwargs)
+        if ancien is not None:
+            # est_feuille ne dépend que des avenants : l'état en base fait foi
+            self.est_feuille = ancien.est_feuille
+        self.chemin, self.chemin_references = self._chemins_depuis_parent(self.parent, self.reference)
+        # Seul le dernier avenant d'une chaîne est actif
+        self.is_actif = self.est_feuille
+        super().save(*args, **kwargs)
 
-            # Maintenant on peut utiliser avenants
-            if self.avenants.exists():
-                self.is_actif = False
-            else:
-                self.is_actif = True
+        ancien_parent_id = ancien.parent_id if ancien else None
+        if self.parent_id and self.parent_id != ancien_parent_id:
+            # Nouvel avenant : le parent n'est plus le dernier de la chaîne
+            Contrat.objects.filter(pk=self.parent_id).update(est_feuille=False, is_actif=False)
+        if ancien_parent_id and ancien_parent_id != self.parent_id:
+            Contrat.mettre_a_jour_feuille(ancien_parent_id)
+        if ancien and (ancien.chemin, ancien.chemin_references) != (self.chemin, self.chemin_references):
+            self._propager_chemins_descendants()
+        if ancien and ancien.delai_paiement != self.delai_paiement:
+            # Nouveau délai : les échéances des factures non payées suivent le contrat
+            recalculer_echeances_factures(self.factures.non_payees())
+
+    def delete(self, *args, **kwargs):
+        parent_id = self.parent_id
+        resultat = super().delete(*args, **kwargs)
+        if parent_id:
+            Contrat.mettre_a_jour_feuille(parent_id)
+        return resultat
 
-            # Mise à jour après logique
-            super().save(update_fields=["is_actif"])
+    @staticmethod
+    def _chemins_depuis_parent(parent, reference):
+        if parent is None:
+            return '', reference
+        return f"{parent.chemin or '/'}{parent.pk}/", f"{parent.chemin_references or parent.reference}-{reference}"
 
+    @staticmethod
+    def mettre_a_jour_feuille(contrat_id):
+        """ Recalcule est_feuille (et is_actif) d'un contrat après retrait d'un de ses avenants. """
+        feuille = not Contrat.objects.filter(parent_id=contrat_id).exists()
+        Contrat.objects.filter(pk=contrat_id).update(est_feuille=feuille, is_actif=feuille)
+
+    def _propager_chemins_descendants(self):
+        """ Réécrit les chemins des avenants descendants après re-rattachement ou renommage. """
+        descendants = list(
+            Contrat.objects.filter(chemin__contains=f"/{self.pk}/").only('pk', 'parent_id', 'reference', 'chemin', 'chemin_references')
+        )
+        parents = {self.pk: self}
+        # Un ancêtre a toujours un chemin plus court que ses descendants
+        for contrat in sorted(descendants, key=lambda c: c.chemin.count('/')):
+            parents[contrat.pk] = contrat
+            contrat.chemin, contrat.chemin_references = self._chemins_depuis_parent(parents[contrat.parent_id], contrat.reference)
+        Contrat.objects.bulk_update(descendants, ['chemin', 'chemin_references'], batch_size=500)
+
+
+class FactureQuerySet(models.QuerySet):
+    """ Requêtes sur l'état de paiement des factures, évalué en base. """
+
+    def avec_etat_paiement(self):
+        """ Annote est_payee : la facture est rattachée à un paiement soldé. """
+        return self.annotate(
+            est_payee=Exists(Paiement.objects.soldes().filter(pk=OuterRef('paiement_id')))
+        )
+
+    def payees(self):
+        return self.avec_etat_paiement().filter(est_payee=True)
+
+    def non_payees(self):
+        return self.avec_etat_paiement().filter(est_payee=False)
 
 class Facture(AuditModel):
     numero = models.CharField(max_length=10, unique=True, verbose_name="Numéro de facture")
@@ -152,12 +205,19 @@ class Facture(AuditModel):
         Contrat,
         on_delete=models.CASCADE,
         related_name='factures',
-        limit_choices_to={'is_actif': True,'is_solde': False}
+        limit_choices_to={'est_feuille': True, 'is_solde': False}
     )
     date_realisation = models.DateField(verbose_name="Date de base d'échéance", null=True, blank=True)
     date_emission = models.DateField(verbose_name="Date d'émission")
     date_echeance = models.DateField(verbose_name="Date d'échéance")
-    # Les montants et taux sont désormais gérés par les lignes de facture
+    # Les montants et taux sont désormais gérés par les lignes de facture ;
+    # leurs totaux sont stockés ici et recalculés à chaque écriture d'une ligne
+    montant_ht = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), editable=False, verbose_name="Montant HT")
+    montant_tva = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), editable=False, verbose_name="Montant TVA")
+    montant_ttc = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), editable=False, verbose_name="Montant TTC")
+    montant_ras_tva = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), editable=False, verbose_name="Montant RAS TVA")
+    montant_ras_is = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), editable=False, verbose_name="Montant RAS IS")
+    net_a_payer = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), editable=False, verbose_name="Net à payer")
     scan_pdf = models.FileField(upload_to='clients/factures/', blank=True, null=True, help_text="Scan de la facture (PDF)")
     paiement = models.ForeignKey(
         'Paiement',
@@ -167,39 +227,7 @@ class Facture(AuditModel):
         related_name='factures'
     )
 
-    @staticmethod
-    def _calculate_echeance(date_de_depart, delai_paiement):
-        """
-        Calcule la date d'échéance basée sur un délai de paiement.
-        
-        Formats supportés:
-        - "15J" : ajoute 15 jours
-        - "30JFDM" : ajoute 30 jours et va au dernier jour du mois
-        - etc.
-        
-        Args:
-            date_de_depart (date): La date de référence
-            delai_paiement (str): Le délai (ex: "30J", "30JFDM", "90JFDM")
-            
-        Returns:
-            date: La date d'échéance calculée
-        """
-        if not delai_paiement or not date_de_depart:
-            return None
-            
-        if delai_paiement.endswith('JFDM'):
-            # Fin de mois : ajouter N jours, puis aller au dernier jour du mois
-            jours = int(delai_paiement.replace('JFDM', ''))
-            date_temp = date_de_depart + timedelta(days=jours)
-            # Récupérer le dernier jour du mois
-            last_day = monthrange(date_temp.year, date_temp.month)[1]
-            return date_temp.replace(day=last_day)
-        elif delai_paiement.endswith('J'):
-            # Jours simples
-            jours = int(delai_paiement.replace('J', ''))
-            return date_de_depart + timedelta(days=jours)
-        
-        return None
+    objects = FactureQuerySet.as_manager()
 
     @property
     def echeance_contractuelle(self):
@@ -214,42 +242,44 @@ class Facture(AuditModel):
         date_de_depart = self.date_realisation or self.date_emission
         if not date_de_depart or not self.contrat:
             return None
-        return self._calculate_echeance(date_de_depart, self.contrat.delai_paiement)
+        return calculer_echeance(date_de_depart, self.contrat.delai_paiement)
 
     def save(self, *args, **kwargs):
         # Validation : la facture doit être liée à un contrat sans fils (pas d'avenant)
-        if self.contrat.avenants.exists():
+        if not self.contrat.est_feuille:
             raise ValueError("La facture doit être liée à un contrat sans avenant (pas de fils).")
         if self.date_echeance != self.echeance_contractuelle:
             raise ValueError("La date d'échéance doit être calculée automatiquement en fonction du contrat et ne peut pas être modifiée manuellement.")
+        if kwargs.get('update_fields') is None and not self._state.adding:
+            # Les totaux sont maintenus depuis les lignes : ne pas réécrire
+            # les valeurs (possiblement périmées) portées par l'instance
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in CHAMPS_TOTAUX_FACTURE
+            ]
         super().save(*args, **kwargs)
 
-    @property
-    def montant_ht(self):
-        return sum(l.montant_ht for l in self.lignes.all())
-
-    @property
-    def montant_tva(self):
-        return sum(l.montant_tva for l in self.lignes.all())
-
-    @property
-    def montant_ttc(self):
-        return sum(l.montant_ttc for l in self.lignes.all())
+    def calculer_totaux(self):
+        """ Totaux de la facture calculés depuis ses lignes (arrondis au centime). """
+        return totaux_lignes(self.lignes.all())
 
-    @property
-    def montant_ras_tva(self):
-        return sum(l.montant_ras_tva for l in self.lignes.all())
+    def recalculer_totaux(self):
+        """
+        Recalcule et enregistre les totaux stockés depuis les lignes.
 
-    @property
-    def montant_ras_is(self):
-        return sum(l.montant_ras_is for l in self.lignes.all())
+        Écrit par UPDATE : les contrôles de save() (contrat sans avenant, échéance)
+        ne concernent pas les montants.
+        """
+        totaux = self.calculer_totaux()
+        Facture.objects.filter(pk=self.pk).update(**totaux)
+        for champ, valeur in totaux.items():
+            setattr(self, champ, valeur)
 
-    @property
-    def net_a_payer(self):
-        return sum(l.net_a_payer for l in self.lignes.all())
-    
     @property
     def fact_payee(self):
+        # Valeur annotée par FactureQuerySet.avec_etat_paiement() si disponible
+        if hasattr(self, 'est_payee'):
+            return self.est_payee
         return self.paiement and self.paiement.est_solde
     
     def __str__(self):
@@ -285,6 +315,125 @@ class LigneFacture(models.Model):
     def net_a_payer(self):
         return self.montant_ttc - self.montant_ras_tva - self.montant_ras_is
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.facture.recalculer_totaux()
+
+    def delete(self, *args, **kwargs):
+        resultat = super().delete(*args, **kwargs)
+        self.facture.recalculer_totaux()
+        return resultat
+
+CHAMPS_TOTAUX_FACTURE = ('montant_ht', 'montant_tva', 'montant_ttc', 'montant_ras_tva', 'montant_ras_is', 'net_a_payer')
+
+def totaux_lignes(lignes):
+    """ Somme des montants d'un ensemble de lignes, arrondie au centime comme les champs stockés. """
+    totaux = {champ: Decimal('0') for champ in CHAMPS_TOTAUX_FACTURE}
+    for ligne in lignes:
+        for champ in CHAMPS_TOTAUX_FACTURE:
+            totaux[champ] += getattr(ligne, champ)
+    return {champ: valeur.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) for champ, valeur in totaux.items()}
+
+def get_ecarts_totaux_factures(facture_ids=None):
+    """
+    Factures dont les totaux stockés diffèrent de la somme de leurs lignes.
+
+    Returns:
+        list: Tuples (facture, totaux recalculés)
+    """
+    factures = Facture.objects.all()
+    lignes = LigneFacture.objects.all()
+    if facture_ids is not None:
+        factures = factures.filter(pk__in=facture_ids)
+        lignes = lignes.filter(facture_id__in=facture_ids)
+
+    lignes_par_facture = {}
+    for ligne in lignes.only('facture_id', 'montant_ht', 'base_tva', 'taux_tva', 'taux_ras_tva', 'taux_ras_is'):
+        lignes_par_facture.setdefault(ligne.facture_id, []).append(ligne)
+
+    ecarts = []
+    for facture in factures.only('pk', 'numero', *CHAMPS_TOTAUX_FACTURE).order_by('pk'):
+        totaux = totaux_lignes(lignes_par_facture.get(facture.pk, []))
+        if any(getattr(facture, champ) != valeur for champ, valeur in totaux.items()):
+            ecarts.append((facture, totaux))
+    return ecarts
+
+def recalculer_totaux_factures(facture_ids=None):
+    """
+    Recalcule les totaux stockés des factures indiquées (toutes par défaut).
+
+    Pour les chemins qui contournent LigneFacture.save()/delete() (bulk_create, update,
+    delete en masse) et pour la reprise des données.
+
+    Returns:
+        int: Nombre de factures dont les totaux ont changé
+    """
+    a_corriger = []
+    for facture, totaux in get_ecarts_totaux_factures(facture_ids):
+        for champ, valeur in totaux.items():
+            setattr(facture, champ, valeur)
+        a_corriger.append(facture)
+
+    Facture.objects.bulk_update(a_corriger, CHAMPS_TOTAUX_FACTURE, batch_size=500)
+    return len(a_corriger)
+
+def recalculer_echeances_factures(factures=None):
+    """
+    Recalcule en masse la date d'échéance contractuelle des factures (toutes par défaut).
+
+    Returns:
+        int: Nombre de factures dont l'échéance a changé
+    """
+    import pandas as pd
+
+    factures = Facture.objects.all() if factures is None else factures
+    colonnes = ['pk', 'date_realisation', 'date_emission', 'date_echeance', 'contrat__delai_paiement']
+    donnees = pd.DataFrame.from_records(factures.values(*colonnes), columns=colonnes)
+    if donnees.empty:
+        return 0
+
+    date_depart = donnees['date_realisation'].fillna(donnees['date_emission'])
+    echeances = calculer_echeances(date_depart, donnees['contrat__delai_paiement']).dt.date
+    a_corriger = donnees[echeances.notna() & (echeances != donnees['date_echeance'])].assign(date_echeance=echeances)
+
+    Facture.objects.bulk_update(
+        [Facture(pk=ligne.pk, date_echeance=ligne.date_echeance) for ligne in a_corriger.itertuples()],
+        ['date_echeance'],
+        batch_size=500,
+    )
+    return len(a_corriger)
+
+class PaiementQuerySet(models.QuerySet):
+    """ Requêtes sur le solde des paiements, calculé en base depuis les totaux stockés des factures. """
+
+    def avec_solde(self):
+        """
+        Annote chaque paiement avec :
+        - montant_affecte : somme des nets à payer des factures rattachées
+        - solde_restant : montant du paiement non encore affecté
+        - est_regle : le paiement est entièrement affecté
+        """
+        montant = DecimalField(max_digits=14, decimal_places=2)
+        total_factures = (
+            Facture.objects.filter(paiement=OuterRef('pk'))
+            .order_by()
+            .values('paiement')
+            .annotate(total=Sum('net_a_payer'))
+            .values('total')
+        )
+        return self.annotate(
+            montant_affecte=Coalesce(Subquery(total_factures, output_field=montant), Value(Decimal('0.00')), output_field=montant),
+        ).annotate(
+            solde_restant=ExpressionWrapper(F('montant_total') - F('montant_affecte'), output_field=montant),
+            est_regle=ExpressionWrapper(Q(montant_total=F('montant_affecte')), output_field=BooleanField()),
+        )
+
+    def soldes(self):
+        return self.avec_solde().filter(montant_total=F('montant_affecte'))
+
+    def non_soldes(self):
+        return self.avec_solde().exclude(montant_total=F('montant_affecte'))
+
 class Paiement(AuditModel):
     client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='paiements')
     compte_bancaire = models.ForeignKey(
@@ -300,12 +449,20 @@ class Paiement(AuditModel):
     montant_total = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Montant total du paiement")
     date_encaissement = models.DateField()
 
+    objects = PaiementQuerySet.as_manager()
+
     def __str__(self):
         return f"Paiement {self.id} - {self.client.nom}"
 
     @property
     def montant_factures(self):
-        return sum(f.net_a_payer for f in self.factures.all())
+        # Valeur annotée par PaiementQuerySet.avec_solde() si disponible
+        if hasattr(self, 'montant_affecte'):
+            return self.montant_affecte
+        # Réutilise les factures préchargées (prefetch_related) plutôt qu'une requête par paiement
+        if 'factures' in getattr(self, '_prefetched_objects_cache', {}):
+            return sum((f.net_a_payer for f in self.factures.all()), Decimal('0.00'))
+        return self.factures.aggregate(total=Sum('net_a_payer'))['total'] or Decimal('0.00')
 
     @property
     def solde(self):
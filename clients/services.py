@@ -1,51 +1,57 @@
+from decimal import Decimal
+from django.db.models import DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from datetime import timedelta
 from .models import Facture, Paiement
 
+def get_synthese_creances(aujourdhui=None, nombre_retards=10):
+    """
+    Synthèse des créances clients calculée en base, sur les seules factures non payées.
+
+    Args:
+        aujourdhui: Date de référence (aujourd'hui par défaut)
+        nombre_retards: Nombre de factures échues détaillées (les plus anciennes)
+
+    Returns:
+        dict: montant_total_du, montant_echu_retard, previsions_30j, factures_en_retard
+    """
+    aujourdhui = aujourdhui or timezone.now().date()
+    prochains_30_jours = aujourdhui + timedelta(days=30)
+    zero = Value(Decimal('0.00'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+    factures_non_payees = Facture.objects.non_payees()
+
+    totaux = factures_non_payees.aggregate(
+        montant_total_du=Coalesce(Sum('net_a_payer'), zero),
+        montant_echu_retard=Coalesce(Sum('net_a_payer', filter=Q(date_echeance__lt=aujourdhui)), zero),
+        previsions_30j=Coalesce(
+            Sum('net_a_payer', filter=Q(date_echeance__gte=aujourdhui, date_echeance__lte=prochains_30_jours)),
+            zero,
+        ),
+    )
+
+    # Factures échues, du plus grand nombre de jours de retard au plus petit
+    factures_en_retard = [
+        {**facture, 'jours_retard': (aujourdhui - facture['date_echeance']).days}
+        for facture in factures_non_payees
+        .filter(date_echeance__lt=aujourdhui)
+        .order_by('date_echeance', 'pk')
+        .values('numero', 'date_echeance', 'net_a_payer', client=F('contrat__client__nom'))[:nombre_retards]
+    ]
+
+    return {**totaux, 'factures_en_retard': factures_en_retard}
+
 def get_weekly_dashboard_data():
     aujourdhui = timezone.now().date()
-    prochains_30_jours = aujourdhui + timedelta(days=30)
-    
-    # Filtrage principal en Python via les propriétés métier (fact_payee/net_a_payer).
-    # Cela évite les expressions ORM sur des propriétés non mappées en base.
-    toutes_factures = Facture.objects.select_related('contrat', 'contrat__client', 'paiement').prefetch_related('lignes')
-    
-    factures_non_soldees = []
-    montant_total_du = 0
-    montant_echu_retard = 0
-    factures_en_retard = []
-    previsions_30j = 0
-
-    for f in toutes_factures:
-        if not f.fact_payee:
-            net_a_payer = f.net_a_payer
-            montant_total_du += net_a_payer
-            
-            # Structure de base pour le template
-            fact_data = {
-                'numero': f.numero,
-                'client': f.contrat.client.nom,
-                'date_echeance': f.date_echeance,
-                'net_a_payer': net_a_payer,
-                'jours_retard': (aujourdhui - f.date_echeance).days if aujourdhui > f.date_echeance else 0
-            }
-            
-            # Factures échues (en retard)
-            if f.date_echeance < aujourdhui:
-                montant_echu_retard += net_a_payer
-                factures_en_retard.append(fact_data)
-            # Prévisions de cash à 30 jours (échéance future proche)
-            elif aujourdhui <= f.date_echeance <= prochains_30_jours:
-                previsions_30j += net_a_payer
-
-    # Tri des retards par le plus grand nombre de jours de retard
-    factures_en_retard = sorted(factures_en_retard, key=lambda x: x['jours_retard'], reverse=True)
+
+    # 1. Créances : agrégats SQL limités aux factures non payées
+    synthese = get_synthese_creances(aujourdhui)
+    montant_total_du = synthese['montant_total_du']
+    montant_echu_retard = synthese['montant_echu_retard']
 
     # 2. Alertes Écarts de Paiement (solde != 0)
-    paiements_anormaux = [
-        p for p in Paiement.objects.select_related('client').prefetch_related('factures__lignes')
-        if not p.est_solde
-    ]
+    paiements_anormaux = list(Paiement.objects.non_soldes().select_related('client'))
 
     # Calcul du taux de retard
     taux_retard = (montant_echu_retard / montant_total_du * 100) if montant_total_du > 0 else 0
@@ -55,7 +61,7 @@ def get_weekly_dashboard_data():
         'montant_total_du': montant_total_du,
         'montant_echu_retard': montant_echu_retard,
         'taux_retard': round(taux_retard, 2),
-        'previsions_30j': previsions_30j,
-        'factures_en_retard': factures_en_retard[:10],  # Top 10
+        'previsions_30j': synthese['previsions_30j'],
+        'factures_en_retard': synthese['factures_en_retard'],  # Top 10
         'paiements_anormaux': paiements_anormaux,
-    }
\ No newline at end of file
+    }
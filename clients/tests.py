@@ -0,0 +1,379 @@
+"""
+Tests pour l'application clients
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.test import TestCase
+
+from clients.models import (
+    Client, Contrat, Facture, LigneFacture, Paiement, get_ecarts_totaux_factures, recalculer_totaux_factures,
+)
+from core.echeances import calculer_echeance
+
+
+class ClientsTestMixin:
+    """Client et contrat racine (90 jours fin de mois, TVA 20 %, RAS TVA 75 %)"""
+
+    def setUp(self):
+        self.client_test = Client.objects.create(id_cpt='C001', nom='Client Test')
+        self.contrat = self.creer_contrat('CT01')
+
+    def creer_contrat(self, reference, parent=None, client=None):
+        return Contrat.objects.create(
+            client=client or self.client_test,
+            parent=parent,
+            reference=reference,
+            date_signature=date(2026, 1, 1),
+            mode_paiement='virement',
+            montant_ht=Decimal('100000.00'),
+        )
+
+    def creer_facture(self, numero, date_emission=date(2026, 1, 15), contrat=None, paiement=None):
+        contrat = contrat or self.contrat
+        return Facture.objects.create(
+            numero=numero,
+            contrat=contrat,
+            date_emission=date_emission,
+            date_echeance=calculer_echeance(date_emission, contrat.delai_paiement),
+            paiement=paiement,
+        )
+
+    def ajouter_ligne(self, facture, montant_ht='1000.00', taux_ras_is='0'):
+        """Ligne à TVA 20 % sur la totalité et RAS TVA 75 % : net = 1,05 x HT - RAS IS"""
+        return LigneFacture.objects.create(
+            facture=facture,
+            description='Prestation',
+            montant_ht=Decimal(montant_ht),
+            base_tva=Decimal(montant_ht),
+            taux_tva=Decimal('20'),
+            taux_ras_tva=Decimal('75'),
+            taux_ras_is=Decimal(taux_ras_is),
+        )
+
+
+class TotauxFactureTests(ClientsTestMixin, TestCase):
+    """Tests des totaux stockés sur Facture et maintenus depuis ses lignes"""
+
+    def totaux(self, facture):
+        facture = Facture.objects.get(pk=facture.pk)
+        return facture.montant_ht, facture.montant_ttc, facture.net_a_payer
+
+    def test_lignes_mettent_a_jour_les_totaux(self):
+        """Test que l'ajout, la modification et la suppression d'une ligne recalculent les totaux"""
+        facture = self.creer_facture('F001')
+        self.assertEqual(self.totaux(facture), (Decimal('0.00'),) * 3)
+
+        ligne = self.ajouter_ligne(facture)
+        self.ajouter_ligne(facture, '500.00', taux_ras_is='10')
+        self.assertEqual(self.totaux(facture), (Decimal('1500.00'), Decimal('1800.00'), Decimal('1525.00')))
+
+        ligne.montant_ht = ligne.base_tva = Decimal('2000.00')
+        ligne.save()
+        self.assertEqual(self.totaux(facture), (Decimal('2500.00'), Decimal('3000.00'), Decimal('2575.00')))
+
+        ligne.delete()
+        self.assertEqual(self.totaux(facture), (Decimal('500.00'), Decimal('600.00'), Decimal('475.00')))
+
+    def test_save_facture_ne_reecrit_pas_les_totaux(self):
+        """Test qu'une instance aux totaux périmés n'écrase pas les totaux tenus par les lignes"""
+        facture = self.creer_facture('F001')
+        perimee = Facture.objects.get(pk=facture.pk)
+        self.ajouter_ligne(facture)
+
+        perimee.date_realisation = date(2026, 1, 10)
+        perimee.date_echeance = perimee.echeance_contractuelle
+        perimee.save()
+
+        facture.refresh_from_db()
+        self.assertEqual((facture.date_realisation, facture.net_a_payer), (date(2026, 1, 10), Decimal('1050.00')))
+
+    def test_ecarts_detectes_puis_corriges(self):
+        """Test que get_ecarts_totaux_factures signale les totaux modifiés hors des lignes"""
+        facture = self.creer_facture('F001')
+        autre = self.creer_facture('F002')
+        self.ajouter_ligne(facture)
+        self.ajouter_ligne(autre)
+        self.assertEqual(get_ecarts_totaux_factures(), [])
+
+        # Chemins qui contournent LigneFacture.save()
+        LigneFacture.objects.filter(facture=facture).update(montant_ht=Decimal('3000.00'), base_tva=Decimal('3000.00'))
+        Facture.objects.filter(pk=autre.pk).update(net_a_payer=Decimal('0.00'))
+
+        ecarts = get_ecarts_totaux_factures()
+        self.assertEqual([ecart.pk for ecart, _ in ecarts], [facture.pk, autre.pk])
+        self.assertEqual(ecarts[0][1]['net_a_payer'], Decimal('3150.00'))
+        self.assertEqual(get_ecarts_totaux_factures([autre.pk])[0][1]['net_a_payer'], Decimal('1050.00'))
+
+        self.assertEqual(recalculer_totaux_factures(), 2)
+        self.assertEqual(get_ecarts_totaux_factures(), [])
+
+    def test_migration_reprend_les_totaux(self):
+        """Test que la reprise de 0009_facture_totaux calcule les totaux des factures existantes"""
+        from importlib import import_module
+        from django.apps import apps
+
+        facture = self.creer_facture('F001')
+        vide = self.creer_facture('F002')
+        self.ajouter_ligne(facture)
+        self.ajouter_ligne(facture, '500.00', taux_ras_is='10')
+        Facture.objects.update(montant_ht=0, montant_tva=0, montant_ttc=0, montant_ras_tva=0, montant_ras_is=0,
+                               net_a_payer=0)
+
+        import_module('clients.migrations.0009_facture_totaux').calculer_totaux(apps, None)
+
+        self.assertEqual(self.totaux(facture), (Decimal('1500.00'), Decimal('1800.00'), Decimal('1525.00')))
+        self.assertEqual(self.totaux(vide), (Decimal('0.00'),) * 3)
+        self.assertEqual(get_ecarts_totaux_factures(), [])
+
+
+class EtatPaiementTests(ClientsTestMixin, TestCase):
+    """Tests du solde des paiements et de l'état des factures calculés en base, comparés au calcul Python"""
+
+    def setUp(self):
+        super().setUp()
+
+        def paiement(montant):
+            return Paiement.objects.create(client=self.client_test, montant_total=Decimal(montant),
+                                           date_encaissement=date(2026, 2, 1))
+
+        # Factures de 1050 net : paiement exact, paiement supérieur, paiement insuffisant, sans paiement
+        self.exact, self.excedent, self.insuffisant, self.sans_facture = (
+            paiement('1050.00'), paiement('2000.00'), paiement('1500.00'), paiement('100.00'),
+        )
+        self.factures = {
+            'soldee': self.creer_facture('F001', paiement=self.exact),
+            'excedent': self.creer_facture('F002', paiement=self.excedent),
+            'insuffisant_1': self.creer_facture('F003', paiement=self.insuffisant),
+            'insuffisant_2': self.creer_facture('F004', paiement=self.insuffisant),
+            'sans_paiement': self.creer_facture('F005'),
+        }
+        for facture in self.factures.values():
+            self.ajouter_ligne(facture)
+
+    def test_solde_annote_egal_au_calcul_python(self):
+        """Test que avec_solde() donne les mêmes soldes que les propriétés calculées sans annotation"""
+        annotes = {paiement.pk: paiement for paiement in Paiement.objects.avec_solde()}
+        for paiement in Paiement.objects.all():
+            annote = annotes[paiement.pk]
+            self.assertFalse(hasattr(paiement, 'montant_affecte'))
+            self.assertEqual(
+                (annote.montant_affecte, annote.solde_restant, annote.est_regle),
+                (paiement.montant_factures, paiement.solde, paiement.est_solde),
+            )
+
+        self.assertEqual(annotes[self.excedent.pk].solde_restant, Decimal('950.00'))
+        self.assertEqual(annotes[self.insuffisant.pk].solde_restant, Decimal('-600.00'))
+        self.assertEqual(annotes[self.sans_facture.pk].montant_affecte, Decimal('0.00'))
+
+        self.assertEqual(list(Paiement.objects.soldes()), [self.exact])
+        self.assertEqual(
+            set(Paiement.objects.non_soldes()),
+            {paiement for paiement in Paiement.objects.all() if not paiement.est_solde},
+        )
+
+    def test_factures_payees_egales_au_calcul_python(self):
+        """Test que payees()/non_payees() reprennent fact_payee (facture sans paiement comprise)"""
+        payees_python = {facture.pk for facture in Facture.objects.all() if facture.fact_payee}
+        self.assertEqual(payees_python, {self.factures['soldee'].pk})
+
+        self.assertEqual(set(Facture.objects.payees().values_list('pk', flat=True)), payees_python)
+        self.assertEqual(
+            set(Facture.objects.non_payees().values_list('pk', flat=True)),
+            set(Facture.objects.exclude(pk__in=payees_python).values_list('pk', flat=True)),
+        )
+        for facture in Facture.objects.avec_etat_paiement():
+            self.assertEqual(facture.fact_payee, facture.pk in payees_python)
+
+    def test_filtres_admin(self):
+        """Test le filtre "État de paiement" des factures et la colonne "Soldé" des paiements"""
+        from django.contrib.auth import get_user_model
+        from django.urls import reverse
+
+        self.client.force_login(get_user_model().objects.create_superuser(email='admin@test.com', password='x'))
+        url = reverse('admin:clients_facture_changelist')
+
+        response = self.client.get(url, {'etat_facture': 'payee'})
+        self.assertEqual([f.pk for f in response.context['cl'].result_list], [self.factures['soldee'].pk])
+        response = self.client.get(url, {'etat_facture': 'non_payee'})
+        self.assertEqual(response.context['cl'].result_count, 4)
+
+        response = self.client.get(reverse('admin:clients_paiement_changelist'), {'o': '5'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p.est_regle for p in response.context['cl'].result_list].count(True), 1)
+
+
+class SyntheseCreancesTests(ClientsTestMixin, TestCase):
+    """Tests des agrégats de la synthèse des créances et du tableau de bord clients"""
+
+    aujourdhui = date(2026, 6, 1)
+
+    def setUp(self):
+        super().setUp()
+        self.autre_client = Client.objects.create(id_cpt='C002', nom='Autre Client')
+        self.contrat_autre = self.creer_contrat('CT02', client=self.autre_client)
+
+    def facture(self, numero, date_emission, montant_ht='1000.00', contrat=None, paiement=None):
+        facture = self.creer_facture(numero, date_emission, contrat=contrat, paiement=paiement)
+        self.ajouter_ligne(facture, montant_ht)
+        return facture
+
+    def test_synthese_sans_facture(self):
+        """Test que les agrégats d'un ensemble vide valent 0 (et non None)"""
+        from clients.services import get_synthese_creances, get_weekly_dashboard_data
+
+        synthese = get_synthese_creances(self.aujourdhui)
+        self.assertEqual(synthese, {
+            'montant_total_du': Decimal('0.00'),
+            'montant_echu_retard': Decimal('0.00'),
+            'previsions_30j': Decimal('0.00'),
+            'factures_en_retard': [],
+        })
+        data = get_weekly_dashboard_data()
+        self.assertEqual((data['taux_retard'], data['paiements_anormaux']), (0, []))
+
+    def test_synthese_sur_factures_non_payees(self):
+        """Test les totaux (échu, à 30 jours) et le détail des retards, factures payées exclues"""
+        from clients.services import get_synthese_creances
+
+        echue = self.facture('F001', date(2026, 1, 15))  # échéance 30/04
+        self.facture('F002', date(2026, 3, 20), '2000.00', contrat=self.contrat_autre)  # échéance 30/06
+        self.facture('F003', date(2026, 5, 20), '4000.00')  # échéance 31/08
+        payee = self.facture('F004', date(2026, 1, 10), '8000.00', paiement=Paiement.objects.create(
+            client=self.client_test, montant_total=Decimal('8400.00'), date_encaissement=date(2026, 4, 1),
+        ))
+        self.assertTrue(payee.paiement.est_solde)
+
+        synthese = get_synthese_creances(self.aujourdhui)
+        self.assertEqual(synthese['montant_total_du'], Decimal('7350.00'))
+        self.assertEqual(synthese['montant_echu_retard'], Decimal('1050.00'))
+        self.assertEqual(synthese['previsions_30j'], Decimal('2100.00'))
+        self.assertEqual(synthese['factures_en_retard'], [{
+            'numero': 'F001', 'date_echeance': echue.date_echeance, 'net_a_payer': Decimal('1050.00'),
+            'client': 'Client Test', 'jours_retard': 32,
+        }])
+        self.assertEqual(get_synthese_creances(self.aujourdhui, nombre_retards=0)['factures_en_retard'], [])
+
+    def test_tableau_de_bord_par_client(self):
+        """Test les totaux du tableau de bord par client, y compris sans facture sur la période"""
+        from datetime import datetime, timezone as dt_timezone
+        from unittest import mock
+        from django.urls import reverse
+
+        maintenant = datetime(2026, 6, 1, 12, tzinfo=dt_timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=maintenant):
+            response = self.client.get(reverse('clients_dashboard'))
+        self.assertEqual(list(response.context['data_clients']), [])
+
+        self.facture('F001', date(2026, 1, 15))
+        self.facture('F002', date(2026, 2, 15), '500.00')
+        self.facture('F003', date(2026, 1, 20), '2000.00', contrat=self.contrat_autre)
+        self.facture('F004', date(2026, 5, 20), '4000.00')  # échéance après la période
+        with mock.patch('django.utils.timezone.now', return_value=maintenant):
+            response = self.client.get(reverse('clients_dashboard'))
+
+        self.assertEqual(
+            [(ligne['client'], ligne['total_ht'], ligne['total_tva'], ligne['total_ttc'], ligne['total_ras_tva'])
+             for ligne in response.context['data_clients']],
+            [
+                ('Autre Client', Decimal('2000.00'), Decimal('400.00'), Decimal('2400.00'), Decimal('300.00')),
+                ('Client Test', Decimal('1500.00'), Decimal('300.00'), Decimal('1800.00'), Decimal('225.00')),
+            ],
+        )
+        # Contrats sans compte bancaire : un seul groupe "fournisseur" vide
+        self.assertEqual([ligne['fournisseur'] for ligne in response.context['data_fournisseurs']], [None])
+
+
+class ChaineContratsTests(ClientsTestMixin, TestCase):
+    """Tests des chemins matérialisés (chemin, chemin_references, est_feuille) des chaînes d'avenants"""
+
+    def etat(self, contrat):
+        contrat = Contrat.objects.get(pk=contrat.pk)
+        return contrat.chemin, contrat.chemin_references, contrat.est_feuille, contrat.is_actif
+
+    def test_creation_avenants(self):
+        """Test les chemins d'une chaîne créée avenant par avenant"""
+        avenant = self.creer_contrat('AV1', parent=self.contrat)
+        avenant2 = self.creer_contrat('AV2', parent=avenant)
+
+        self.assertEqual(self.etat(self.contrat), ('', 'CT01', False, False))
+        self.assertEqual(self.etat(avenant), (f'/{self.contrat.pk}/', 'CT01-AV1', False, False))
+        self.assertEqual(
+            self.etat(avenant2), (f'/{self.contrat.pk}/{avenant.pk}/', 'CT01-AV1-AV2', True, True)
+        )
+
+    def test_rattachement_propage_aux_descendants(self):
+        """Test qu'un re-rattachement réécrit les descendants et recalcule les feuilles"""
+        avenant = self.creer_contrat('AV1', parent=self.contrat)
+        avenant2 = self.creer_contrat('AV2', parent=avenant)
+        autre = self.creer_contrat('CT02')
+
+        avenant = Contrat.objects.get(pk=avenant.pk)
+        avenant.parent = autre
+        avenant.save()
+
+        self.assertEqual(self.etat(self.contrat), ('', 'CT01', True, True))
+        self.assertEqual(self.etat(autre), ('', 'CT02', False, False))
+        self.assertEqual(self.etat(avenant), (f'/{autre.pk}/', 'CT02-AV1', False, False))
+        self.assertEqual(self.etat(avenant2), (f'/{autre.pk}/{avenant.pk}/', 'CT02-AV1-AV2', True, True))
+
+        # Renommage de la racine : seules les références descendantes changent
+        autre.reference = 'CT03'
+        autre.save()
+        self.assertEqual(self.etat(avenant2), (f'/{autre.pk}/{avenant.pk}/', 'CT03-AV1-AV2', True, True))
+
+    def test_cycle_refuse(self):
+        """Test qu'un contrat ne peut devenir l'avenant de lui-même ni d'un descendant"""
+        from django.core.exceptions import ValidationError
+
+        avenant = self.creer_contrat('AV1', parent=self.contrat)
+        avenant2 = self.creer_contrat('AV2', parent=avenant)
+        for parent in (self.contrat, avenant2):
+            contrat = Contrat.objects.get(pk=self.contrat.pk)
+            contrat.parent = parent
+            with self.assertRaises(ValidationError):
+                contrat.save()
+        self.assertIsNone(Contrat.objects.get(pk=self.contrat.pk).parent_id)
+
+    def test_suppression_avenant(self):
+        """Test que le parent redevient la feuille facturable après suppression de son avenant"""
+        avenant = self.creer_contrat('AV1', parent=self.contrat)
+        with self.assertRaises(ValueError):
+            self.creer_facture('F001', contrat=Contrat.objects.get(pk=self.contrat.pk))
+
+        avenant.delete()
+        self.assertEqual(self.etat(self.contrat), ('', 'CT01', True, True))
+        self.creer_facture('F001', contrat=Contrat.objects.get(pk=self.contrat.pk))
+
+    def test_choix_contrat_facture(self):
+        """Test que le formulaire de facture ne propose que les derniers avenants non soldés"""
+        from django.forms import modelform_factory
+
+        avenant = self.creer_contrat('AV1', parent=self.contrat)
+        solde = self.creer_contrat('CT02')
+        Contrat.objects.filter(pk=solde.pk).update(is_solde=True)
+
+        form = modelform_factory(Facture, fields=['contrat'])()
+        self.assertEqual(list(form.fields['contrat'].queryset), [avenant])
+
+    def test_migration_calcule_chemins(self):
+        """Test le calcul des chemins de la migration 0010 sur des contrats existants"""
+        from importlib import import_module
+        from django.apps import apps
+
+        avenant = self.creer_contrat('AV1', parent=self.contrat)
+        avenant2 = self.creer_contrat('AV2', parent=avenant)
+        autre = self.creer_contrat('CT02')
+        Contrat.objects.update(chemin='', chemin_references='', est_feuille=True)
+
+        import_module('clients.migrations.0010_contrat_chemin').calculer_chemins(apps, None)
+
+        self.assertEqual(
+            [self.etat(c)[:3] for c in (self.contrat, avenant, avenant2, autre)],
+            [
+                ('', 'CT01', False),
+                (f'/{self.contrat.pk}/', 'CT01-AV1', False),
+                (f'/{self.contrat.pk}/{avenant.pk}/', 'CT01-AV1-AV2', True),
+                ('', 'CT02', True),
+            ],
+        )
@@ -1,8 +1,8 @@
 from django.shortcuts import render
-from django.db.models import Sum, F, Q, Case, When, ExpressionWrapper, DecimalField
+from django.db.models import Sum, F, Q, Case, When
 from django.utils import timezone
 from datetime import timedelta
-from .models import Facture, LigneFacture, Client
+from .models import Facture, Client
 from fournisseurs.models import Beneficiaire
 
 
@@ -19,51 +19,28 @@ def dashboard_view(request):
         )
     ).filter(date_ref__gte=start_date, date_ref__lte=end_date)
 
-    # Préparer les expressions pour chaque champ calculé
-    montant_tva_expr = ExpressionWrapper(F('base_tva') * F('taux_tva') / 100, output_field=DecimalField(max_digits=12, decimal_places=2))
-    montant_ttc_expr = ExpressionWrapper(F('montant_ht') + F('base_tva') * F('taux_tva') / 100, output_field=DecimalField(max_digits=12, decimal_places=2))
-    montant_ras_tva_expr = ExpressionWrapper((F('base_tva') * F('taux_tva') / 100) * F('taux_ras_tva') / 100, output_field=DecimalField(max_digits=12, decimal_places=2))
-    montant_ras_is_expr = ExpressionWrapper(F('montant_ht') * F('taux_ras_is') / 100, output_field=DecimalField(max_digits=12, decimal_places=2))
+    # Les totaux sont stockés sur la facture : agrégation directe en SQL
+    totaux = dict(
+        total_ht=Sum('montant_ht'),
+        total_tva=Sum('montant_tva'),
+        total_ttc=Sum('montant_ttc'),
+        total_ras_tva=Sum('montant_ras_tva'),
+        total_ras_is=Sum('montant_ras_is'),
+    )
 
     # Par client
     data_clients = (
-        LigneFacture.objects
-        .filter(facture__in=factures)
-        .annotate(
-            montant_tva_calc=montant_tva_expr,
-            montant_ttc_calc=montant_ttc_expr,
-            montant_ras_tva_calc=montant_ras_tva_expr,
-            montant_ras_is_calc=montant_ras_is_expr,
-        )
-        .values(client=F('facture__contrat__client__nom'))
-        .annotate(
-            montant_ht=Sum('montant_ht'),
-            montant_tva=Sum('montant_tva_calc'),
-            montant_ttc=Sum('montant_ttc_calc'),
-            montant_ras_tva=Sum('montant_ras_tva_calc'),
-            montant_ras_is=Sum('montant_ras_is_calc'),
-        )
+        factures
+        .values(client=F('contrat__client__nom'))
+        .annotate(**totaux)
         .order_by('client')
     )
 
     # Par fournisseur
     data_fournisseurs = (
-        LigneFacture.objects
-        .filter(facture__in=factures)
-        .annotate(
-            montant_tva_calc=montant_tva_expr,
-            montant_ttc_calc=montant_ttc_expr,
-            montant_ras_tva_calc=montant_ras_tva_expr,
-            montant_ras_is_calc=montant_ras_is_expr,
-        )
-        .values(fournisseur=F('facture__contrat__compte_bancaire__beneficiaire__raison_sociale'))
-        .annotate(
-            montant_ht=Sum('montant_ht'),
-            montant_tva=Sum('montant_tva_calc'),
-            montant_ttc=Sum('montant_ttc_calc'),
-            montant_ras_tva=Sum('montant_ras_tva_calc'),
-            montant_ras_is=Sum('montant_ras_is_calc'),
-        )
+        factures
+        .values(fournisseur=F('contrat__compte_bancaire__beneficiaire__raison_sociale'))
+        .annotate(**totaux)
         .order_by('fournisseur')
     )
 
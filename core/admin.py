@@ -0,0 +1,146 @@
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
+
+from .exports import REGISTRE_EXPORTS
+from .models import DestinataireEnvoi, EmailSortant, EnvoiGroupe, ExportJob
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'libelle_export', 'format', 'statut', 'progression_export', 'created_at', 'expire_le', 'lien_telechargement')
+    list_filter = ('statut', 'cle_export')
+    readonly_fields = ('cle_export', 'format', 'statut', 'lignes_total', 'lignes_traitees', 'erreur',
+                       'date_debut', 'date_fin', 'expire_le', 'lien_telechargement', 'created_by')
+    exclude = ('parametres', 'fichier', 'updated_by')
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if request.user.is_superuser:
+            return queryset
+        return queryset.filter(created_by=request.user)
+
+    def has_add_permission(self, request):
+        # Les jobs sont créés par les actions d'export
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_view_permission(self, request, obj=None):
+        return request.user.is_staff
+
+    def has_delete_permission(self, request, obj=None):
+        return request.user.is_staff
+
+    @admin.display(description="Export")
+    def libelle_export(self, obj):
+        export = REGISTRE_EXPORTS.get(obj.cle_export)
+        return export.libelle if export else obj.cle_export
+
+    @admin.display(description="Progression")
+    def progression_export(self, obj):
+        return f"{obj.progression} % ({obj.lignes_traitees}/{obj.lignes_total})"
+
+    @admin.display(description="Fichier")
+    def lien_telechargement(self, obj):
+        if obj.statut != 'termine' or not obj.fichier:
+            return "-"
+        return format_html('<a href="{}">Télécharger</a>', reverse('admin:core_exportjob_telecharger', args=[obj.pk]))
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/telecharger/',
+                 self.admin_site.admin_view(self.telecharger_view),
+                 name='core_exportjob_telecharger'),
+        ] + super().get_urls()
+
+    def telecharger_view(self, request, pk):
+        job = get_object_or_404(ExportJob, pk=pk)
+        if not request.user.is_superuser and job.created_by_id != request.user.pk:
+            raise PermissionDenied
+        if job.statut != 'termine' or not job.fichier:
+            raise Http404("Fichier d'export indisponible")
+        return FileResponse(job.fichier.open('rb'), as_attachment=True, filename=job.nom_telechargement)
+
+
+class DestinataireEnvoiInline(admin.TabularInline):
+    model = DestinataireEnvoi
+    fields = ('email', 'statut', 'tentatives', 'erreur', 'date_envoi')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(EnvoiGroupe)
+class EnvoiGroupeAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'sujet', 'statut', 'nombre_envoyes', 'nombre_echecs', 'created_at', 'date_fin')
+    list_filter = ('statut',)
+    readonly_fields = ('libelle', 'sujet', 'expediteur', 'cc', 'cci', 'statut', 'nombre_envoyes', 'nombre_echecs',
+                       'erreur', 'date_debut', 'date_fin', 'created_by')
+    exclude = ('updated_by',)
+    inlines = [DestinataireEnvoiInline]
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if request.user.is_superuser:
+            return queryset
+        return queryset.filter(created_by=request.user)
+
+    def has_add_permission(self, request):
+        # Les envois sont créés par les actions d'admin
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_view_permission(self, request, obj=None):
+        return request.user.is_staff
+
+    def has_delete_permission(self, request, obj=None):
+        return request.user.is_staff
+
+
+@admin.register(EmailSortant)
+class EmailSortantAdmin(admin.ModelAdmin):
+    list_display = ('sujet', 'liste_destinataires', 'origine', 'statut', 'tentatives', 'created_at', 'date_envoi')
+    list_filter = ('statut', 'origine')
+    search_fields = ('sujet',)
+    readonly_fields = ('origine', 'sujet', 'expediteur', 'destinataires', 'cc', 'cci', 'statut', 'tentatives',
+                       'prochain_essai', 'erreur', 'created_at', 'date_envoi')
+    # Le corps peut contenir un mot de passe temporaire (accounts.signals)
+    exclude = ('corps', 'confidentiel')
+    actions = ['reprogrammer']
+
+    def has_add_permission(self, request):
+        # Les emails sont enregistrés par les signaux (core.mails.mettre_en_file)
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_module_permission(self, request):
+        return request.user.is_superuser
+
+    def has_view_permission(self, request, obj=None):
+        return request.user.is_superuser
+
+    def has_delete_permission(self, request, obj=None):
+        return request.user.is_superuser
+
+    @admin.display(description="Destinataires")
+    def liste_destinataires(self, obj):
+        return ', '.join(obj.destinataires)
+
+    @admin.action(description="Réessayer l'envoi des emails en échec")
+    def reprogrammer(self, request, queryset):
+        nombre = queryset.filter(statut='echec').update(statut='en_attente', tentatives=0,
+                                                         prochain_essai=timezone.now())
+        self.message_user(request, f"{nombre} email(s) remis dans la boîte d'envoi.")
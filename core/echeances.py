@@ -0,0 +1,85 @@
+# core/echeances.py
+"""
+Conditions de paiement (codes TYPE_MODE_PAIEMENT : "30J", "90JFDM"...) et calcul des échéances.
+
+- condition_paiement(code) : code analysé une seule fois puis mémorisé
+- calculer_echeance(date, code) : une date (enregistrement d'un modèle)
+- calculer_echeances(dates, codes) : un tableau de dates (exports, recalculs en masse)
+"""
+import re
+from calendar import monthrange
+from dataclasses import dataclass
+from datetime import timedelta
+from functools import lru_cache
+
+FORMAT_CODE = re.compile(r'^(\d+)J(FDM)?$')
+
+
+@dataclass(frozen=True)
+class ConditionPaiement:
+    """ Délai de N jours, éventuellement reporté au dernier jour du mois atteint (fin de mois). """
+    code: str
+    jours: int
+    fin_de_mois: bool = False
+
+    def echeance(self, date_depart):
+        if not date_depart:
+            return None
+        date_echeance = date_depart + timedelta(days=self.jours)
+        if self.fin_de_mois:
+            dernier_jour = monthrange(date_echeance.year, date_echeance.month)[1]
+            date_echeance = date_echeance.replace(day=dernier_jour)
+        return date_echeance
+
+
+@lru_cache(maxsize=None)
+def condition_paiement(code):
+    """
+    Analyse un code de délai de paiement.
+
+    Returns:
+        ConditionPaiement: None si le code est vide ou invalide
+    """
+    if not code:
+        return None
+    correspondance = FORMAT_CODE.match(code.strip().upper())
+    if not correspondance:
+        return None
+    return ConditionPaiement(code=code, jours=int(correspondance.group(1)), fin_de_mois=bool(correspondance.group(2)))
+
+
+def calculer_echeance(date_depart, code):
+    """ Date d'échéance d'une date de départ selon un code de délai (None si incalculable). """
+    condition = condition_paiement(code)
+    if condition is None:
+        return None
+    return condition.echeance(date_depart)
+
+
+def calculer_echeances(dates, codes):
+    """
+    Calcule les échéances de tout un tableau de dates en une opération vectorisée.
+
+    Args:
+        dates: Séquence ou Series de dates de départ (None / NaT acceptés)
+        codes: Code unique pour toutes les dates, ou séquence de codes alignée sur dates
+
+    Returns:
+        pandas.Series: Échéances en datetime64 (NaT si date ou code invalide), même index que dates
+    """
+    import pandas as pd
+
+    dates = pd.to_datetime(pd.Series(dates), errors='coerce')
+    if codes is None or isinstance(codes, str):
+        codes = pd.Series(codes, index=dates.index, dtype=object)
+    else:
+        codes = pd.Series(list(codes), index=dates.index, dtype=object)
+
+    # Une analyse par code distinct, pas par ligne
+    conditions = [condition for condition in map(condition_paiement, codes.dropna().unique()) if condition]
+    jours = codes.map({condition.code: condition.jours for condition in conditions}).astype('float64')
+    fin_de_mois = codes.isin([condition.code for condition in conditions if condition.fin_de_mois])
+
+    echeances = dates + pd.to_timedelta(jours, unit='D')
+    # MonthEnd(0) : dernier jour du mois, inchangé si la date l'est déjà
+    return echeances.mask(fin_de_mois, echeances + pd.offsets.MonthEnd(0))
@@ -0,0 +1,290 @@
+# core/exports.py
+"""
+Exports tabulaires (CSV/XLSX) écrits en flux et exécutés en arrière-plan.
+
+- enregistrer_export() : déclare un export (resource import-export ou générateur de lignes)
+- lancer_export() : crée un ExportJob depuis une action d'admin
+- traiter_exports_en_attente() / nettoyer_exports_expires() : appelés par la commande traiter_exports
+"""
+import csv
+import logging
+import secrets
+from dataclasses import dataclass
+from datetime import timedelta
+from tempfile import SpooledTemporaryFile
+from typing import Callable
+
+from django.core.files import File
+from django.http import HttpRequest, QueryDict
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+logger = logging.getLogger(__name__)
+
+# Lignes lues (et gardées en mémoire) à la fois
+TAILLE_LOT_EXPORT = 2000
+
+# Au-delà, le fichier en cours d'écriture passe de la mémoire au disque
+TAILLE_MAX_FICHIER_MEMOIRE = 10 * 1024 * 1024
+
+# Fréquence d'écriture de la progression d'un job (en lignes)
+PAS_PROGRESSION = 500
+
+# Durée de conservation des fichiers produits
+DUREE_CONSERVATION_EXPORTS = timedelta(days=2)
+
+# Un job resté "en cours" au-delà est considéré comme interrompu (worker arrêté)
+DUREE_MAX_EXPORT = timedelta(hours=6)
+
+
+def lignes_resource(resource, queryset, taille_lot=TAILLE_LOT_EXPORT):
+    """Lignes d'une resource import-export, sans construire de Dataset complet"""
+    queryset = resource.filter_export(queryset)
+    for instance in queryset.iterator(chunk_size=taille_lot):
+        yield resource.export_resource(instance)
+
+
+def _avec_entetes(entetes, lignes):
+    yield entetes
+    yield from lignes
+
+
+class _Echo:
+    """Pseudo-fichier : csv.writer renvoie directement la ligne formatée"""
+
+    def write(self, valeur):
+        return valeur
+
+
+def iterer_csv(entetes, lignes):
+    """Lignes CSV formatées une à une (dialecte excel, comme tablib)"""
+    writer = csv.writer(_Echo())
+    for ligne in _avec_entetes(entetes, lignes):
+        yield writer.writerow(ligne)
+
+
+def ajouter_feuille(classeur, titre, entetes, lignes):
+    """Ajoute une feuille à un classeur write-only : en-têtes en gras, lignes sérialisées au fur et à mesure"""
+    feuille = classeur.create_sheet(titre)
+    feuille.freeze_panes = 'A2'
+
+    gras = Font(bold=True)
+    cellules_entetes = []
+    for entete in entetes:
+        cellule = WriteOnlyCell(feuille, value=entete)
+        cellule.font = gras
+        cellules_entetes.append(cellule)
+    feuille.append(cellules_entetes)
+    for ligne in lignes:
+        feuille.append(ligne)
+    return feuille
+
+
+def ecrire_xlsx(fichier, entetes, lignes, titre='Export'):
+    """Écrit un classeur XLSX en mode write-only : les lignes sont sérialisées au fur et à mesure"""
+    classeur = Workbook(write_only=True)
+    ajouter_feuille(classeur, titre, entetes, lignes)
+    classeur.save(fichier)
+
+
+def ecrire_export(fichier, format_export, entetes, lignes):
+    """Écrit l'export dans un fichier binaire ouvert"""
+    if format_export == 'xlsx':
+        ecrire_xlsx(fichier, entetes, lignes)
+        return
+    for ligne in iterer_csv(entetes, lignes):
+        fichier.write(ligne.encode('utf-8'))
+
+
+# --- Registre des exports exécutables en arrière-plan ---
+
+@dataclass(frozen=True)
+class ExportEnregistre:
+    cle: str
+    libelle: str
+    model: type
+    construire: Callable  # queryset -> (entetes, lignes)
+    filtrer: Callable = None  # queryset -> queryset
+
+
+REGISTRE_EXPORTS = {}
+
+
+def enregistrer_export(cle, libelle, model, resource_class=None, construire=None, filtrer=None):
+    """
+    Déclare un export exécutable en arrière-plan.
+
+    Args:
+        cle: Identifiant stocké sur les ExportJob
+        libelle: Nom affiché (et préfixe du fichier produit)
+        model: Modèle exporté
+        resource_class: ModelResource import-export à utiliser
+        construire: À défaut de resource, fonction queryset -> (entetes, lignes)
+        filtrer: Restriction propre à l'export appliquée à la sélection (ex. factures du mois précédent)
+    """
+    if construire is None:
+        def construire(queryset):
+            resource = resource_class()
+            return resource.get_export_headers(), lignes_resource(resource, queryset)
+
+    REGISTRE_EXPORTS[cle] = ExportEnregistre(
+        cle=cle, libelle=libelle, model=model, construire=construire, filtrer=filtrer,
+    )
+
+
+def lancer_export(modeladmin, request, queryset, cle):
+    """
+    Action d'admin : enregistre un ExportJob pour la sélection et renvoie vers son suivi.
+
+    "Sélectionner tous les résultats" enregistre les critères de la liste (filtres, recherche)
+    et le worker reconstruit le queryset ; une sélection cochée, limitée à une page de la
+    liste, enregistre ses identifiants. Le format est lu dans le formulaire d'action (csv par défaut).
+    """
+    from core.models import ExportJob
+
+    export = REGISTRE_EXPORTS[cle]
+    if export.filtrer is not None:
+        queryset = export.filtrer(queryset)
+    export_format = request.POST.get('format', 'csv')
+    ordre = [champ for champ in (queryset.query.order_by or queryset.model._meta.ordering) if isinstance(champ, str)]
+    if request.POST.get('select_across') == '1':
+        parametres = {'site': modeladmin.admin_site.name, 'filtres': request.GET.urlencode(), 'ordre': ordre}
+        nombre = queryset.count()
+    else:
+        pks = list(queryset.values_list('pk', flat=True))
+        parametres = {'pks': pks, 'ordre': ordre}
+        nombre = len(pks)
+    job = ExportJob.objects.create(
+        cle_export=cle,
+        format='xlsx' if export_format == 'xlsx' else 'csv',
+        parametres=parametres,
+        lignes_total=nombre,
+    )
+    lien = reverse('admin:core_exportjob_change', args=[job.pk])
+    modeladmin.message_user(request, format_html(
+        "Export de {} ligne(s) programmé en arrière-plan. <a href=\"{}\">Suivre l'export</a>",
+        nombre, lien,
+    ))
+
+
+# --- Exécution (worker) ---
+
+def _lignes_avec_progression(job, lignes):
+    from core.models import ExportJob
+
+    nombre = 0
+    for ligne in lignes:
+        yield ligne
+        nombre += 1
+        if nombre % PAS_PROGRESSION == 0:
+            ExportJob.objects.filter(pk=job.pk).update(lignes_traitees=nombre)
+    job.lignes_traitees = nombre
+
+
+def queryset_liste_admin(model, parametres, utilisateur):
+    """
+    Reconstruit le queryset d'une liste d'admin (filtres, recherche) à partir de sa query string.
+
+    La liste est évaluée au nom du demandeur, comme lors de l'action.
+    """
+    from django.contrib.admin.sites import all_sites
+
+    if utilisateur is None:
+        raise ValueError("Demandeur de l'export inconnu : les filtres de la liste ne peuvent être appliqués")
+    site = next(site for site in all_sites if site.name == parametres['site'])
+    request = HttpRequest()
+    request.method = 'GET'
+    request.GET = QueryDict(parametres['filtres'])
+    request.user = utilisateur
+    modeladmin = site._registry[model]
+    queryset = modeladmin.get_changelist_instance(request).get_queryset(request)
+    # Relations d'affichage de la liste (list_select_related) : l'export déclare les siennes
+    return queryset.select_related(None)
+
+
+def executer_export_job(job):
+    """Produit le fichier d'un job déjà réservé (statut en_cours) et l'enregistre dans le stockage des exports"""
+    from core.models import ExportJob
+
+    try:
+        export = REGISTRE_EXPORTS[job.cle_export]
+        if 'filtres' in job.parametres:
+            queryset = queryset_liste_admin(export.model, job.parametres, job.created_by)
+            if export.filtrer is not None:
+                queryset = export.filtrer(queryset)
+        else:
+            queryset = export.model._default_manager.filter(pk__in=job.parametres.get('pks', []))
+        queryset = queryset.order_by(*(job.parametres.get('ordre') or ['-pk']))
+        entetes, lignes = export.construire(queryset)
+
+        with SpooledTemporaryFile(max_size=TAILLE_MAX_FICHIER_MEMOIRE) as fichier:
+            ecrire_export(fichier, job.format, entetes, _lignes_avec_progression(job, lignes))
+            fichier.seek(0)
+            # Jeton aléatoire : le nom du fichier ne se déduit pas du numéro du job
+            nom = f"{job.cle_export}_{job.pk}_{secrets.token_urlsafe(16)}.{job.format}"
+            job.fichier.save(nom, File(fichier), save=False)
+    except Exception as exc:
+        logger.exception("Échec de l'export %s", job.pk)
+        ExportJob.objects.filter(pk=job.pk).update(statut='echec', erreur=str(exc), date_fin=timezone.now())
+        return False
+
+    fin = timezone.now()
+    ExportJob.objects.filter(pk=job.pk).update(
+        statut='termine', fichier=job.fichier.name, lignes_traitees=job.lignes_traitees,
+        date_fin=fin, expire_le=fin + DUREE_CONSERVATION_EXPORTS,
+    )
+    return True
+
+
+def reserver_export_job():
+    """Réserve le plus ancien job en attente (UPDATE conditionnel : sûr entre plusieurs workers)"""
+    from core.models import ExportJob
+
+    for job in ExportJob.objects.filter(statut='en_attente').order_by('created_at')[:10]:
+        if ExportJob.objects.filter(pk=job.pk, statut='en_attente').update(statut='en_cours', date_debut=timezone.now()):
+            job.statut = 'en_cours'
+            return job
+    return None
+
+
+def traiter_exports_en_attente(limite=None):
+    """
+    Exécute les jobs en attente, un à un.
+
+    Returns:
+        int: Nombre de jobs traités
+    """
+    nombre = 0
+    while limite is None or nombre < limite:
+        job = reserver_export_job()
+        if job is None:
+            break
+        executer_export_job(job)
+        nombre += 1
+    return nombre
+
+
+def nettoyer_exports_expires():
+    """
+    Supprime les jobs expirés et leurs fichiers, et clôt les jobs interrompus.
+
+    Returns:
+        int: Nombre de jobs supprimés
+    """
+    from core.models import ExportJob
+
+    maintenant = timezone.now()
+    ExportJob.objects.filter(statut='en_cours', date_debut__lt=maintenant - DUREE_MAX_EXPORT).update(
+        statut='echec', erreur="Export interrompu", date_fin=maintenant,
+    )
+
+    expires = list(ExportJob.objects.filter(expire_le__lt=maintenant))
+    for job in expires:
+        if job.fichier:
+            job.fichier.delete(save=False)
+    ExportJob.objects.filter(pk__in=[job.pk for job in expires]).delete()
+    return len(expires)
@@ -0,0 +1,352 @@
+# core/mails.py
+"""
+Envoi d'emails en nombre.
+
+- envoyer_en_lots() : envoie des EmailMessage par lots, une connexion SMTP par lot, avec
+  une pause entre les lots (limite de débit du serveur) et de nouvelles tentatives sur les
+  erreurs temporaires (connexion perdue, réponse 4xx)
+- lancer_envoi_groupe() : depuis une action d'admin, enregistre un EnvoiGroupe et l'exécute
+  dans un thread ; le résultat de chaque destinataire est consultable dans l'admin. Un envoi
+  interrompu (redémarrage du serveur) est repris par la commande envoyer_emails
+- mettre_en_file() : boîte d'envoi des signaux (EmailSortant), vidée par la commande envoyer_emails
+  avec de nouveaux essais espacés (backoff) en cas d'erreur temporaire
+"""
+import logging
+import smtplib
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections, transaction
+from django.db.models import Count, Max, Q
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+
+logger = logging.getLogger(__name__)
+
+# Messages envoyés sur une même connexion SMTP
+TAILLE_LOT_EMAILS = 50
+
+# Pause entre deux lots (secondes)
+PAUSE_ENTRE_LOTS = 1.0
+
+# Tentatives par message sur une erreur temporaire, et délai avant la deuxième (doublé ensuite)
+TENTATIVES_EMAIL = 3
+DELAI_REESSAI_EMAIL = 2.0
+
+# Un envoi groupé "en cours" sans email envoyé depuis cette durée est repris (thread arrêté)
+DUREE_MAX_ENVOI_GROUPE = timedelta(minutes=30)
+
+# Boîte d'envoi : essais avant abandon, et délai avant le deuxième (doublé ensuite)
+TENTATIVES_EMAIL_SORTANT = 5
+DELAI_REESSAI_EMAIL_SORTANT = timedelta(minutes=1)
+
+# Un email resté "en cours" au-delà est remis en attente (worker arrêté pendant l'envoi)
+DUREE_MAX_ENVOI_EMAIL = timedelta(minutes=30)
+
+# Durée de conservation des emails envoyés
+DUREE_CONSERVATION_EMAILS = timedelta(days=30)
+
+
+@dataclass
+class ResultatEnvoi:
+    message: EmailMessage
+    envoye: bool = False
+    tentatives: int = 0
+    erreur: str = ''
+    transitoire: bool = False  # Échec sur une erreur temporaire : un nouvel essai peut réussir
+
+
+def erreur_transitoire(erreur):
+    """Vrai si l'envoi peut réussir en réessayant (coupure réseau, serveur indisponible, code 4xx)"""
+    if isinstance(erreur, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in erreur.recipients.values())
+    if isinstance(erreur, smtplib.SMTPResponseException):
+        return 400 <= erreur.smtp_code < 500
+    if isinstance(erreur, smtplib.SMTPException):
+        return isinstance(erreur, smtplib.SMTPServerDisconnected)
+    return isinstance(erreur, OSError)
+
+
+def _envoyer_message(connection, message, tentatives, delai_reessai, attendre):
+    resultat = ResultatEnvoi(message)
+    while True:
+        resultat.tentatives += 1
+        try:
+            # Sans effet si la connexion du lot est déjà ouverte
+            connection.open()
+            connection.send_messages([message])
+        except Exception as erreur:
+            resultat.erreur = str(erreur) or erreur.__class__.__name__
+            resultat.transitoire = erreur_transitoire(erreur)
+            if not resultat.transitoire or resultat.tentatives >= tentatives:
+                return resultat
+            # La connexion est sans doute perdue : elle est rouverte à la tentative suivante
+            connection.close()
+            attendre(delai_reessai * 2 ** (resultat.tentatives - 1))
+        else:
+            resultat.envoye, resultat.erreur, resultat.transitoire = True, '', False
+            return resultat
+
+
+def envoyer_en_lots(messages, taille_lot=TAILLE_LOT_EMAILS, pause=PAUSE_ENTRE_LOTS, tentatives=TENTATIVES_EMAIL,
+                    delai_reessai=DELAI_REESSAI_EMAIL, connection=None, attendre=time.sleep):
+    """
+    Envoie des emails par lots en réutilisant la connexion SMTP.
+
+    Args:
+        messages: EmailMessage à envoyer
+        taille_lot: Messages par connexion (beaucoup de serveurs limitent les envois par session)
+        pause: Secondes d'attente entre deux lots
+        tentatives: Nombre maximal d'essais par message
+        delai_reessai: Secondes avant le deuxième essai (doublé à chaque nouvel essai)
+        connection: Connexion à utiliser (get_connection() par défaut)
+
+    Yields:
+        ResultatEnvoi: Résultat de chaque message, dans l'ordre, dès qu'il est connu
+    """
+    connection = connection or get_connection()
+    messages = list(messages)
+    for debut in range(0, len(messages), taille_lot):
+        if debut:
+            attendre(pause)
+        try:
+            for message in messages[debut:debut + taille_lot]:
+                yield _envoyer_message(connection, message, tentatives, delai_reessai, attendre)
+        finally:
+            connection.close()
+
+
+# --- Envois groupés depuis l'admin ---
+
+def lancer_envoi_groupe(modeladmin, request, libelle, sujet, destinataires, expediteur='', cc=(), cci=()):
+    """
+    Action d'admin : enregistre un EnvoiGroupe, le démarre en arrière-plan et renvoie vers son suivi.
+
+    Args:
+        destinataires: Couples (email, corps du message)
+    """
+    from core.models import DestinataireEnvoi, EnvoiGroupe
+
+    destinataires = list(destinataires)
+    with transaction.atomic():
+        envoi = EnvoiGroupe.objects.create(libelle=libelle, sujet=sujet, expediteur=expediteur,
+                                           cc=list(cc), cci=list(cci))
+        DestinataireEnvoi.objects.bulk_create(
+            DestinataireEnvoi(envoi=envoi, email=email, corps=corps) for email, corps in destinataires
+        )
+        # Le thread ne doit lire les destinataires qu'une fois ceux-ci validés en base
+        transaction.on_commit(lambda: demarrer_envoi_groupe(envoi.pk))
+
+    lien = reverse('admin:core_envoigroupe_change', args=[envoi.pk])
+    modeladmin.message_user(request, format_html(
+        "Envoi de {} email(s) lancé en arrière-plan. <a href=\"{}\">Suivre l'envoi</a>",
+        len(destinataires), lien,
+    ))
+    return envoi
+
+
+def demarrer_envoi_groupe(envoi_pk):
+    thread = threading.Thread(target=_executer_dans_thread, args=(envoi_pk,), name=f'envoi-groupe-{envoi_pk}',
+                              daemon=True)
+    thread.start()
+    return thread
+
+
+def _executer_dans_thread(envoi_pk):
+    try:
+        executer_envoi_groupe(envoi_pk)
+    finally:
+        connections.close_all()
+
+
+def executer_envoi_groupe(envoi_pk, **options):
+    """
+    Envoie les messages en attente d'un EnvoiGroupe et consigne le résultat de chaque destinataire.
+
+    Args:
+        options: Paramètres de envoyer_en_lots (taille_lot, pause, tentatives...)
+
+    Returns:
+        bool: False si l'envoi était déjà pris en charge ou a échoué
+    """
+    from core.models import DestinataireEnvoi, EnvoiGroupe
+
+    # UPDATE conditionnel : un seul exécutant par envoi
+    if not EnvoiGroupe.objects.filter(pk=envoi_pk, statut='en_attente').update(statut='en_cours',
+                                                                                date_debut=timezone.now()):
+        return False
+    envoi = EnvoiGroupe.objects.get(pk=envoi_pk)
+
+    try:
+        destinataires = list(envoi.destinataires.filter(statut='en_attente'))
+        messages = [
+            EmailMessage(envoi.sujet, destinataire.corps, envoi.expediteur or None, to=[destinataire.email],
+                         cc=envoi.cc, bcc=envoi.cci)
+            for destinataire in destinataires
+        ]
+        for destinataire, resultat in zip(destinataires, envoyer_en_lots(messages, **options)):
+            DestinataireEnvoi.objects.filter(pk=destinataire.pk).update(
+                statut='envoye' if resultat.envoye else 'echec',
+                tentatives=resultat.tentatives,
+                erreur=resultat.erreur,
+                date_envoi=timezone.now() if resultat.envoye else None,
+            )
+    except Exception as exc:
+        logger.exception("Échec de l'envoi groupé %s", envoi_pk)
+        EnvoiGroupe.objects.filter(pk=envoi_pk).update(statut='echec', erreur=str(exc), date_fin=timezone.now())
+        return False
+
+    nombres = envoi.destinataires.aggregate(
+        nombre_envoyes=Count('pk', filter=Q(statut='envoye')),
+        nombre_echecs=Count('pk', filter=Q(statut='echec')),
+    )
+    EnvoiGroupe.objects.filter(pk=envoi_pk).update(statut='termine', date_fin=timezone.now(), **nombres)
+    logger.info("Envoi groupé %s : %s envoyé(s), %s échec(s)", envoi_pk, nombres['nombre_envoyes'],
+                nombres['nombre_echecs'])
+    return True
+
+
+def reprendre_envois_groupes(**options):
+    """
+    Reprend les envois groupés dont le thread s'est arrêté avant la fin (redémarrage du serveur).
+
+    Un envoi "en cours" sans activité depuis DUREE_MAX_ENVOI_GROUPE est remis en attente, puis
+    les envois en attente sont exécutés : seuls leurs destinataires encore en attente sont servis.
+
+    Returns:
+        int: Nombre d'envois exécutés
+    """
+    from core.models import EnvoiGroupe
+
+    interrompus = EnvoiGroupe.objects.filter(statut='en_cours').annotate(
+        derniere_activite=Coalesce(Max('destinataires__date_envoi'), 'date_debut'),
+    ).filter(derniere_activite__lt=timezone.now() - DUREE_MAX_ENVOI_GROUPE)
+    EnvoiGroupe.objects.filter(pk__in=interrompus.values('pk'), statut='en_cours').update(statut='en_attente')
+
+    nombre = 0
+    for envoi_pk in EnvoiGroupe.objects.filter(statut='en_attente').order_by('created_at').values_list('pk', flat=True):
+        if executer_envoi_groupe(envoi_pk, **options):
+            nombre += 1
+    return nombre
+
+
+# --- Boîte d'envoi des signaux ---
+
+def _adresses(adresses):
+    return [adresse.strip() for adresse in adresses if adresse and adresse.strip()]
+
+
+def mettre_en_file(email, origine='', confidentiel=False):
+    """
+    Enregistre un EmailMessage dans la boîte d'envoi au lieu de l'envoyer.
+
+    Appelé depuis un signal post_save, l'email est écrit dans la transaction de l'enregistrement
+    (admin, vues en transaction.atomic) : il n'est envoyé que si celle-ci est validée.
+
+    Args:
+        email: EmailMessage sans pièce jointe
+        origine: Signal ou traitement à l'origine de l'email (suivi dans l'admin)
+        confidentiel: Efface le corps du message une fois envoyé
+    """
+    from core.models import EmailSortant
+
+    return EmailSortant.objects.create(
+        origine=origine,
+        sujet=email.subject,
+        corps=email.body,
+        expediteur=email.from_email or '',
+        destinataires=_adresses(email.to),
+        cc=_adresses(email.cc),
+        cci=_adresses(email.bcc),
+        confidentiel=confidentiel,
+    )
+
+
+def reserver_emails(taille_lot=TAILLE_LOT_EMAILS):
+    """Réserve les emails dont l'essai est dû (UPDATE conditionnel : sûr entre plusieurs workers)"""
+    from core.models import EmailSortant
+
+    maintenant = timezone.now()
+    candidats = EmailSortant.objects.filter(statut='en_attente', prochain_essai__lte=maintenant)
+    reserves = []
+    for email in candidats.order_by('prochain_essai', 'pk')[:taille_lot]:
+        # prochain_essai note le début de l'envoi (voir nettoyer_boite_envoi)
+        if EmailSortant.objects.filter(pk=email.pk, statut='en_attente').update(statut='en_cours',
+                                                                                 prochain_essai=maintenant):
+            reserves.append(email)
+    return reserves
+
+
+def _envoyer_emails_sortants(emails, **options):
+    """Envoie des emails réservés sur une connexion et reprogramme ceux en erreur temporaire"""
+    from core.models import EmailSortant
+
+    messages = [
+        EmailMessage(email.sujet, email.corps, email.expediteur or None, to=email.destinataires, cc=email.cc,
+                     bcc=email.cci)
+        for email in emails
+    ]
+    # Un seul essai ici : les suivants sont espacés par prochain_essai
+    resultats = envoyer_en_lots(messages, taille_lot=len(messages), tentatives=1, **options)
+    for email, resultat in zip(emails, resultats):
+        tentatives = email.tentatives + 1
+        maintenant = timezone.now()
+        if resultat.envoye:
+            champs = {'statut': 'envoye', 'date_envoi': maintenant, 'erreur': ''}
+            if email.confidentiel:
+                champs['corps'] = ''
+        elif resultat.transitoire and tentatives < TENTATIVES_EMAIL_SORTANT:
+            champs = {'statut': 'en_attente', 'erreur': resultat.erreur,
+                      'prochain_essai': maintenant + DELAI_REESSAI_EMAIL_SORTANT * 2 ** (tentatives - 1)}
+        else:
+            champs = {'statut': 'echec', 'erreur': resultat.erreur}
+            logger.error("Email %s abandonné après %s essai(s) : %s", email.pk, tentatives, resultat.erreur)
+        EmailSortant.objects.filter(pk=email.pk).update(tentatives=tentatives, **champs)
+        yield champs['statut']
+
+
+def vider_boite_envoi(taille_lot=TAILLE_LOT_EMAILS, pause=PAUSE_ENTRE_LOTS, attendre=time.sleep, **options):
+    """
+    Envoie les emails dont l'essai est dû, par lots d'une connexion SMTP.
+
+    Returns:
+        dict: Nombre d'emails par statut obtenu (envoye, en_attente : reprogrammé, echec)
+    """
+    nombres = {'envoye': 0, 'en_attente': 0, 'echec': 0}
+    premier_lot = True
+    while True:
+        emails = reserver_emails(taille_lot)
+        if not emails:
+            break
+        if not premier_lot:
+            attendre(pause)
+        premier_lot = False
+        for statut in _envoyer_emails_sortants(emails, attendre=attendre, **options):
+            nombres[statut] += 1
+        if len(emails) < taille_lot:
+            break
+    return nombres
+
+
+def nettoyer_boite_envoi():
+    """
+    Remet en attente les envois interrompus et supprime les emails envoyés anciens.
+
+    Returns:
+        int: Nombre d'emails supprimés
+    """
+    from core.models import EmailSortant
+
+    maintenant = timezone.now()
+    EmailSortant.objects.filter(statut='en_cours', prochain_essai__lt=maintenant - DUREE_MAX_ENVOI_EMAIL).update(
+        statut='en_attente', prochain_essai=maintenant,
+    )
+    supprimes, _ = EmailSortant.objects.filter(
+        statut='envoye', date_envoi__lt=maintenant - DUREE_CONSERVATION_EMAILS,
+    ).delete()
+    return supprimes
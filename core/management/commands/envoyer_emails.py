@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Commande Django: Worker de la boîte d'envoi (EmailSortant).
+
+Les signaux enregistrent leurs emails sans les envoyer ; cette commande les envoie par lots.
+Elle reprend aussi les envois groupés de l'admin (EnvoiGroupe) interrompus par un redémarrage.
+À lancer en tâche permanente (boucle) ou planifiée (--une-fois).
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.mails import TAILLE_LOT_EMAILS, nettoyer_boite_envoi, reprendre_envois_groupes, vider_boite_envoi
+
+
+class Command(BaseCommand):
+    help = ("Envoie les emails en attente de la boîte d'envoi, reprend les envois groupés interrompus "
+            "et supprime les emails envoyés anciens")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--une-fois',
+            action='store_true',
+            help="Envoie les emails en attente puis s'arrête (tâche planifiée)",
+        )
+        parser.add_argument(
+            '--intervalle',
+            type=int,
+            default=5,
+            help="Secondes d'attente entre deux scrutations en mode boucle (défaut : 5)",
+        )
+        parser.add_argument(
+            '--lot',
+            type=int,
+            default=TAILLE_LOT_EMAILS,
+            help=f"Emails envoyés par connexion SMTP (défaut : {TAILLE_LOT_EMAILS})",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            supprimes = nettoyer_boite_envoi()
+            nombres = vider_boite_envoi(taille_lot=options['lot'])
+            if any(nombres.values()) or supprimes:
+                self.stdout.write(
+                    f"{nombres['envoye']} email(s) envoyé(s), {nombres['en_attente']} reprogrammé(s), "
+                    f"{nombres['echec']} en échec, {supprimes} ancien(s) email(s) supprimé(s)."
+                )
+            envois_groupes = reprendre_envois_groupes(taille_lot=options['lot'])
+            if envois_groupes:
+                self.stdout.write(f"{envois_groupes} envoi(s) groupé(s) repris.")
+
+            if options['une_fois']:
+                break
+            # Connexions coupées par le serveur pendant l'attente (MySQL wait_timeout)
+            close_old_connections()
+            time.sleep(options['intervalle'])
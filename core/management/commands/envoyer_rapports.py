@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Commande Django: Génère et envoie les rapports PDF en une seule exécution.
+
+Remplace l'appel séparé de rapport_hebdo, rapport_factures_impayees,
+rapport_factures_depassement et rapport_bc_non_soldes par le cron.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.rapports import POLITIQUES_CACHE
+from utils.emails import PROCESSUS_PDF, RAPPORTS, THREADS_COLLECTE, executer_rapports
+
+
+class Command(BaseCommand):
+    help = "Génère les rapports PDF (collecte et rendu en parallèle) et les envoie sur une seule connexion SMTP"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            action='append',
+            choices=list(RAPPORTS),
+            help='Rapport à traiter (peut être spécifié plusieurs fois ; tous par défaut)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Génère les PDF sans envoyer d'email",
+        )
+        parser.add_argument(
+            '--politique',
+            choices=POLITIQUES_CACHE,
+            help="Si les données n'ont pas changé depuis le dernier rendu : toujours régénérer, "
+                 "réutiliser le PDF précédent, ou ignorer l'envoi (politique de chaque rapport par défaut)",
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=THREADS_COLLECTE,
+            help=f'Threads de collecte des données (défaut : {THREADS_COLLECTE})',
+        )
+        parser.add_argument(
+            '--processus',
+            type=int,
+            default=PROCESSUS_PDF,
+            help=f'Processus de rendu PDF (défaut : {PROCESSUS_PDF})',
+        )
+
+    def handle(self, *args, **options):
+        resultats, envoyes, durees = executer_rapports(
+            options['only'],
+            envoyer=not options['dry_run'],
+            threads=options['threads'],
+            processus=options['processus'],
+            politique=options['politique'],
+        )
+
+        for resultat in resultats:
+            cle = resultat.rapport.cle
+            if resultat.erreur:
+                self.stdout.write(self.style.ERROR(f"{cle} : {resultat.erreur}"))
+                continue
+            if resultat.ignore:
+                self.stdout.write(self.style.WARNING(f"{cle} : données inchangées depuis le dernier envoi, non renvoyé"))
+                continue
+            detail = ', '.join(f'{etape} {duree:.2f}s' for etape, duree in resultat.durees.items())
+            etat = 'envoyé' if resultat.envoye else 'généré'
+            if resultat.reutilise:
+                etat += ', PDF précédent réutilisé'
+            elif resultat.document is not None:
+                etat += f', ReportLab ({resultat.document.nombre_lignes} lignes)'
+            self.stdout.write(self.style.SUCCESS(
+                f"{cle} : {etat} ({resultat.nom_fichier}, {len(resultat.pdf)} octets ; {detail})"
+            ))
+
+        self.stdout.write('Étapes : ' + ', '.join(f'{etape} {duree:.2f}s' for etape, duree in durees.items()))
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING("Essai (--dry-run) : aucun email envoyé."))
+            return
+
+        backend = getattr(settings, 'EMAIL_BACKEND', '')
+        if envoyes and backend == 'django.core.mail.backends.console.EmailBackend':
+            self.stdout.write(
+                self.style.WARNING(
+                    "Emails generes avec piece jointe, mais backend console actif: sortie terminal uniquement."
+                )
+            )
+            return
+
+        self.stdout.write(self.style.SUCCESS(f"{envoyes} email(s) envoyé(s)."))
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Commande Django: Worker des exports en arrière-plan (ExportJob).
+
+À lancer en tâche permanente (boucle) ou planifiée (--une-fois).
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.exports import nettoyer_exports_expires, traiter_exports_en_attente
+
+
+class Command(BaseCommand):
+    help = "Exécute les exports en attente et supprime les exports expirés"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--une-fois',
+            action='store_true',
+            help="Traite les exports en attente puis s'arrête (tâche planifiée)",
+        )
+        parser.add_argument(
+            '--intervalle',
+            type=int,
+            default=5,
+            help="Secondes d'attente entre deux scrutations en mode boucle (défaut : 5)",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            supprimes = nettoyer_exports_expires()
+            traites = traiter_exports_en_attente()
+            if traites or supprimes:
+                self.stdout.write(f"{traites} export(s) traité(s), {supprimes} export(s) expiré(s) supprimé(s).")
+
+            if options['une_fois']:
+                break
+            # Connexions coupées par le serveur pendant l'attente (MySQL wait_timeout)
+            close_old_connections()
+            time.sleep(options['intervalle'])
@@ -9,7 +9,11 @@ class CurrentUserMiddleware:
 
     def __call__(self, request):
         CurrentUserMiddleware._user.value = request.user if request.user.is_authenticated else None
-        response = self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            # Le thread est réutilisé : ne pas attribuer à cet utilisateur les écritures hors requête
+            CurrentUserMiddleware._user.value = None
         return response
 
     @staticmethod
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('cle_export', models.CharField(max_length=50, verbose_name='Export')),
+                ('format', models.CharField(choices=[('csv', 'CSV'), ('xlsx', 'XLSX')], default='csv', max_length=4)),
+                ('parametres', models.JSONField(blank=True, default=dict, help_text='Identifiants et tri des lignes à exporter')),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('en_cours', 'En cours'), ('termine', 'Terminé'), ('echec', 'Échec')], db_index=True, default='en_attente', max_length=20)),
+                ('lignes_total', models.PositiveIntegerField(default=0, verbose_name='Lignes à exporter')),
+                ('lignes_traitees', models.PositiveIntegerField(default=0, verbose_name='Lignes exportées')),
+                ('fichier', models.FileField(blank=True, null=True, upload_to='exports/')),
+                ('erreur', models.TextField(blank=True)),
+                ('date_debut', models.DateTimeField(blank=True, null=True, verbose_name='Début')),
+                ('date_fin', models.DateTimeField(blank=True, null=True, verbose_name='Fin')),
+                ('expire_le', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Expire le')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(app_label)s_%(class)s_created_by', to=settings.AUTH_USER_MODEL, verbose_name='Créé par')),
+                ('updated_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(app_label)s_%(class)s_updated_by', to=settings.AUTH_USER_MODEL, verbose_name='Mis à jour par')),
+            ],
+            options={
+                'verbose_name': 'Export en arrière-plan',
+                'verbose_name_plural': 'Exports en arrière-plan',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArtefactRapport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cle', models.CharField(max_length=50, unique=True, verbose_name='Rapport')),
+                ('empreinte', models.CharField(max_length=64, verbose_name='Empreinte des données')),
+                ('html', models.TextField(blank=True)),
+                ('pdf', models.BinaryField(blank=True, null=True)),
+                ('date_rendu', models.DateTimeField(verbose_name='Rendu le')),
+                ('date_envoi', models.DateTimeField(blank=True, null=True, verbose_name='Envoyé le')),
+            ],
+            options={
+                'verbose_name': 'Dernier rendu de rapport',
+                'verbose_name_plural': 'Derniers rendus de rapports',
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0002_artefactrapport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnvoiGroupe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('libelle', models.CharField(max_length=100, verbose_name='Envoi')),
+                ('sujet', models.CharField(max_length=255)),
+                ('expediteur', models.CharField(blank=True, help_text='Adresse par défaut du serveur si vide', max_length=254)),
+                ('cc', models.JSONField(blank=True, default=list, verbose_name='Copie')),
+                ('cci', models.JSONField(blank=True, default=list, verbose_name='Copie cachée')),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('en_cours', 'En cours'), ('termine', 'Terminé'), ('echec', 'Échec')], db_index=True, default='en_attente', max_length=20)),
+                ('nombre_envoyes', models.PositiveIntegerField(default=0, verbose_name='Envoyés')),
+                ('nombre_echecs', models.PositiveIntegerField(default=0, verbose_name='Échecs')),
+                ('erreur', models.TextField(blank=True)),
+                ('date_debut', models.DateTimeField(blank=True, null=True, verbose_name='Début')),
+                ('date_fin', models.DateTimeField(blank=True, null=True, verbose_name='Fin')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(app_label)s_%(class)s_created_by', to=settings.AUTH_USER_MODEL, verbose_name='Créé par')),
+                ('updated_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(app_label)s_%(class)s_updated_by', to=settings.AUTH_USER_MODEL, verbose_name='Mis à jour par')),
+            ],
+            options={
+                'verbose_name': "Envoi d'emails groupé",
+                'verbose_name_plural': "Envois d'emails groupés",
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DestinataireEnvoi',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254)),
+                ('corps', models.TextField()),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('envoye', 'Envoyé'), ('echec', 'Échec')], db_index=True, default='en_attente', max_length=20)),
+                ('tentatives', models.PositiveSmallIntegerField(default=0)),
+                ('erreur', models.TextField(blank=True)),
+                ('date_envoi', models.DateTimeField(blank=True, null=True, verbose_name='Envoyé le')),
+                ('envoi', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='destinataires', to='core.envoigroupe')),
+            ],
+            options={
+                'verbose_name': 'Destinataire',
+                'verbose_name_plural': 'Destinataires',
+                'ordering': ['pk'],
+            },
+        ),
+    ]
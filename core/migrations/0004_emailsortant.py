@@ -0,0 +1,40 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:26
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_envoigroupe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailSortant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origine', models.CharField(blank=True, help_text="Signal ou traitement à l'origine de l'email", max_length=100)),
+                ('sujet', models.CharField(max_length=255)),
+                ('corps', models.TextField(blank=True)),
+                ('expediteur', models.CharField(blank=True, help_text='Adresse par défaut du serveur si vide', max_length=254)),
+                ('destinataires', models.JSONField(default=list)),
+                ('cc', models.JSONField(blank=True, default=list, verbose_name='Copie')),
+                ('cci', models.JSONField(blank=True, default=list, verbose_name='Copie cachée')),
+                ('confidentiel', models.BooleanField(default=False, help_text="Corps effacé après l'envoi (mot de passe...)")),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('en_cours', 'En cours'), ('envoye', 'Envoyé'), ('echec', 'Échec')], default='en_attente', max_length=20)),
+                ('tentatives', models.PositiveSmallIntegerField(default=0)),
+                ('prochain_essai', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Prochain essai')),
+                ('erreur', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('date_envoi', models.DateTimeField(blank=True, null=True, verbose_name='Envoyé le')),
+            ],
+            options={
+                'verbose_name': 'Email sortant',
+                'verbose_name_plural': 'Emails sortants',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['statut', 'prochain_essai'], name='core_emails_statut_b0a590_idx')],
+            },
+        ),
+    ]
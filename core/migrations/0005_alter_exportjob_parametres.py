@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_emailsortant'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exportjob',
+            name='parametres',
+            field=models.JSONField(blank=True, default=dict, help_text="Filtres de la liste d'admin (ou identifiants sélectionnés) et tri des lignes à exporter"),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:58
+
+import core.models
+from django.db import migrations, models
+
+
+def supprimer_fichiers_publics(apps, schema_editor):
+    """Les fichiers déjà produits sont sous MEDIA_ROOT (servi publiquement) : supprimés avec leur job"""
+    from django.core.files.storage import default_storage
+
+    ExportJob = apps.get_model('core', 'ExportJob')
+    jobs = ExportJob.objects.exclude(fichier='').exclude(fichier__isnull=True)
+    for nom in jobs.values_list('fichier', flat=True):
+        default_storage.delete(nom)
+    jobs.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_alter_exportjob_parametres'),
+    ]
+
+    operations = [
+        migrations.RunPython(supprimer_fichiers_publics, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='exportjob',
+            name='fichier',
+            field=models.FileField(blank=True, null=True, storage=core.models.StockageExports(), upload_to='exports/'),
+        ),
+    ]
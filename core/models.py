@@ -1,10 +1,49 @@
 from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from django.db import models
+from django.utils import timezone
+from django.utils.functional import cached_property
 
 from core.middleware import CurrentUserMiddleware
 
 
-class AuditModel(models.Model):
+class TrackedFieldsMixin(models.Model):
+    """
+    Charge l'état en base d'une instance une seule fois par enregistrement.
+
+    Les validations (clean, save) et les signaux pre_save/post_save lisent
+    `etat_precedent` au lieu de refaire chacun un `objects.get(pk=...)`.
+    L'état est oublié à la fin de save() : l'enregistrement suivant le recharge.
+
+    Un receiver post_save ne doit donc pas rappeler save() sur la même instance
+    (l'état chargé serait périmé) : utiliser `Model.objects.filter(pk=...).update()`.
+    """
+
+    class Meta:
+        abstract = True
+
+    @property
+    def etat_precedent(self):
+        """Instance telle qu'enregistrée en base avant la sauvegarde en cours (None si nouvelle)."""
+        if not self.pk:
+            return None
+        if '_etat_precedent' not in self.__dict__:
+            self._etat_precedent = type(self)._default_manager.filter(pk=self.pk).first()
+        return self._etat_precedent
+
+    def champ_modifie(self, field_name):
+        """Indique si le champ a changé par rapport à l'état en base."""
+        ancienne_instance = self.etat_precedent
+        return ancienne_instance is not None and getattr(ancienne_instance, field_name) != getattr(self, field_name)
+
+    def save(self, *args, **kwargs):
+        try:
+            super().save(*args, **kwargs)
+        finally:
+            self.__dict__.pop('_etat_precedent', None)
+
+
+class AuditModel(TrackedFieldsMixin, models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(
@@ -33,3 +72,191 @@ class AuditModel(models.Model):
             self.created_by = user
         self.updated_by = user
         super().save(*args, **kwargs)
+
+
+class StockageExports(FileSystemStorage):
+    """
+    Fichiers des exports, sous settings.EXPORTS_ROOT : hors de MEDIA_ROOT, servi publiquement,
+    ils ne sont lus que par la vue de téléchargement de l'admin (contrôle du demandeur).
+    """
+
+    @cached_property
+    def base_location(self):
+        return self._value_or_setting(self._location, settings.EXPORTS_ROOT)
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == 'EXPORTS_ROOT':
+            self.__dict__.pop('base_location', None)
+            self.__dict__.pop('location', None)
+
+
+class ExportJob(AuditModel):
+    """
+    Export tabulaire exécuté en arrière-plan par la commande traiter_exports.
+
+    created_by est le demandeur : lui seul (ou un superutilisateur) peut télécharger le fichier.
+    """
+    STATUT_CHOICES = [
+        ('en_attente', 'En attente'),
+        ('en_cours', 'En cours'),
+        ('termine', 'Terminé'),
+        ('echec', 'Échec'),
+    ]
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('xlsx', 'XLSX'),
+    ]
+
+    cle_export = models.CharField(max_length=50, verbose_name="Export")
+    format = models.CharField(max_length=4, choices=FORMAT_CHOICES, default='csv')
+    parametres = models.JSONField(default=dict, blank=True, help_text="Filtres de la liste d'admin (ou identifiants sélectionnés) et tri des lignes à exporter")
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='en_attente', db_index=True)
+    lignes_total = models.PositiveIntegerField(default=0, verbose_name="Lignes à exporter")
+    lignes_traitees = models.PositiveIntegerField(default=0, verbose_name="Lignes exportées")
+    fichier = models.FileField(upload_to='exports/', storage=StockageExports(), blank=True, null=True)
+    erreur = models.TextField(blank=True)
+    date_debut = models.DateTimeField(null=True, blank=True, verbose_name="Début")
+    date_fin = models.DateTimeField(null=True, blank=True, verbose_name="Fin")
+    expire_le = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name="Expire le")
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Export en arrière-plan"
+        verbose_name_plural = "Exports en arrière-plan"
+
+    def __str__(self):
+        return f"Export {self.cle_export} #{self.pk} ({self.get_statut_display()})"
+
+    @property
+    def nom_telechargement(self):
+        """Nom proposé au téléchargement (le fichier stocké porte en plus un jeton aléatoire)"""
+        return f"{self.cle_export}_{self.pk}_{(self.date_fin or self.created_at):%Y_%m_%d}.{self.format}"
+
+    @property
+    def progression(self):
+        """Pourcentage de lignes exportées"""
+        if not self.lignes_total:
+            return 100 if self.statut == 'termine' else 0
+        return min(100, self.lignes_traitees * 100 // self.lignes_total)
+
+
+class ArtefactRapport(models.Model):
+    """
+    Dernier rendu d'un rapport périodique et empreinte des données qui l'ont produit.
+
+    Si les données collectées n'ont pas changé, le rendu est réutilisé (pas de nouveau
+    PDF xhtml2pdf) ou l'envoi est ignoré, selon la politique du rapport (core.rapports).
+    """
+    cle = models.CharField(max_length=50, unique=True, verbose_name="Rapport")
+    empreinte = models.CharField(max_length=64, verbose_name="Empreinte des données")
+    html = models.TextField(blank=True)
+    pdf = models.BinaryField(null=True, blank=True)
+    date_rendu = models.DateTimeField(verbose_name="Rendu le")
+    date_envoi = models.DateTimeField(null=True, blank=True, verbose_name="Envoyé le")
+
+    class Meta:
+        verbose_name = "Dernier rendu de rapport"
+        verbose_name_plural = "Derniers rendus de rapports"
+
+    def __str__(self):
+        return f"Rapport {self.cle} du {self.date_rendu:%d/%m/%Y %H:%M}"
+
+
+class EnvoiGroupe(AuditModel):
+    """
+    Envoi d'emails en nombre lancé depuis une action d'admin (core.mails).
+
+    Les messages sont envoyés en arrière-plan par lots, sur une connexion SMTP par lot ;
+    le résultat de chaque destinataire est consigné dans DestinataireEnvoi.
+    """
+    STATUT_CHOICES = [
+        ('en_attente', 'En attente'),
+        ('en_cours', 'En cours'),
+        ('termine', 'Terminé'),
+        ('echec', 'Échec'),
+    ]
+
+    libelle = models.CharField(max_length=100, verbose_name="Envoi")
+    sujet = models.CharField(max_length=255)
+    expediteur = models.CharField(max_length=254, blank=True, help_text="Adresse par défaut du serveur si vide")
+    cc = models.JSONField(default=list, blank=True, verbose_name="Copie")
+    cci = models.JSONField(default=list, blank=True, verbose_name="Copie cachée")
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='en_attente', db_index=True)
+    nombre_envoyes = models.PositiveIntegerField(default=0, verbose_name="Envoyés")
+    nombre_echecs = models.PositiveIntegerField(default=0, verbose_name="Échecs")
+    erreur = models.TextField(blank=True)
+    date_debut = models.DateTimeField(null=True, blank=True, verbose_name="Début")
+    date_fin = models.DateTimeField(null=True, blank=True, verbose_name="Fin")
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Envoi d'emails groupé"
+        verbose_name_plural = "Envois d'emails groupés"
+
+    def __str__(self):
+        return f"{self.libelle} #{self.pk} ({self.get_statut_display()})"
+
+
+class DestinataireEnvoi(models.Model):
+    """Message d'un destinataire d'un EnvoiGroupe et résultat de son envoi"""
+    STATUT_CHOICES = [
+        ('en_attente', 'En attente'),
+        ('envoye', 'Envoyé'),
+        ('echec', 'Échec'),
+    ]
+
+    envoi = models.ForeignKey(EnvoiGroupe, on_delete=models.CASCADE, related_name='destinataires')
+    email = models.EmailField()
+    corps = models.TextField()
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='en_attente', db_index=True)
+    tentatives = models.PositiveSmallIntegerField(default=0)
+    erreur = models.TextField(blank=True)
+    date_envoi = models.DateTimeField(null=True, blank=True, verbose_name="Envoyé le")
+
+    class Meta:
+        ordering = ['pk']
+        verbose_name = "Destinataire"
+        verbose_name_plural = "Destinataires"
+
+    def __str__(self):
+        return self.email
+
+
+class EmailSortant(models.Model):
+    """
+    Boîte d'envoi : email enregistré par un signal et envoyé par la commande envoyer_emails.
+
+    La ligne est créée dans la transaction de l'enregistrement qui déclenche l'email :
+    un enregistrement annulé n'envoie rien, et la requête n'attend pas le serveur SMTP.
+    """
+    STATUT_CHOICES = [
+        ('en_attente', 'En attente'),
+        ('en_cours', 'En cours'),
+        ('envoye', 'Envoyé'),
+        ('echec', 'Échec'),
+    ]
+
+    origine = models.CharField(max_length=100, blank=True, help_text="Signal ou traitement à l'origine de l'email")
+    sujet = models.CharField(max_length=255)
+    corps = models.TextField(blank=True)
+    expediteur = models.CharField(max_length=254, blank=True, help_text="Adresse par défaut du serveur si vide")
+    destinataires = models.JSONField(default=list)
+    cc = models.JSONField(default=list, blank=True, verbose_name="Copie")
+    cci = models.JSONField(default=list, blank=True, verbose_name="Copie cachée")
+    confidentiel = models.BooleanField(default=False, help_text="Corps effacé après l'envoi (mot de passe...)")
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='en_attente')
+    tentatives = models.PositiveSmallIntegerField(default=0)
+    prochain_essai = models.DateTimeField(default=timezone.now, verbose_name="Prochain essai")
+    erreur = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    date_envoi = models.DateTimeField(null=True, blank=True, verbose_name="Envoyé le")
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['statut', 'prochain_essai'])]
+        verbose_name = "Email sortant"
+        verbose_name_plural = "Emails sortants"
+
+    def __str__(self):
+        return f"{self.sujet} -> {', '.join(self.destinataires)} ({self.get_statut_display()})"
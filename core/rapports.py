@@ -0,0 +1,83 @@
+# core/rapports.py
+"""
+Cache des rapports périodiques : empreinte des données collectées et dernier rendu (ArtefactRapport).
+
+Politiques lorsque l'empreinte n'a pas changé depuis le dernier rendu :
+- 'toujours'   : rendu et envoi systématiques
+- 'reutiliser' : le rendu précédent (HTML/PDF) est renvoyé sans être régénéré
+- 'ignorer'    : rien n'est envoyé si le rendu précédent l'a déjà été
+"""
+import hashlib
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db import models
+from django.utils import timezone
+
+from .models import ArtefactRapport
+
+POLITIQUES_CACHE = ('toujours', 'reutiliser', 'ignorer')
+
+# Clés variant à chaque exécution sans changer le fond du rapport
+CLES_VOLATILES = ('date_generation',)
+
+
+def _valeur_stable(valeur):
+    if isinstance(valeur, Decimal):
+        # 10.5 et 10.50 ont la même empreinte
+        return format(valeur.normalize(), 'f')
+    if isinstance(valeur, (date, datetime)):
+        return valeur.isoformat()
+    if isinstance(valeur, models.Model):
+        # Instance passée telle quelle au template : empreinte de ses colonnes
+        return {champ.attname: getattr(valeur, champ.attname) for champ in valeur._meta.concrete_fields}
+    if isinstance(valeur, (set, frozenset)):
+        return sorted(valeur, key=str)
+    return str(valeur)
+
+
+def empreinte_donnees(donnees, exclure=CLES_VOLATILES):
+    """
+    Empreinte SHA-256 des données d'un rapport, indépendante de l'ordre des clés.
+
+    Args:
+        donnees: Données collectées (dict, listes, Decimal, dates...)
+        exclure: Clés de premier niveau ignorées
+    """
+    if isinstance(donnees, dict):
+        donnees = {cle: valeur for cle, valeur in donnees.items() if cle not in exclure}
+    serialise = json.dumps(donnees, sort_keys=True, default=_valeur_stable, separators=(',', ':'))
+    return hashlib.sha256(serialise.encode('utf-8')).hexdigest()
+
+
+def artefacts_inchanges(empreintes):
+    """
+    Derniers rendus dont l'empreinte est identique, en une requête.
+
+    Args:
+        empreintes: dict clé du rapport -> empreinte des données du jour
+
+    Returns:
+        dict: clé du rapport -> ArtefactRapport
+    """
+    artefacts = ArtefactRapport.objects.filter(cle__in=list(empreintes))
+    return {artefact.cle: artefact for artefact in artefacts if artefact.empreinte == empreintes[artefact.cle]}
+
+
+def envoi_inutile(artefact, politique):
+    """Vrai si la politique permet de ne pas renvoyer un rendu inchangé déjà envoyé"""
+    return politique == 'ignorer' and artefact is not None and artefact.date_envoi is not None
+
+
+def enregistrer_artefact(cle, empreinte, html='', pdf=None):
+    """Mémorise le rendu d'un rapport (remplace le précédent, pas encore envoyé)"""
+    ArtefactRapport.objects.update_or_create(
+        cle=cle,
+        defaults={'empreinte': empreinte, 'html': html, 'pdf': pdf, 'date_rendu': timezone.now(), 'date_envoi': None},
+    )
+
+
+def marquer_envoyes(cles):
+    """Note l'envoi des derniers rendus des rapports"""
+    return ArtefactRapport.objects.filter(cle__in=list(cles)).update(date_envoi=timezone.now())
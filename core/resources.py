@@ -0,0 +1,101 @@
+# core/resources.py
+"""
+Resources import-export : chargement des relations déduit des champs déclarés.
+
+Un champ `fields.Field(attribute='beneficiaire__raison_sociale')` lit une clé étrangère
+sur chaque ligne exportée ; sans select_related, chaque ligne coûte une requête par relation.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import QuerySet
+
+
+class RelationsExportMixin:
+    """
+    À placer avant resources.ModelResource : le queryset exporté charge en une requête
+    les relations parcourues par les attributs des champs (select_related pour les clés
+    étrangères, prefetch_related pour les relations multiples) et se limite aux colonnes lues (only()).
+    """
+
+    # Chemins lus par les dehydrate_* (ex. 'ordre_virement__date_remise_banque').
+    # Laissé à None, une colonne calculée empêche de restreindre les colonnes chargées.
+    champs_export_requis = None
+
+    def _chemins_attribut(self, attribut):
+        """
+        Analyse un attribut 'relation__...__champ' à partir du modèle de la resource.
+
+        Returns:
+            tuple: (relation simple la plus profonde, relation multiple, colonne lue) ;
+            colonne lue à None si l'attribut n'est pas un champ du modèle (propriété...),
+            égale à la relation si l'attribut désigne l'objet lié lui-même
+        """
+        modele = self._meta.model
+        parcours = []
+        relation_simple = relation_multiple = None
+        for partie in attribut.split('__'):
+            try:
+                champ = modele._meta.get_field(partie)
+            except FieldDoesNotExist:
+                return relation_simple, relation_multiple, None
+            parcours.append(partie)
+            # 'ordre_virement_id' : colonne de la clé étrangère, sans objet lié à charger
+            if not champ.is_relation or partie == getattr(champ, 'attname', None) != champ.name:
+                return relation_simple, relation_multiple, '__'.join(parcours)
+            chemin = '__'.join(parcours)
+            if champ.many_to_many or champ.one_to_many:
+                # Au-delà d'une relation multiple, les objets viennent du prefetch
+                return relation_simple, chemin, None
+            relation_simple = chemin
+            modele = champ.related_model
+        # Attribut désignant une relation : l'objet lié est chargé en entier
+        return relation_simple, relation_multiple, relation_simple
+
+    def chargement_export(self):
+        """
+        Returns:
+            tuple: (select_related, prefetch_related, only) ; only vaut None
+            si les colonnes nécessaires ne peuvent pas être déduites
+        """
+        select_related, prefetch_related, only = set(), set(), set()
+        attributs = list(self.champs_export_requis or ())
+        restreindre = True
+        for champ in self.get_export_fields():
+            methode = champ.get_dehydrate_method(self.get_field_name(champ))
+            if callable(methode) or hasattr(self, methode):
+                restreindre = restreindre and self.champs_export_requis is not None
+                continue
+            if champ.attribute:
+                attributs.append(champ.attribute)
+
+        for attribut in attributs:
+            relation_simple, relation_multiple, colonne = self._chemins_attribut(attribut)
+            if relation_simple:
+                select_related.add(relation_simple)
+            if relation_multiple:
+                prefetch_related.add(relation_multiple)
+            if colonne is None:
+                restreindre = False
+            else:
+                only.add(colonne)
+
+        if not restreindre:
+            return select_related, prefetch_related, None
+        # Un objet lié désigné par l'attribut lui-même (widget de clé étrangère) est chargé en entier
+        entiers = only & select_related
+        only = {colonne for colonne in only if not any(colonne.startswith(f'{relation}__') for relation in entiers)}
+        return select_related, prefetch_related, only
+
+    def optimiser_queryset(self, queryset):
+        if not isinstance(queryset, QuerySet):
+            return queryset
+        select_related, prefetch_related, only = self.chargement_export()
+        if select_related:
+            queryset = queryset.select_related(*sorted(select_related))
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*sorted(prefetch_related))
+        if only:
+            queryset = queryset.only(*sorted(only))
+        return queryset
+
+    def filter_export(self, queryset, **kwargs):
+        return self.optimiser_queryset(super().filter_export(queryset, **kwargs))
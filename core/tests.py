@@ -0,0 +1,176 @@
+"""
+Tests pour l'application core
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.urls import reverse
+
+from fournisseurs.models import Facture, OrdreVirement
+from fournisseurs.tests import FournisseursTestMixin
+
+
+class ExportsArrierePlanTests(FournisseursTestMixin, TestCase):
+    """Tests des exports de factures exécutés en arrière-plan (ExportJob)"""
+
+    def setUp(self):
+        import tempfile
+        from django.contrib.auth import get_user_model
+        from django.test import override_settings
+
+        super().setUp()
+        self.exports = tempfile.TemporaryDirectory()
+        self.addCleanup(self.exports.cleanup)
+        reglages = override_settings(EXPORTS_ROOT=self.exports.name)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+        for i in range(3):
+            self.creer_facture(f'F{i:03d}')
+        self.admin = get_user_model().objects.create_superuser(email='admin@test.com', password='x')
+        self.client.force_login(self.admin)
+
+    def test_export_programme_execute_puis_telecharge(self):
+        """Test le cycle complet : action d'admin, worker, progression et téléchargement"""
+        from io import StringIO
+        from django.core.management import call_command
+        from core.models import ExportJob
+        from fournisseurs.admin.facture_admin import FactureResourceSTD
+
+        response = self.client.post(reverse('fournisseur_admin:fournisseurs_facture_changelist'), {
+            'action': 'export_std_arriere_plan',
+            '_selected_action': list(Facture.objects.values_list('pk', flat=True)),
+        })
+        self.assertEqual(response.status_code, 302)
+
+        job = ExportJob.objects.get()
+        self.assertEqual((job.statut, job.lignes_total, job.created_by), ('en_attente', 3, self.admin))
+        self.assertEqual(len(job.parametres['pks']), 3)
+
+        call_command('traiter_exports', '--une-fois', stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual((job.statut, job.lignes_traitees, job.progression), ('termine', 3, 100))
+        self.assertIsNotNone(job.expire_le)
+
+        # Fichier hors de MEDIA_ROOT (servi publiquement), sous un nom non devinable
+        import os
+        self.assertTrue(job.fichier.path.startswith(os.path.realpath(self.exports.name)))
+        self.assertRegex(job.fichier.name, rf'^exports/factures_std_{job.pk}_[\w-]{{22}}\.csv$')
+
+        response = self.client.get(reverse('admin:core_exportjob_telecharger', args=[job.pk]))
+        attendu = FactureResourceSTD().export(Facture.objects.order_by('-pk')).csv
+        self.assertEqual(b''.join(response.streaming_content).decode(), attendu)
+        self.assertIn(f'filename="{job.nom_telechargement}"', response['Content-Disposition'])
+
+    def test_selection_complete_enregistre_les_filtres(self):
+        """Test que "tout sélectionner" enregistre les critères de la liste, réappliqués par le worker"""
+        from io import StringIO
+        from django.core.management import call_command
+        from core.models import ExportJob
+        from fournisseurs.admin.facture_admin import FactureResourceSTD
+
+        self.creer_facture('X001')
+        url = reverse('fournisseur_admin:fournisseurs_facture_changelist')
+        for action in ('export_std_arriere_plan', 'export_tva_arriere_plan'):
+            self.client.post(f'{url}?q=F00', {
+                'action': action,
+                'select_across': '1',
+                '_selected_action': [Facture.objects.first().pk],
+            })
+        job, job_tva = ExportJob.objects.order_by('pk')
+        self.assertNotIn('pks', job.parametres)
+        self.assertEqual((job.parametres['filtres'], job.lignes_total), ('q=F00', 3))
+        # Restriction propre à l'export (factures payées le mois précédent)
+        self.assertEqual(job_tva.lignes_total, 0)
+
+        # Critères réévalués à l'exécution
+        self.creer_facture('F003')
+        call_command('traiter_exports', '--une-fois', stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual((job.statut, job.lignes_traitees), ('termine', 4))
+        with job.fichier.open('rb') as fichier:
+            attendu = FactureResourceSTD().export(
+                Facture.objects.filter(num_facture__startswith='F').order_by(*job.parametres['ordre'])
+            ).csv
+            self.assertEqual(fichier.read().decode(), attendu)
+        job_tva.refresh_from_db()
+        self.assertEqual((job_tva.statut, job_tva.lignes_traitees), ('termine', 0))
+
+    def test_export_expire_supprime(self):
+        """Test que le nettoyage supprime les jobs expirés et leur fichier"""
+        from django.utils import timezone
+        from core.exports import executer_export_job, nettoyer_exports_expires, reserver_export_job
+        from core.models import ExportJob
+
+        ExportJob.objects.create(cle_export='factures_dlp', format='xlsx',
+                                 parametres={'pks': list(Facture.objects.values_list('pk', flat=True))})
+        job = reserver_export_job()
+        self.assertTrue(executer_export_job(job))
+        job.refresh_from_db()
+        fichier = job.fichier.path
+
+        self.assertEqual(nettoyer_exports_expires(), 0)
+        ExportJob.objects.filter(pk=job.pk).update(expire_le=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(nettoyer_exports_expires(), 1)
+
+        self.assertFalse(ExportJob.objects.exists())
+        import os
+        self.assertFalse(os.path.exists(fichier))
+
+
+class ExportsRelationsTests(FournisseursTestMixin, TestCase):
+    """Tests du chargement des relations déduit des champs des resources (RelationsExportMixin)"""
+
+    def setUp(self):
+        super().setUp()
+        from fournisseurs.models import Contrat
+
+        contrat = Contrat.objects.create(
+            beneficiaire=self.beneficiaire, numero_contrat='CT001', objet='Maintenance', moe='fm',
+            date_debut=date.today(), mode_paiement='30J',
+            montant_HT=Decimal('10000.00'), taux_de_TVA=Decimal('20'), taux_RAS_TVA=Decimal('0'),
+            taux_RAS_IS=Decimal('0'), taux_RG=Decimal('0'),
+        )
+        for i in range(6):
+            ov = OrdreVirement.objects.create(type_ov='Virement', beneficiaire=self.beneficiaire, compte_tresorerie=self.compte)
+            self.creer_facture(f'F{i:03d}', contrat=contrat if i % 2 else None,
+                               ordre_virement=ov if i % 3 else None, date_execution=date.today())
+
+    def test_chargement_deduit_des_champs(self):
+        """Test les select_related / only() déduits des attributs déclarés"""
+        from fournisseurs.admin.facture_admin import FactureResourceSTD, FactureResourceTVA
+
+        select_related, prefetch_related, only = FactureResourceSTD().chargement_export()
+        self.assertEqual(select_related, {'beneficiaire', 'contrat'})
+        self.assertEqual(prefetch_related, set())
+        # ordre_virement est exporté par son identifiant : pas de jointure
+        self.assertIn('ordre_virement_id', only)
+        self.assertIn('contrat__moe', only)
+        self.assertNotIn('nature_achat', only)
+
+        # Attribut traversant une relation nullable : jointure sur l'OV
+        select_related_tva, _, only_tva = FactureResourceTVA().chargement_export()
+        self.assertIn('ordre_virement', select_related_tva)
+        self.assertIn('ordre_virement__date_remise_banque', only_tva)
+
+    def test_exports_en_nombre_de_requetes_constant(self):
+        """Test que chaque export lit les relations dans la même requête que les factures"""
+        from core.exports import lignes_resource
+        from fournisseurs.admin.facture_admin import FactureResourceSTD, FactureResourceTVA
+        from fournisseurs.admin.ordre_virement_admin import OrdreVirementResource
+
+        queryset = Facture.objects.order_by('num_facture')
+        with self.assertNumQueries(1):
+            dataset = FactureResourceSTD().export(queryset)
+        self.assertEqual(dataset['Beneficiaire'], ['Fournisseur Test'] * 6)
+        self.assertEqual(dataset['Contrat'], ['', 'CT001'] * 3)
+        with self.assertNumQueries(1):
+            FactureResourceTVA().export(queryset)
+        with self.assertNumQueries(1):
+            OrdreVirementResource().export(OrdreVirement.objects.all())
+        with self.assertNumQueries(1):
+            lignes = list(lignes_resource(FactureResourceSTD(), queryset))
+        self.assertEqual(lignes, [list(ligne) for ligne in dataset])
@@ -1,245 +1,24 @@
 # /fournisseurs/admin/dashboard.py
 from django.utils import timezone
-from datetime import timedelta
-from django.db.models import Count, Case, When, IntegerField, Sum, Q
 from django.shortcuts import render
-from django.db import models
-from django.db.models import F
-from fournisseurs.models import Facture, Beneficiaire
+from fournisseurs.models import Beneficiaire, Facture
+from fournisseurs.services import get_echeancier_dashboard, get_tendance_echeancier
 
-def get_tableau_bord_data():
-    # Définir les dates de référence
-    aujourdhui = timezone.now().date()
-    une_semaine = aujourdhui + timedelta(days=7)
-    deux_semaines = aujourdhui + timedelta(days=14)
-    un_mois = aujourdhui + timedelta(days=30)
-
-    # Filtrer les factures en instance de paiement (statut différent de 'payee')
-    factures = Facture.objects.exclude(statut='payee')
+PERIODES_TENDANCE = (30, 90, 365)
 
-    # Calculer les totaux globaux
-    total_global = factures.aggregate(
-        factures_en_retard=Count(
-            Case(
-                When(Q(date_echeance__lt=aujourdhui), then=1),
-                output_field=IntegerField()
-            )
-        ),
-        montant_retard=Sum(
-            Case(
-                When(Q(date_echeance__lt=aujourdhui), then=F('mnt_net_apayer')),
-                output_field=models.DecimalField()
-            )
-        ),
-        moins_une_semaine=Count(
-            Case(
-                When(
-                    Q(date_echeance__gte=aujourdhui) & Q(date_echeance__lte=une_semaine),
-                    then=1
-                ),
-                output_field=IntegerField()
-            )
-        ),
-        montant_moins_une_semaine=Sum(
-            Case(
-                When(
-                    Q(date_echeance__gte=aujourdhui) & Q(date_echeance__lte=une_semaine),
-                    then=F('mnt_net_apayer')
-                ),
-                output_field=models.DecimalField()
-            )
-        ),
-        moins_deux_semaines=Count(
-            Case(
-                When(
-                    Q(date_echeance__gt=une_semaine) & Q(date_echeance__lte=deux_semaines),
-                    then=1
-                ),
-                output_field=IntegerField()
-            )
-        ),
-        montant_moins_deux_semaines=Sum(
-            Case(
-                When(
-                    Q(date_echeance__gt=une_semaine) & Q(date_echeance__lte=deux_semaines),
-                    then=F('mnt_net_apayer')
-                ),
-                output_field=models.DecimalField()
-            )
-        ),
-        moins_un_mois=Count(
-            Case(
-                When(
-                    Q(date_echeance__gt=deux_semaines) & Q(date_echeance__lte=un_mois),
-                    then=1
-                ),
-                output_field=IntegerField()
-            )
-        ),
-        montant_moins_un_mois=Sum(
-            Case(
-                When(
-                    Q(date_echeance__gt=deux_semaines) & Q(date_echeance__lte=un_mois),
-                    then=F('mnt_net_apayer')
-                ),
-                output_field=models.DecimalField()
-            )
-        ),
-        plus_un_mois=Count(
-            Case(
-                When(Q(date_echeance__gt=un_mois), then=1),
-                output_field=IntegerField()
-            )
-        ),
-        montant_plus_un_mois=Sum(
-            Case(
-                When(Q(date_echeance__gt=un_mois), then=F('mnt_net_apayer')),
-                output_field=models.DecimalField()
-            )
-        ),
-        total=Count('id'),
-        montant_total=Sum(
-            Case(
-                When(~Q(statut='payee'), then=F('mnt_net_apayer')),
-                output_field=models.DecimalField()
-            )
-        )
-    )
+def get_tableau_bord_data():
+    """
+    Données du tableau de bord : factures non payées par tranche d'échéance.
 
-    # Annoter chaque bénéficiaire avec les comptages par période d'échéance
-    fournisseurs = Beneficiaire.objects.filter(
-        factures_beneficiaire__in=factures
-    ).distinct().annotate(
-        factures_en_retard = Count(
-            Case(
-                When(
-                    Q(factures_beneficiaire__date_echeance__lt=aujourdhui) &
-                    ~Q(factures_beneficiaire__statut='payee'),
-                    then=1
-                ),
-                output_field=IntegerField()
-            ),
-        ),
-        montant_retard=Sum(
-            Case(
-                When(
-                    Q(factures_beneficiaire__date_echeance__lt=aujourdhui) &
-                    ~Q(factures_beneficiaire__statut='payee'),
-                    then=F('factures_beneficiaire__mnt_net_apayer')
-                ),
-                output_field=models.DecimalField()
-            )
-        ),
-        moins_une_semaine=Count(
-            Case(
-                When(
-                    Q(factures_beneficiaire__date_echeance__gte=aujourdhui) &
-                    Q(factures_beneficiaire__date_echeance__lte=une_semaine) &
-                    ~Q(factures_beneficiaire__statut='payee'),
-                    then=1
-                ),
-                output_field=IntegerField()
-            )
-        ),
-        montant_moins_une_semaine=Sum(
-            Case(
-                When(
-                    Q(factures_beneficiaire__date_echeance__gte=aujourdhui) &
-                    Q(factures_beneficiaire__date_echeance__lte=une_semaine) &
-                    ~Q(factures_beneficiaire__statut='payee'),
-                    then=F('factures_beneficiaire__mnt_net_apayer')
-                ),
-                output_field=models.DecimalField()
-            )
-        ),
-        moins_deux_semaines=Count(
-            Case(
-                When(
-                    Q(factures_beneficiaire__date_echeance__gt=une_semaine) &
-                    Q(factures_beneficiaire__date_echeance__lte=deux_semaines) &
-                    ~Q(factures_beneficiaire__statut='payee'),
-                    then=1
-                ),
-                output_field=IntegerField()
-            )
-        ),
-        montant_moins_deux_semaines=Sum(
-            Case(
-                When(
-                    Q(factures_beneficiaire__date_echeance__gt=une_semaine) &
-                    Q(factures_beneficiaire__date_echeance__lte=deux_semaines) &
-                    ~Q(factures_beneficiaire__statut='payee'),
-                    then=F('factures_beneficiaire__mnt_net_apayer')
-                ),
-                output_field=models.DecimalField()
-            )
-        ),
-        moins_un_mois=Count(
-            Case(
-                When(
-                    Q(factures_beneficiaire__date_echeance__gt=deux_semaines) &
-                    Q(factures_beneficiaire__date_echeance__lte=un_mois) &
-                    ~Q(factures_beneficiaire__statut='payee'),
-                    then=1
-                ),
-                output_field=IntegerField()
-            )
-        ),
-        montant_moins_un_mois=Sum(
-            Case(
-                When(
-                    Q(factures_beneficiaire__date_echeance__gt=deux_semaines) &
-                    Q(factures_beneficiaire__date_echeance__lte=un_mois) &
-                    ~Q(factures_beneficiaire__statut='payee'),
-                    then=F('factures_beneficiaire__mnt_net_apayer')
-                ),
-                output_field=models.DecimalField()
-            )
-        ),
-        plus_un_mois=Count(
-            Case(
-                When(
-                    Q(factures_beneficiaire__date_echeance__gt=un_mois) &
-                    ~Q(factures_beneficiaire__statut='payee'),
-                    then=1
-                ),
-                output_field=IntegerField()
-            )
-        ),
-        montant_plus_un_mois=Sum(
-            Case(
-                When(
-                    Q(factures_beneficiaire__date_echeance__gt=un_mois) &
-                    ~Q(factures_beneficiaire__statut='payee'),
-                    then=F('factures_beneficiaire__mnt_net_apayer')
-                ),
-                output_field=models.DecimalField()
-            )
-        ),
-        total=Count(
-            Case(
-                When(
-                    ~Q(factures_beneficiaire__statut='payee'),
-                    then=1
-                ),
-                output_field=IntegerField()
-            )
-        ),
-        montant_total=Sum(
-            Case(
-                When(
-                    ~Q(factures_beneficiaire__statut='payee'),
-                    then=F('factures_beneficiaire__mnt_net_apayer')
-                ),
-                output_field=models.DecimalField()
-            )
-        )
-    ).order_by('raison_sociale')
+    Lues dans l'échéancier matérialisé (EcheancierFournisseur) plutôt qu'agrégées sur
+    l'ensemble des factures à chaque affichage.
+    """
+    fournisseurs, total_global = get_echeancier_dashboard()
 
     return {
         'fournisseurs': fournisseurs,
         'total_global': total_global,
-        'aujourdhui': aujourdhui
+        'aujourdhui': timezone.now().date()
     }
 
 def tableau_bord_view(request, admin_site):
@@ -253,4 +32,38 @@ def tableau_bord_view(request, admin_site):
         'opts': Facture._meta,
     }
 
-    return render(request, 'admin/fournisseurs/tableau_bord_fournisseurs.html', context)
\ No newline at end of file
+    return render(request, 'admin/fournisseurs/tableau_bord_fournisseurs.html', context)
+
+def tendance_echeancier_view(request, admin_site):
+    """Vue de l'évolution de l'échéancier sur 30, 90 ou 365 jours (lue dans les instantanés)"""
+    try:
+        periode = int(request.GET.get('periode', PERIODES_TENDANCE[0]))
+    except ValueError:
+        periode = PERIODES_TENDANCE[0]
+    if periode not in PERIODES_TENDANCE:
+        periode = PERIODES_TENDANCE[0]
+
+    beneficiaire = None
+    beneficiaire_id = request.GET.get('beneficiaire_id')
+    if beneficiaire_id and beneficiaire_id.isdigit():
+        beneficiaire = Beneficiaire.objects.filter(pk=beneficiaire_id).first()
+
+    tendance = get_tendance_echeancier(periode, beneficiaire.pk if beneficiaire else None)
+
+    # Largeur relative des barres (montant en retard / plus gros montant total de la période)
+    maximum = max((ligne['montant_total'] for ligne in tendance), default=0)
+    for ligne in tendance:
+        ligne['part_retard'] = int(ligne['montant_retard'] * 100 / maximum) if maximum else 0
+        ligne['part_total'] = int(ligne['montant_total'] * 100 / maximum) if maximum else 0
+
+    context = {
+        **admin_site.each_context(request),
+        'tendance': tendance,
+        'periode': periode,
+        'periodes': PERIODES_TENDANCE,
+        'beneficiaire': beneficiaire,
+        'title': "Évolution de l'échéancier",
+        'opts': Facture._meta,
+    }
+
+    return render(request, 'admin/fournisseurs/tendance_echeancier.html', context)
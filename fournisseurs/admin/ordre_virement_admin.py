@@ -14,14 +14,17 @@ from django.urls import reverse
 from fournisseurs.views import generate_ov_pdf
 ###############
 
+from core.resources import RelationsExportMixin
 from fournisseurs.filters import get_factures_queryset
 from fournisseurs.models import Beneficiaire, CompteTresorerie, OrdreVirement, Facture
+from fournisseurs.pdf import generer_lot_ov_pdf
+from fournisseurs.services import recalculer_montant_ov
 
 from fournisseurs.admin.facture_admin import fournisseur_admin
 
 import csv
 
-class OrdreVirementResource(resources.ModelResource):
+class OrdreVirementResource(RelationsExportMixin, resources.ModelResource):
     beneficiaire = fields.Field(attribute='beneficiaire__raison_sociale', column_name='Beneficiaire')
     compte_tresorerie = fields.Field(attribute='compte_tresorerie__rib', column_name='Compte_beneficiaire')
     compte_tresorerie_emetteur = fields.Field(attribute='compte_tresorerie_emetteur__rib', column_name='Compte_emetteur')
@@ -109,7 +112,7 @@ class OrdreVirementAdmin(ImportExportModelAdmin):
     search_fields = ('beneficiaire__raison_sociale',)
     list_per_page = 15
     #actions = ['export_ov_as_csv']
-    actions = ['generate_ov_pdf_action','export_ov_as_csv']
+    actions = ['generate_ov_pdf_action','generer_lot_pdf_action','generer_lot_zip_action','export_ov_as_csv']
 
     class Media:
         js = (
@@ -125,6 +128,10 @@ class OrdreVirementAdmin(ImportExportModelAdmin):
         if 'factures' in form.cleaned_data:
             factures = form.cleaned_data['factures']
             factures.update(ordre_virement=obj)
+            # Les factures nouvellement cochées prennent le statut de l'OV
+            obj.mettre_a_jour_statut_factures()
+            # L'UPDATE en masse ne déclenche pas les signaux des factures
+            recalculer_montant_ov(obj)
 
     def get_readonly_fields(self, request, obj=None):
         fields = list(super().get_readonly_fields(request, obj) or [])
@@ -185,6 +192,33 @@ class OrdreVirementAdmin(ImportExportModelAdmin):
 
     generate_pdf_action.short_description = "Générer un PDF pour l'ordre sélectionné"
 
+    def _generer_lot(self, request, queryset, format_sortie):
+        ids = list(queryset.order_by('id').values_list('id', flat=True))
+        contenu, ignores = generer_lot_ov_pdf(ids, format_sortie=format_sortie)
+        if ignores:
+            self.message_user(
+                request,
+                f"OV ignorés faute de compte émetteur : {', '.join(map(str, ignores))}",
+                level='warning',
+            )
+        if len(ignores) == len(ids):
+            return None
+
+        content_type = 'application/zip' if format_sortie == 'zip' else 'application/pdf'
+        response = HttpResponse(contenu, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="ordres_virement.{format_sortie}"'
+        return response
+
+    def generer_lot_pdf_action(self, request, queryset):
+        return self._generer_lot(request, queryset, 'pdf')
+
+    generer_lot_pdf_action.short_description = "Générer un PDF unique pour les ordres sélectionnés"
+
+    def generer_lot_zip_action(self, request, queryset):
+        return self._generer_lot(request, queryset, 'zip')
+
+    generer_lot_zip_action.short_description = "Générer une archive ZIP des PDF des ordres sélectionnés"
+
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
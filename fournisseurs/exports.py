@@ -0,0 +1,165 @@
+# /fournisseurs/exports.py
+"""
+Exports tabulaires des factures fournisseurs :
+- rapport Délais Paiement calculé par colonnes (pandas)
+- réponses CSV/XLSX en flux, à mémoire bornée quel que soit le nombre de lignes
+"""
+from datetime import date
+from tempfile import SpooledTemporaryFile
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+from django.http import FileResponse, StreamingHttpResponse
+
+from core.echeances import calculer_echeances
+from core.exports import TAILLE_LOT_EXPORT, TAILLE_MAX_FICHIER_MEMOIRE, ecrire_xlsx, iterer_csv, lignes_resource
+
+# Colonnes de l'export Délais Paiement
+# (nom de colonne -> champ values(), None pour les colonnes calculées)
+COLONNES_DLP = {
+    'MOE': 'contrat__moe',
+    'Contrat': 'contrat__numero_contrat',
+    'date_facture': 'date_facture',
+    'num_facture': 'num_facture',
+    'montant_ht': 'montant_ht',
+    'montant_ttc': 'montant_ttc',
+    'Fournisseur': 'beneficiaire__raison_sociale',
+    'ICE': 'beneficiaire__code_ice',
+    'RC': 'beneficiaire__registre_commerce',
+    'date_execution': 'date_execution',
+    'Echéance contractuelle': 'contrat__mode_paiement',
+    'Date règlement': 'ordre_virement__date_remise_banque',
+    'mnt_net_apayer': 'mnt_net_apayer',
+    'Date échéance théorique': None,
+    'Jours de retard (réglé)': None,
+    'Jours de retard (non réglé)': None,
+    'A sélectionner': None,
+}
+
+COLONNES_DATES_DLP = ('date_facture', 'date_execution', 'Date règlement')
+
+# Délai appliqué aux factures sans contrat
+MODE_PAIEMENT_DEFAUT = '60J'
+
+
+def trimestre_precedent(aujourdhui=None):
+    """Retourne les dates de début et fin du trimestre précédent"""
+    aujourdhui = aujourdhui or date.today()
+    trimestre_en_cours = (aujourdhui.month - 1) // 3 + 1
+
+    if trimestre_en_cours == 1:
+        trimestre, annee = 4, aujourdhui.year - 1
+    else:
+        trimestre, annee = trimestre_en_cours - 1, aujourdhui.year
+
+    debut_trimestre = date(annee, (trimestre - 1) * 3 + 1, 1)
+    fin_trimestre = debut_trimestre + relativedelta(months=3, days=-1)
+    return debut_trimestre, fin_trimestre
+
+
+def _texte(colonne):
+    """Rendu texte d'une colonne comme l'export import-export (vide si absent)"""
+    return colonne.where(colonne.notna(), '').astype(str)
+
+
+def construire_rapport_dlp(queryset, aujourdhui=None):
+    """
+    Construit l'export Délais Paiement des factures en une requête.
+
+    Les bornes du trimestre précédent sont calculées une fois ; l'échéance théorique,
+    les jours de retard et l'indicateur « à sélectionner » sont des colonnes vectorisées.
+
+    Args:
+        queryset: Factures fournisseurs à exporter (ordre conservé)
+        aujourdhui: Date de référence du trimestre précédent (aujourd'hui par défaut)
+
+    Returns:
+        pandas.DataFrame: Colonnes de COLONNES_DLP, valeurs texte
+    """
+    champs = [champ for champ in COLONNES_DLP.values() if champ] + ['contrat_id']
+    donnees = pd.DataFrame.from_records(queryset.values(*champs), columns=champs)
+
+    debut, fin = (pd.Timestamp(borne) for borne in trimestre_precedent(aujourdhui))
+
+    execution = pd.to_datetime(donnees['date_execution'], errors='coerce')
+    reglement = pd.to_datetime(donnees['ordre_virement__date_remise_banque'], errors='coerce')
+    codes = donnees['contrat__mode_paiement'].where(donnees['contrat_id'].notna(), MODE_PAIEMENT_DEFAUT)
+    echeance = calculer_echeances(execution, codes)
+
+    def dans_trimestre(dates):
+        return (dates >= debut) & (dates <= fin)
+
+    # Factures réglées : référence = fin du trimestre si réglée après, date de règlement
+    # si l'échéance tombe dans le trimestre, début du trimestre sinon
+    reference = reglement.where(dans_trimestre(echeance), debut).mask(reglement > fin, fin)
+    retard_regle = (reference - echeance).dt.days.clip(lower=0).astype('Int64').astype(str)
+    retard_non_regle = (fin - echeance).dt.days.clip(lower=0).astype('Int64').astype(str)
+
+    rapport = pd.DataFrame(index=donnees.index)
+    for colonne, champ in COLONNES_DLP.items():
+        if champ:
+            rapport[colonne] = donnees[champ]
+    for colonne in COLONNES_DATES_DLP:
+        rapport[colonne] = pd.to_datetime(rapport[colonne], errors='coerce').dt.strftime('%Y-%m-%d')
+    rapport = rapport.apply(_texte)
+
+    rapport['Date échéance théorique'] = echeance.dt.strftime('%d/%m/%Y').fillna('NA')
+    rapport['Jours de retard (réglé)'] = np.select(
+        [reglement.isna(), echeance.isna()], ['FNReglée', 'Echéance invalide'], default=retard_regle,
+    )
+    rapport['Jours de retard (non réglé)'] = np.select(
+        [reglement.notna(), echeance.isna()], ['FReglée', 'Echéance invalide'], default=retard_non_regle,
+    )
+    rapport['A sélectionner'] = np.where(
+        dans_trimestre(execution) | dans_trimestre(reglement) | dans_trimestre(echeance), '1', '0',
+    )
+    return rapport[list(COLONNES_DLP)]
+
+
+def _lots_pk(queryset, taille_lot):
+    """Identifiants du queryset par lots, dans l'ordre du queryset"""
+    lot = []
+    for pk in queryset.values_list('pk', flat=True).iterator(chunk_size=taille_lot):
+        lot.append(pk)
+        if len(lot) == taille_lot:
+            yield lot
+            lot = []
+    if lot:
+        yield lot
+
+
+def lignes_rapport_dlp(queryset, taille_lot=TAILLE_LOT_EXPORT, aujourdhui=None):
+    """Lignes du rapport Délais Paiement, calculées lot par lot (même trimestre pour tous les lots)"""
+    aujourdhui = aujourdhui or date.today()
+    for lot in _lots_pk(queryset, taille_lot):
+        rapport = construire_rapport_dlp(queryset.filter(pk__in=lot), aujourdhui)
+        yield from rapport.itertuples(index=False, name=None)
+
+
+def construire_export_dlp(queryset):
+    """En-têtes et lignes du rapport Délais Paiement (registre des exports en arrière-plan)"""
+    return list(COLONNES_DLP), lignes_rapport_dlp(queryset)
+
+
+def reponse_csv(entetes, lignes, nom_fichier):
+    """Réponse CSV envoyée au fil de l'eau"""
+    response = StreamingHttpResponse(iterer_csv(entetes, lignes), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{nom_fichier}"'
+    return response
+
+
+def reponse_xlsx(entetes, lignes, nom_fichier):
+    """
+    Réponse XLSX écrite en mode write-only (lignes sérialisées au fur et à mesure)
+    dans un fichier temporaire qui ne reste en mémoire que s'il est petit.
+    """
+    fichier = SpooledTemporaryFile(max_size=TAILLE_MAX_FICHIER_MEMOIRE)
+    ecrire_xlsx(fichier, entetes, lignes)
+    fichier.seek(0)
+    return FileResponse(
+        fichier,
+        as_attachment=True,
+        filename=nom_fichier,
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Commande Django: Génère en lot les PDF d'ordres de virement (PDF fusionné ou ZIP).
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fournisseurs.models import OrdreVirement
+from fournisseurs.pdf import generer_lot_ov_pdf
+
+
+class Command(BaseCommand):
+    help = "Génère les PDF de plusieurs ordres de virement en parallèle dans un seul fichier"
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int, help="Identifiants des OV (défaut : voir --a-signer)")
+        parser.add_argument(
+            '--a-signer',
+            action='store_true',
+            help="Tous les OV validés pour signature et pas encore remis à la banque",
+        )
+        parser.add_argument('--zip', action='store_true', help="Archive ZIP (un PDF par OV) au lieu d'un PDF fusionné")
+        parser.add_argument('--workers', type=int, default=None, help="Nombre de processus (défaut : nombre de cœurs)")
+        parser.add_argument('--sortie', required=True, help="Chemin du fichier produit")
+
+    def handle(self, *args, **options):
+        ids = options['ids']
+        if options['a_signer']:
+            ids += list(
+                OrdreVirement.objects.filter(valide_pour_signature=True, remis_a_banque=False)
+                .order_by('id').values_list('id', flat=True)
+            )
+        if not ids:
+            raise CommandError("Aucun ordre de virement à générer (indiquer des ids ou --a-signer).")
+
+        debut = time.perf_counter()
+        contenu, ignores = generer_lot_ov_pdf(
+            list(dict.fromkeys(ids)),
+            format_sortie='zip' if options['zip'] else 'pdf',
+            max_workers=options['workers'],
+        )
+        duree = time.perf_counter() - debut
+
+        if ignores:
+            self.stdout.write(self.style.WARNING(
+                f"OV ignorés faute de compte émetteur : {', '.join(map(str, ignores))}"
+            ))
+
+        with open(options['sortie'], 'wb') as fichier:
+            fichier.write(contenu)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(set(ids)) - len(ignores)} OV générés en {duree:.1f}s dans {options['sortie']}"
+        ))
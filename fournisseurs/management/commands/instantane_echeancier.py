@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Commande Django: Enregistre l'instantané journalier de l'échéancier fournisseurs.
+"""
+from django.core.management.base import BaseCommand
+
+from fournisseurs.services import enregistrer_instantane_echeancier
+
+
+class Command(BaseCommand):
+    help = "Ajoute à l'historique l'échéancier fournisseurs du jour (global et par bénéficiaire)"
+
+    def handle(self, *args, **options):
+        nb_lignes = enregistrer_instantane_echeancier()
+        if nb_lignes == 0:
+            self.stdout.write(self.style.WARNING("L'instantané du jour existe déjà : historique inchangé."))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Instantané enregistré : {nb_lignes} ligne(s)."))
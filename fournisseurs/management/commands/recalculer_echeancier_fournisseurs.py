@@ -0,0 +1,16 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Commande Django: Recalcule l'échéancier fournisseurs (tâche de nuit).
+"""
+from django.core.management.base import BaseCommand
+
+from fournisseurs.services import reconstruire_echeancier
+
+
+class Command(BaseCommand):
+    help = "Recalcule les tranches d'échéance des factures non payées de tous les bénéficiaires à la date du jour"
+
+    def handle(self, *args, **options):
+        nb_lignes = reconstruire_echeancier()
+        self.stdout.write(self.style.SUCCESS(f"Échéancier recalculé : {nb_lignes} bénéficiaire(s)."))
@@ -1,67 +1,113 @@
 # sauvgarde_bdd_frs.py
 
+import csv
+import io
+import os
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from tempfile import TemporaryDirectory
+
 from django.core.management.base import BaseCommand
 from django.core.mail import EmailMessage
+from django.utils import timezone
 from decouple import config
-import pandas as pd
+from openpyxl import Workbook
+
+from core.exports import TAILLE_LOT_EXPORT, ajouter_feuille
+from fournisseurs.models import Beneficiaire, CompteTresorerie, Contrat, Facture, OrdreVirement, SauvegardeBdd
+
+# Feuille (ou fichier CSV) -> modèle exporté
+FEUILLES = (
+    ('beneficiaires', Beneficiaire),
+    ('comptesTresorerie', CompteTresorerie),
+    ('contrats', Contrat),
+    ('factures', Facture),
+    ('ordresVirement', OrdreVirement),
+)
+
+# Une sauvegarde complète est refaite si la dernière date de plus de N jours
+JOURS_ENTRE_SAUVEGARDES_COMPLETES = 7
+
+TYPES_MIME = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'application/zip',
+}
+
+
+def _cellule(valeur):
+    """Dates-heures en UTC sans fuseau (non supportées par Excel)"""
+    if isinstance(valeur, datetime) and valeur.tzinfo is not None:
+        return timezone.make_naive(valeur, dt_timezone.utc)
+    return valeur
+
+
+def lignes_modifiees(model, depuis=None, jusqu_a=None):
+    """
+    Colonnes et lignes d'un modèle, les plus récemment modifiées d'abord, lues par lots.
+
+    Args:
+        depuis: Ne garder que les lignes modifiées après cette date (toutes si None)
+        jusqu_a: Ne garder que les lignes modifiées jusqu'à cette date incluse
+    """
+    colonnes = [champ.attname for champ in model._meta.concrete_fields]
+    queryset = model.objects.all()
+    if depuis is not None:
+        queryset = queryset.filter(updated_at__gt=depuis)
+    if jusqu_a is not None:
+        queryset = queryset.filter(updated_at__lte=jusqu_a)
+    valeurs = queryset.order_by('-updated_at').values_list(*colonnes).iterator(chunk_size=TAILLE_LOT_EXPORT)
+    return colonnes, (tuple(_cellule(valeur) for valeur in ligne) for ligne in valeurs)
 
-from fournisseurs.models import Beneficiaire, CompteTresorerie, Contrat, Facture, OrdreVirement
 
-def export_multisheet():
+def _compter(lignes, comptes, nom):
+    comptes[nom] = 0
+    for ligne in lignes:
+        comptes[nom] += 1
+        yield ligne
+
+
+def export_multisheet(fichier, depuis=None, jusqu_a=None, format_export='xlsx'):
     """
-    Exporte les données Django vers un fichier Excel avec plusieurs feuilles
+    Exporte les données fournisseurs dans un fichier binaire ouvert, une feuille par modèle.
+
+    Les lignes sont écrites au fil de la lecture : classeur XLSX write-only, ou archive
+    zip compressée contenant un CSV par modèle.
+
+    Args:
+        fichier: Fichier binaire ouvert en écriture
+        depuis / jusqu_a: Bornes de la sauvegarde différentielle (voir lignes_modifiees)
+        format_export: 'xlsx' ou 'csv'
+
+    Returns:
+        dict: Nombre de lignes exportées par feuille
     """
-    # Nom du fichier Excel
-    filename = 'bdd_frs.xlsx'
-
-    # Créer un writer Excel
-    writer = pd.ExcelWriter(filename, engine='xlsxwriter')
-
-    def make_timezone_naive(df):
-        """Convert timezone-aware datetime columns to naive"""
-        for col in df.columns:
-            if df[col].dtype == 'datetime64[ns, UTC]':
-                df[col] = df[col].dt.tz_localize(None)
-        return df
-
-    # Feuille 1 - Données beneficiaire
-    df1 = pd.DataFrame(list(Beneficiaire.objects.all().values()))
-    df1 = make_timezone_naive(df1)
-    df1 = df1.sort_values('updated_at', ascending=False)
-    df1.to_excel(writer, sheet_name='beneficiaires', index=False)
-
-    # Feuille 2 - Données compte tresorerie
-    df2 = pd.DataFrame(list(CompteTresorerie.objects.all().values()))
-    df2 = make_timezone_naive(df2)
-    df2 = df2.sort_values('updated_at', ascending=False)
-    df2.to_excel(writer, sheet_name='comptesTresorerie', index=False)
-
-    # Feuille 3 - Données contrat
-    df3 = pd.DataFrame(list(Contrat.objects.all().values()))
-    df3 = make_timezone_naive(df3)
-    df3 = df3.sort_values('updated_at', ascending=False)
-    df3.to_excel(writer, sheet_name='contrats', index=False)
-
-    # Feuille 4 - Données facture
-    df4 = pd.DataFrame(list(Facture.objects.all().values()))
-    df4 = make_timezone_naive(df4)
-    df4 = df4.sort_values('updated_at', ascending=False)
-    df4.to_excel(writer, sheet_name='factures', index=False)
-
-    # Feuille 5 - Données ordre de virement
-    df5 = pd.DataFrame(list(OrdreVirement.objects.all().values()))
-    df5 = make_timezone_naive(df5)
-    df5 = df5.sort_values('updated_at', ascending=False)
-    df5.to_excel(writer, sheet_name='ordresVirement', index=False)
-
-    # Sauvegarder
-    writer.close()
-    return filename
-
-
-def send_email_with_attachment(filename, subject, body, to_emails=None):
+    comptes = {}
+    if format_export == 'csv':
+        with zipfile.ZipFile(fichier, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for nom, model in FEUILLES:
+                colonnes, lignes = lignes_modifiees(model, depuis, jusqu_a)
+                with archive.open(f'{nom}.csv', 'w') as membre:
+                    texte = io.TextIOWrapper(membre, encoding='utf-8', newline='')
+                    writer = csv.writer(texte)
+                    writer.writerow(colonnes)
+                    writer.writerows(_compter(lignes, comptes, nom))
+                    texte.flush()
+                    texte.detach()
+        return comptes
+
+    classeur = Workbook(write_only=True)
+    for nom, model in FEUILLES:
+        colonnes, lignes = lignes_modifiees(model, depuis, jusqu_a)
+        ajouter_feuille(classeur, nom, colonnes, _compter(lignes, comptes, nom))
+    # Le classeur write-only est sérialisé à l'enregistrement
+    classeur.save(fichier)
+    return comptes
+
+
+def send_email_with_attachment(filename, subject, body, to_emails=None, mimetype=TYPES_MIME['xlsx']):
     """
-    Envoie un email avec le fichier en pièce jointe
+    Envoie un email avec le fichier en pièce jointe (sans pièce jointe si filename est vide)
     """
     if to_emails is None:
         # Récupérer les emails depuis .env
@@ -74,15 +120,16 @@ def send_email_with_attachment(filename, subject, body, to_emails=None):
         to=to_emails,
     )
 
-    # Attacher le fichier Excel
-    with open(filename, 'rb') as file:
-        email.attach(filename, file.read(), 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    # Attacher le fichier (lu depuis le disque au moment de l'envoi)
+    if filename:
+        email.attach_file(filename, mimetype)
 
     email.send()
 
 
 class Command(BaseCommand):
-    help = 'Exporte les données des fournisseurs vers un fichier Excel multi-feuilles et l\'envoie par email'
+    help = ('Exporte les données des fournisseurs (modifications depuis la dernière sauvegarde, '
+            'ou base complète) vers un fichier multi-feuilles et l\'envoie par email')
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -90,25 +137,86 @@ class Command(BaseCommand):
             action='append',
             help='Adresse email du destinataire (peut être spécifié plusieurs fois)',
         )
+        parser.add_argument(
+            '--complet',
+            action='store_true',
+            help='Exporter toute la base au lieu des seules modifications depuis la dernière sauvegarde',
+        )
+        parser.add_argument(
+            '--jours-complet',
+            type=int,
+            default=JOURS_ENTRE_SAUVEGARDES_COMPLETES,
+            help=f'Sauvegarde complète automatique si la dernière a plus de N jours '
+                 f'(défaut : {JOURS_ENTRE_SAUVEGARDES_COMPLETES})',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['xlsx', 'csv'],
+            default='xlsx',
+            help='Classeur XLSX (défaut) ou archive zip de fichiers CSV',
+        )
 
     def handle(self, *args, **options):
         try:
-            # Exporter les données vers Excel
-            filename = export_multisheet()
-            self.stdout.write(self.style.SUCCESS('Export multi-feuilles terminé'))
-
-            # Déterminer les destinataires
-            recipients = options['email'] if options['email'] else None
-
-            # Envoyer par email
-            subject = 'Export de la base de données fournisseurs'
-            body = 'Veuillez trouver ci-joint l\'export de la base de données fournisseurs.'
-
-            send_email_with_attachment(
-                filename=filename,
-                subject=subject,
-                body=body,
-                to_emails=recipients
+            debut = time.monotonic()
+            jusqu_a = timezone.now()
+            derniere = SauvegardeBdd.objects.order_by('-borne_fin').first()
+            # Les mises à jour en masse (update()) et les suppressions n'apparaissent pas
+            # dans la sauvegarde différentielle : une sauvegarde complète est refaite périodiquement
+            complet = (
+                options['complet']
+                or derniere is None
+                or not SauvegardeBdd.objects.filter(
+                    mode='complet', borne_fin__gte=jusqu_a - timedelta(days=options['jours_complet'])
+                ).exists()
+            )
+            depuis = None if complet else derniere.borne_fin
+            format_export = options['format']
+
+            with TemporaryDirectory() as dossier:
+                suffixe = 'complet' if complet else 'delta'
+                extension = 'xlsx' if format_export == 'xlsx' else 'zip'
+                filename = os.path.join(dossier, f'bdd_frs_{suffixe}_{jusqu_a:%Y%m%d_%H%M}.{extension}')
+
+                # Exporter les données
+                with open(filename, 'wb') as fichier:
+                    comptes = export_multisheet(fichier, depuis, jusqu_a, format_export)
+                total = sum(comptes.values())
+                detail = ', '.join(f'{nom} : {nombre}' for nom, nombre in comptes.items())
+                self.stdout.write(self.style.SUCCESS(
+                    f'Export {"complet" if complet else "différentiel"} terminé : {total} ligne(s) ({detail}), '
+                    f'{os.path.getsize(filename)} octets en {time.monotonic() - debut:.1f}s'
+                ))
+
+                # Déterminer les destinataires
+                recipients = options['email'] if options['email'] else None
+
+                # Envoyer par email
+                if complet:
+                    subject = 'Export de la base de données fournisseurs'
+                    body = 'Veuillez trouver ci-joint l\'export complet de la base de données fournisseurs.'
+                elif total:
+                    subject = 'Export des modifications de la base de données fournisseurs'
+                    body = (f'Veuillez trouver ci-joint les lignes modifiées depuis le '
+                            f'{timezone.localtime(depuis):%d/%m/%Y %H:%M} ({detail}).')
+                else:
+                    subject = 'Export des modifications de la base de données fournisseurs'
+                    body = f'Aucune modification depuis le {timezone.localtime(depuis):%d/%m/%Y %H:%M}.'
+
+                send_email_with_attachment(
+                    filename=filename if complet or total else None,
+                    subject=subject,
+                    body=body,
+                    to_emails=recipients,
+                    mimetype=TYPES_MIME[format_export],
+                )
+
+            # Point de reprise de la prochaine sauvegarde différentielle (après envoi réussi)
+            SauvegardeBdd.objects.create(
+                mode='complet' if complet else 'delta',
+                borne_debut=depuis,
+                borne_fin=jusqu_a,
+                lignes_exportees=total,
             )
 
             if recipients:
@@ -117,4 +225,4 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.SUCCESS('Fichier envoyé par email au destinataire par défaut'))
 
         except Exception as e:
-            self.stderr.write(self.style.ERROR(f'Erreur lors de l\'export: {str(e)}'))
\ No newline at end of file
+            self.stderr.write(self.style.ERROR(f'Erreur lors de l\'export: {str(e)}'))
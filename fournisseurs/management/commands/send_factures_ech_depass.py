@@ -15,9 +15,19 @@ from django.utils import timezone
 from django.utils.html import strip_tags
 from decouple import config
 
+from core.rapports import artefacts_inchanges, empreinte_donnees, enregistrer_artefact, envoi_inutile, marquer_envoyes
+
 class Command(BaseCommand):
     help = "Envoie les factures par email selon un critère."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--politique',
+            choices=['ignorer', 'toujours'],
+            default='ignorer',
+            help="ignorer (défaut) : pas de nouvel envoi si l'email est identique au dernier envoyé ; toujours : envoi systématique",
+        )
+
     def handle(self, *args, **options):
         # Vérifier si nous sommes un jour de week-end (samedi=5, dimanche=6)
         today = datetime.today().weekday()
@@ -46,6 +56,16 @@ class Command(BaseCommand):
         html_message = render_to_string('email/factures_impayees.html', context)
         plain_message = strip_tags(html_message)  # Version texte pour les clients mail simples
 
+        # Email identique au dernier envoyé (jours fériés, semaines calmes) : rien à renvoyer
+        cle = 'factures_echues_quotidien'
+        empreinte = empreinte_donnees(html_message)
+        artefact = artefacts_inchanges({cle: empreinte}).get(cle)
+        if envoi_inutile(artefact, options['politique']):
+            self.stdout.write(self.style.NOTICE("Factures inchangées depuis le dernier envoi : email non renvoyé"))
+            return
+        if artefact is None:
+            enregistrer_artefact(cle, empreinte, html=html_message)
+
         # Envoyer l'email
         to_emails = [email.strip() for email in config('TO_DESTINATAIRES_FACTURES', default='').split(',') if email.strip()]
         email = EmailMessage(
@@ -56,5 +76,6 @@ class Command(BaseCommand):
         )
         email.content_subtype = "html"  # Important pour le HTML
         email.send()
+        marquer_envoyes([cle])
 
         self.stdout.write(self.style.SUCCESS(f"{len(factures)} factures envoyées par email avec succès !"))
\ No newline at end of file
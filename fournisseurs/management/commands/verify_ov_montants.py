@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Commande Django: Contrôle (et corrige) le montant des ordres de virement.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from fournisseurs.models import OrdreVirement
+from fournisseurs.services import get_ecarts_montants_ov
+
+
+class Command(BaseCommand):
+    help = "Compare le montant de chaque ordre de virement à la somme des nets à payer de ses factures"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--corriger',
+            action='store_true',
+            help="Remplace les montants erronés par la somme des factures",
+        )
+
+    def handle(self, *args, **options):
+        ecarts = list(get_ecarts_montants_ov())
+
+        if not ecarts:
+            self.stdout.write(self.style.SUCCESS("Aucun écart : tous les montants d'OV sont cohérents."))
+            return
+
+        for ecart in ecarts:
+            self.stdout.write(
+                f"OV {ecart['reference'] or ecart['id']} : montant {ecart['montant']} "
+                f"- factures {ecart['total_factures']}"
+            )
+
+        if not options['corriger']:
+            self.stdout.write(self.style.WARNING(
+                f"{len(ecarts)} OV en écart. Relancer avec --corriger pour les rectifier."
+            ))
+            return
+
+        with transaction.atomic():
+            for ecart in ecarts:
+                OrdreVirement.objects.filter(pk=ecart['id']).update(montant=ecart['total_factures'])
+
+        self.stdout.write(self.style.SUCCESS(f"{len(ecarts)} montant(s) d'OV corrigé(s)."))
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:54
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fournisseurs', '0014_alter_ordrevirement_ov_remis_banque_pdf'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EcheancierFournisseur',
+            fields=[
+                ('beneficiaire', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='echeancier', serialize=False, to='fournisseurs.beneficiaire', verbose_name='Bénéficiaire')),
+                ('date_reference', models.DateField(verbose_name='Date de calcul des tranches')),
+                ('factures_en_retard', models.PositiveIntegerField(default=0)),
+                ('montant_retard', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('moins_une_semaine', models.PositiveIntegerField(default=0)),
+                ('montant_moins_une_semaine', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('moins_deux_semaines', models.PositiveIntegerField(default=0)),
+                ('montant_moins_deux_semaines', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('moins_un_mois', models.PositiveIntegerField(default=0)),
+                ('montant_moins_un_mois', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('plus_un_mois', models.PositiveIntegerField(default=0)),
+                ('montant_plus_un_mois', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('montant_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Échéancier fournisseur',
+                'verbose_name_plural': 'Échéanciers fournisseurs',
+            },
+        ),
+    ]
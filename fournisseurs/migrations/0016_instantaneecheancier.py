@@ -0,0 +1,47 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:55
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fournisseurs', '0015_echeancierfournisseur'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstantaneEcheancier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('factures_en_retard', models.PositiveIntegerField(default=0)),
+                ('montant_retard', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('moins_une_semaine', models.PositiveIntegerField(default=0)),
+                ('montant_moins_une_semaine', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('moins_deux_semaines', models.PositiveIntegerField(default=0)),
+                ('montant_moins_deux_semaines', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('moins_un_mois', models.PositiveIntegerField(default=0)),
+                ('montant_moins_un_mois', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('plus_un_mois', models.PositiveIntegerField(default=0)),
+                ('montant_plus_un_mois', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('montant_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('date_instantane', models.DateField(verbose_name="Date de l'instantané")),
+                ('beneficiaire', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='instantanes_echeancier', to='fournisseurs.beneficiaire', verbose_name='Bénéficiaire')),
+            ],
+            options={
+                'verbose_name': "Instantané de l'échéancier",
+                'verbose_name_plural': "Instantanés de l'échéancier",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='instantaneecheancier',
+            constraint=models.UniqueConstraint(fields=('date_instantane', 'beneficiaire'), name='unique_instantane_beneficiaire'),
+        ),
+        migrations.AddConstraint(
+            model_name='instantaneecheancier',
+            constraint=models.UniqueConstraint(condition=models.Q(('beneficiaire__isnull', True)), fields=('date_instantane',), name='unique_instantane_global'),
+        ),
+    ]
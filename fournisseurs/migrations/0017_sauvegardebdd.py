@@ -0,0 +1,29 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fournisseurs', '0016_instantaneecheancier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SauvegardeBdd',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.CharField(choices=[('complet', 'Complète'), ('delta', 'Différentielle')], max_length=10, verbose_name='Mode')),
+                ('borne_debut', models.DateTimeField(blank=True, null=True, verbose_name='Modifications depuis')),
+                ('borne_fin', models.DateTimeField(db_index=True, verbose_name="Modifications jusqu'au")),
+                ('lignes_exportees', models.PositiveIntegerField(default=0, verbose_name='Lignes exportées')),
+                ('date_sauvegarde', models.DateTimeField(auto_now_add=True, verbose_name='Date de la sauvegarde')),
+            ],
+            options={
+                'verbose_name': 'Sauvegarde de la base fournisseurs',
+                'verbose_name_plural': 'Sauvegardes de la base fournisseurs',
+                'get_latest_by': 'borne_fin',
+            },
+        ),
+    ]
@@ -159,8 +159,8 @@ class CompteTresorerie(AuditModel):
                 if qs.exists():
                     raise ValidationError({"rib": "Ce RIB est déjà utilisé par un autre bénéficiaire (non-nantissement)."})
             if self.pk and not self.est_nantissement:
-                old_instance = CompteTresorerie.objects.get(pk=self.pk)
-                if old_instance.rib != self.rib:
+                old_instance = self.etat_precedent
+                if old_instance and old_instance.rib != self.rib:
                     if OrdreVirement.objects.filter(compte_tresorerie=old_instance).exists():
                         raise ValidationError({"rib": "Ce RIB est déjà utilisé dans un ou plusieurs ordres de virement et ne peut pas être modifié."})
         elif self.type_compte == 'caisse':
@@ -266,6 +266,29 @@ class Contrat(AuditModel):
         if self.type_contrat != "commande" and not self.date_fin:
             raise ValidationError("La date de fin est obligatoire sauf pour les contrats de type 'bon de commande'.")
 
+# Champs de l'OV dont dépend le statut des factures associées
+CHAMPS_STATUT_OV = {
+    'valide_pour_signature', 'date_remise_banque', 'OV_remis_banque_pdf',
+    'remis_a_banque', 'date_operation_banque', 'compte_debite',
+}
+
+def statut_facture_pour_ov(ordre_virement):
+    """
+    Retourne le statut d'une facture rattachée à l'ordre de virement donné.
+
+    :param ordre_virement: L'ordre de virement de la facture (ou None).
+    :return: Code du statut (voir STATUT_FAC_CHOICES).
+    """
+    if not ordre_virement:
+        return 'attente'
+    if not ordre_virement.valide_pour_signature:
+        return 'etablissement'
+    if not ordre_virement.remis_a_banque:
+        return 'signature'
+    if not ordre_virement.compte_debite:
+        return 'banque'
+    return 'payee'
+
 # OrdreVirement
 class OrdreVirement(AuditModel):
     reference = models.CharField(
@@ -367,18 +390,29 @@ class OrdreVirement(AuditModel):
 
     def save(self, *args, **kwargs):
         raw = kwargs.get('raw', False)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not self._state.adding:
+            # Le montant est maintenu par des UPDATE atomiques depuis les factures :
+            # ne pas réécrire la valeur (possiblement périmée) portée par l'instance
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'montant'
+            ]
         with transaction.atomic():
             self.valider_modifications_si_remis_a_banque(raw=raw)
             self.mettre_a_jour_remis_a_banque()
             self.valider_modifications_si_compte_debite(raw=raw)
             super().save(*args, **kwargs)
-            self.mettre_a_jour_statut_factures()
+            # Un enregistrement partiel qui ne touche pas l'avancement de l'OV
+            # (montant, référence...) ne change pas le statut des factures
+            if update_fields is None or CHAMPS_STATUT_OV.intersection(update_fields):
+                self.mettre_a_jour_statut_factures()
 
     def valider_modifications_si_remis_a_banque(self, raw=False):
         if raw:
             return
-        if self.pk:
-            ancienne_instance = OrdreVirement.objects.get(pk=self.pk)
+        ancienne_instance = self.etat_precedent
+        if ancienne_instance:
             if ancienne_instance.remis_a_banque:
                 champs_modifiables = ['remis_a_banque','date_operation_banque','avis_debit_pdf','compte_debite']
                 verifier_modifications_autorisees(self, ancienne_instance, champs_modifiables)
@@ -386,8 +420,8 @@ class OrdreVirement(AuditModel):
     def valider_modifications_si_compte_debite(self, raw=False):
         if raw:
             return
-        if self.pk:
-            ancienne_instance = OrdreVirement.objects.get(pk=self.pk)
+        ancienne_instance = self.etat_precedent
+        if ancienne_instance:
             if ancienne_instance.compte_debite:
                 champs_modifiables = ['avis_debit_pdf','compte_debite']
                 verifier_modifications_autorisees(self, ancienne_instance, champs_modifiables)
@@ -397,18 +431,8 @@ class OrdreVirement(AuditModel):
             self.remis_a_banque = True
 
     def mettre_a_jour_statut_factures(self):
-        factures_associees = self.factures_ov.all()
-        if factures_associees.exists():
-            for facture in factures_associees:
-                if not self.valide_pour_signature:
-                    facture.statut = 'etablissement'
-                elif not self.remis_a_banque:
-                    facture.statut = 'signature'
-                elif not self.compte_debite:
-                    facture.statut = 'banque'
-                else:
-                    facture.statut = 'payee'
-                facture.save()
+        from fournisseurs.services import propager_statut_ov
+        propager_statut_ov(self)
 
 # Facture
 class BaseFacture(AuditModel):
@@ -441,16 +465,7 @@ class BaseFacture(AuditModel):
         abstract = True
 
     def update_statut(self):
-        if not self.ordre_virement:
-            self.statut = 'attente'
-        elif not self.ordre_virement.valide_pour_signature:
-            self.statut = 'etablissement'
-        elif not self.ordre_virement.remis_a_banque:
-            self.statut = 'signature'
-        elif not self.ordre_virement.compte_debite:
-            self.statut = 'banque'
-        else:
-            self.statut = 'payee'
+        self.statut = statut_facture_pour_ov(self.ordre_virement)
 
     def calculate_montants(self):
         pass
@@ -458,7 +473,9 @@ class BaseFacture(AuditModel):
     def save(self, *args, **kwargs):
         self.calculate_montants()
         self.update_statut()
-        super().save(*args, **kwargs)
+        # Les signaux reportent l'écart de net à payer sur l'OV dans la même transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
 class Facture(BaseFacture):
     beneficiaire = models.ForeignKey(
@@ -568,9 +585,9 @@ class Facture(BaseFacture):
         self.valider_modifications_si_virement_encours()
 
     def valider_modifications_si_virement_encours(self):
-        if self.pk:
-            ancienne_instance = Facture.objects.get(pk=self.pk)
-            if ancienne_instance.ordre_virement:
+        ancienne_instance = self.etat_precedent
+        if ancienne_instance:
+            if ancienne_instance.ordre_virement_id:
                 if not self.facture_pdf:
                     champs_modifiables = ['facture_pdf', 'statut']
                 else:
@@ -579,3 +596,131 @@ class Facture(BaseFacture):
 
     def __str__(self):
         return f"Facture {self.num_facture} - {self.beneficiaire.raison_sociale} (Statut: {self.get_statut_display()})"
+
+# Échéancier des factures non payées, matérialisé par bénéficiaire
+TRANCHES_ECHEANCE = (
+    ('factures_en_retard', 'montant_retard'),
+    ('moins_une_semaine', 'montant_moins_une_semaine'),
+    ('moins_deux_semaines', 'montant_moins_deux_semaines'),
+    ('moins_un_mois', 'montant_moins_un_mois'),
+    ('plus_un_mois', 'montant_plus_un_mois'),
+)
+
+def tranche_echeance(date_echeance, date_reference):
+    """
+    Retourne la tranche (nom du champ de comptage) d'une échéance à la date de référence :
+    en retard, ≤ 7 jours, ≤ 14 jours, ≤ 30 jours, au-delà.
+    """
+    jours = (date_echeance - date_reference).days
+    if jours < 0:
+        return 'factures_en_retard'
+    if jours <= 7:
+        return 'moins_une_semaine'
+    if jours <= 14:
+        return 'moins_deux_semaines'
+    if jours <= 30:
+        return 'moins_un_mois'
+    return 'plus_un_mois'
+
+class BaseEcheancier(models.Model):
+    """ Nombre et montant des factures non payées par tranche d'échéance. """
+    factures_en_retard = models.PositiveIntegerField(default=0)
+    montant_retard = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    moins_une_semaine = models.PositiveIntegerField(default=0)
+    montant_moins_une_semaine = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    moins_deux_semaines = models.PositiveIntegerField(default=0)
+    montant_moins_deux_semaines = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    moins_un_mois = models.PositiveIntegerField(default=0)
+    montant_moins_un_mois = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    plus_un_mois = models.PositiveIntegerField(default=0)
+    montant_plus_un_mois = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    total = models.PositiveIntegerField(default=0)
+    montant_total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        abstract = True
+
+class EcheancierFournisseur(BaseEcheancier):
+    """
+    Échéancier courant d'un bénéficiaire.
+
+    Tenu à jour par les signaux des factures (écarts par tranche) et recalculé chaque
+    nuit par la commande recalculer_echeancier_fournisseurs : les tranches dépendent
+    de date_reference, la date à laquelle elles ont été calculées.
+    """
+    beneficiaire = models.OneToOneField(
+        Beneficiaire,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='echeancier',
+        verbose_name="Bénéficiaire",
+    )
+    date_reference = models.DateField(verbose_name="Date de calcul des tranches")
+
+    class Meta:
+        verbose_name = "Échéancier fournisseur"
+        verbose_name_plural = "Échéanciers fournisseurs"
+
+    def __str__(self):
+        return f"Échéancier {self.beneficiaire_id} au {self.date_reference}"
+
+class InstantaneEcheancier(BaseEcheancier):
+    """
+    Photographie journalière de l'échéancier (historique en ajout seul).
+
+    Une ligne par bénéficiaire ayant des factures non payées et une ligne globale
+    (beneficiaire vide) par date ; écrite par la commande instantane_echeancier.
+    """
+    date_instantane = models.DateField(verbose_name="Date de l'instantané")
+    beneficiaire = models.ForeignKey(
+        Beneficiaire,
+        on_delete=models.CASCADE,
+        related_name='instantanes_echeancier',
+        verbose_name="Bénéficiaire",
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = "Instantané de l'échéancier"
+        verbose_name_plural = "Instantanés de l'échéancier"
+        constraints = [
+            UniqueConstraint(
+                fields=['date_instantane', 'beneficiaire'],
+                name='unique_instantane_beneficiaire'
+            ),
+            UniqueConstraint(
+                fields=['date_instantane'],
+                condition=models.Q(beneficiaire__isnull=True),
+                name='unique_instantane_global'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Instantané {self.beneficiaire_id or 'global'} du {self.date_instantane}"
+
+class SauvegardeBdd(models.Model):
+    """
+    Exécution réussie de la commande sauvgarde_bdd_frs.
+
+    borne_fin sert de point de reprise : la sauvegarde différentielle suivante
+    n'exporte que les lignes modifiées (updated_at) après cette date.
+    """
+    MODES = [
+        ('complet', 'Complète'),
+        ('delta', 'Différentielle'),
+    ]
+
+    mode = models.CharField(max_length=10, choices=MODES, verbose_name="Mode")
+    borne_debut = models.DateTimeField(null=True, blank=True, verbose_name="Modifications depuis")
+    borne_fin = models.DateTimeField(db_index=True, verbose_name="Modifications jusqu'au")
+    lignes_exportees = models.PositiveIntegerField(default=0, verbose_name="Lignes exportées")
+    date_sauvegarde = models.DateTimeField(auto_now_add=True, verbose_name="Date de la sauvegarde")
+
+    class Meta:
+        verbose_name = "Sauvegarde de la base fournisseurs"
+        verbose_name_plural = "Sauvegardes de la base fournisseurs"
+        get_latest_by = 'borne_fin'
+
+    def __str__(self):
+        return f"Sauvegarde {self.get_mode_display().lower()} jusqu'au {self.borne_fin:%d/%m/%Y %H:%M}"
@@ -0,0 +1,499 @@
+# fournisseurs/pdf.py
+"""
+Génération et cache des PDF d'ordre de virement.
+
+Le PDF est dessiné à partir d'un dictionnaire de données simples (collecter_donnees_ov),
+ce qui permet d'en dériver une clé de contenu : tant que l'OV, ses comptes et ses
+factures ne changent pas, le même fichier est resservi depuis le stockage.
+
+Le même dictionnaire est transmis tel quel aux processus de rendu en lot
+(generer_lot_ov_pdf), qui n'ont besoin ni de la base ni des modèles.
+"""
+import hashlib
+import json
+import logging
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from decimal import Decimal
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PyPDF2 import PdfWriter
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from utils.conversions import nombre_en_toutes_lettres
+
+logger = logging.getLogger(__name__)
+
+# À incrémenter à chaque modification du dessin : les PDF en cache sont alors régénérés
+VERSION_GABARIT_OV = 1
+DOSSIER_CACHE_OV = 'ov_pdf_cache'
+
+
+def chemin_logo():
+    return os.path.join(settings.MEDIA_ROOT, 'img', 'Logo ST PNG.png')
+
+
+@lru_cache(maxsize=4)
+def _charger_logo(path, mtime):
+    return ImageReader(path)
+
+
+def charger_logo():
+    """ Retourne le logo décodé (une fois par processus et par version du fichier), ou None. """
+    path = chemin_logo()
+    if not os.path.exists(path):
+        logger.warning(f"Logo non trouvé à l'emplacement : {path}")
+        return None
+    return _charger_logo(path, os.path.getmtime(path))
+
+
+def collecter_donnees_ovs(ordre_virement_ids):
+    """
+    Rassemble tout ce que les PDF affichent pour plusieurs OV, en deux requêtes.
+
+    Returns:
+        dict: {id de l'OV: données sérialisables (montants en chaînes) de l'OV et de ses factures}
+    """
+    # Import local : les processus de rendu (generer_lot_ov_pdf) importent ce module sans les modèles
+    from .models import Facture, OrdreVirement
+
+    ordres_virement = OrdreVirement.objects.select_related(
+        'beneficiaire', 'compte_tresorerie', 'compte_tresorerie_emetteur__beneficiaire',
+    ).filter(pk__in=ordre_virement_ids)
+
+    factures_par_ov = {}
+    factures = Facture.objects.filter(ordre_virement_id__in=ordre_virement_ids).order_by('id').values_list(
+        'ordre_virement_id', 'num_facture', 'date_facture', 'montant_ttc', 'mnt_net_apayer'
+    )
+    for ordre_virement_id, num_facture, date_facture, montant_ttc, mnt_net_apayer in factures:
+        factures_par_ov.setdefault(ordre_virement_id, []).append({
+            'num_facture': num_facture,
+            'date_facture': date_facture.strftime('%d/%m/%Y'),
+            'montant_ttc': str(montant_ttc),
+            'mnt_net_apayer': str(mnt_net_apayer),
+        })
+
+    donnees = {}
+    for ordre_virement in ordres_virement:
+        emetteur = ordre_virement.compte_tresorerie_emetteur
+        compte = ordre_virement.compte_tresorerie
+        donnees[ordre_virement.pk] = {
+            'id': ordre_virement.pk,
+            'reference': ordre_virement.reference,
+            'mode_execution': ordre_virement.mode_execution,
+            'montant': str(ordre_virement.montant),
+            'beneficiaire': ordre_virement.beneficiaire.raison_sociale,
+            'emetteur': {
+                'banque': emetteur.banque,
+                'raison_sociale': emetteur.beneficiaire.raison_sociale,
+                'rib': emetteur.rib,
+            } if emetteur else None,
+            'compte': {
+                'type_compte': compte.type_compte,
+                'banque': compte.banque,
+                'rib': compte.rib,
+                'nom_caisse': compte.nom_caisse,
+                'detenteur_caisse': compte.detenteur_caisse,
+            },
+            'factures': factures_par_ov.get(ordre_virement.pk, []),
+        }
+    return donnees
+
+
+def collecter_donnees_ov(ordre_virement_id):
+    """
+    Rassemble tout ce que le PDF d'un OV affiche.
+
+    Raises:
+        OrdreVirement.DoesNotExist: OV inconnu
+    """
+    from .models import OrdreVirement
+
+    donnees = collecter_donnees_ovs([ordre_virement_id])
+    if ordre_virement_id not in donnees:
+        raise OrdreVirement.DoesNotExist(f"Ordre de virement {ordre_virement_id} introuvable")
+    return donnees[ordre_virement_id]
+
+
+def cle_cache_ov(donnees):
+    """ Empreinte SHA-256 des données affichées, du gabarit et de la version du logo. """
+    path = chemin_logo()
+    logo = os.path.getmtime(path) if os.path.exists(path) else None
+    contenu = json.dumps(
+        {'gabarit': VERSION_GABARIT_OV, 'logo': logo, 'donnees': donnees},
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(contenu.encode('utf-8')).hexdigest()
+
+
+def dossier_cache_ov(ordre_virement_id):
+    return f"{DOSSIER_CACHE_OV}/{ordre_virement_id}"
+
+
+def dessiner_ov_pdf(donnees, logo=None):
+    """
+    Dessine le PDF de l'ordre de virement (page de l'ordre + annexe des factures).
+
+    Args:
+        donnees: dictionnaire produit par collecter_donnees_ov
+        logo: ImageReader déjà décodé (optionnel)
+
+    Returns:
+        bytes: contenu du PDF
+    """
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    emetteur = donnees['emetteur']
+    compte = donnees['compte']
+
+    # **Ajouter le logo**
+    if logo is not None:
+        logo_width, logo_height = 50 * mm, 20 * mm  # Redimensionner le logo (50mm de large, 20mm de haut)
+        p.drawImage(logo, 50, height - 50 - logo_height, width=logo_width, height=logo_height, mask='auto')
+
+    # 📄 **Première page : Détails de l'ordre de virement**
+    y_position = height - 100  # Départ du texte
+    line_spacing = 35  # Espacement des lignes
+    y_position -= line_spacing
+
+    # Définir la police en gras
+    p.setFont("Helvetica-Bold", 14)
+    p.setFillColor("blue")
+    p.drawString(200, y_position, f"Ordre de virement n° : {donnees['reference']}")
+    p.setFillColor("black")
+    p.setFont("Helvetica", 12)
+    y_position -= line_spacing
+    y_position -= line_spacing/2
+    p.drawString(100, y_position, "Guichet : ")
+    p.setFillColor("blue")
+    p.drawString(180, y_position, emetteur['banque'])
+    p.setFillColor("black")
+    y_position -= line_spacing
+    p.drawString(100, y_position, "Nom du donneur d’ordre : ")
+    p.setFillColor("blue")
+    p.drawString(270, y_position, emetteur['raison_sociale'])
+    p.setFillColor("black")
+    y_position -= line_spacing
+    p.drawString(100, y_position, "Veuillez virer par le débit de mon compte n° : ")
+    p.setFillColor("blue")
+    p.drawString(370, y_position, emetteur['rib'])
+    p.setFillColor("black")
+    y_position -= line_spacing
+    p.drawString(100, y_position, "La somme de : ")
+    p.setFillColor("blue")
+    p.drawString(200, y_position, f"{donnees['montant']} DH")
+    y_position -= line_spacing/2
+    p.drawString(120, y_position, f"{nombre_en_toutes_lettres(Decimal(donnees['montant']))}")
+    p.setFillColor("black")
+    y_position -= line_spacing
+    p.drawString(100, y_position, "En faveur de : ")
+    p.setFillColor("blue")
+    p.drawString(200, y_position, donnees['beneficiaire'])
+    p.setFillColor("black")
+    y_position -= line_spacing
+
+    if compte['type_compte'] == "bancaire":
+        p.drawString(100, y_position, "Domicilié chez : ")
+        p.setFillColor("blue")
+        p.drawString(230, y_position, compte['banque'])
+        p.setFillColor("black")
+        y_position -= line_spacing
+        p.drawString(100, y_position, "Compte n° : ")
+        p.setFillColor("blue")
+        p.drawString(200, y_position, compte['rib'])
+        p.setFillColor("black")
+    elif compte['type_compte'] == "caisse":
+        p.drawString(100, y_position, "Nom caisse : ")
+        p.setFillColor("blue")
+        p.drawString(200, y_position, compte['nom_caisse'])
+        p.setFillColor("black")
+        y_position -= line_spacing
+        p.drawString(100, y_position, "Détenteur caisse : ")
+        p.setFillColor("blue")
+        p.drawString(230, y_position, compte['detenteur_caisse'])
+        p.setFillColor("black")
+
+    y_position -= line_spacing
+    # Générer la liste formatée des factures
+    factures = donnees['factures']
+    factures_text = ", ".join(
+        f"({facture['num_facture']}, {Decimal(facture['montant_ttc']):.2f} DH, {Decimal(facture['mnt_net_apayer']):.2f} DH)"
+        for facture in factures
+    )
+
+    # Vérifier si la liste est vide
+    p.drawString(100, y_position, "Instruction particulières : ")
+    instruction_color = "black" if not factures_text else "blue"
+    y_position -= line_spacing
+
+    # Définir la couleur pour le texte des factures
+    p.setFillColor(instruction_color)
+
+    # Découper factures_text en plusieurs lignes si nécessaire
+    max_chars_per_line = 80  # Ajuster en fonction de la largeur disponible
+    lines = []
+    while len(factures_text) > max_chars_per_line:
+        split_index = factures_text[:max_chars_per_line].rfind(",")  # Trouver la dernière virgule avant la limite
+        if split_index == -1:  # Si aucune virgule trouvée, couper directement
+            split_index = max_chars_per_line
+        lines.append(factures_text[:split_index])
+        factures_text = factures_text[split_index + 1:]
+
+    lines.append(factures_text)  # Ajouter la dernière partie restante
+
+    # Afficher chaque ligne séparément avec un léger décalage
+    for line in lines:
+        p.drawString(120, y_position, line.strip())
+        y_position -= line_spacing/2
+    y_position -= line_spacing/2
+
+    # Remettre la couleur en noir pour les textes suivants
+    p.setFillColor("black")
+
+    p.drawString(100, y_position, "Mode de virement : ")
+    p.setFillColor("blue")
+    p.drawString(250, y_position, "Normal")
+    p.setFillColor("black")
+
+    # Espace pour signatures
+    y_position -= 2 * line_spacing
+    p.line(100, y_position, 250, y_position)  # Signature 1
+    p.drawString(100, y_position - 20, "Signature Trésorier")
+    p.line(350, y_position, 500, y_position)  # Signature 2
+    p.drawString(350, y_position - 20, "Signature Donneur d'Ordre")
+
+    # Ajouter "A ne pas adresser à la banque" si le mode est en masse
+    if donnees['mode_execution'] == 'MASSE':
+        y_position -= 80  # Espace supplémentaire après les signatures
+        p.setFont("Helvetica-Bold", 16)  # Police en gras
+        p.setFillColorRGB(1, 0, 0)  # Couleur rouge (RGB)
+        p.drawString(200, y_position, "--------------------------------------------------")
+        p.setFillColor("black")
+        y_position -= 20
+        p.drawString(200, y_position, "OV exécuté par voie électronique")
+        y_position -= 20
+        p.drawString(210, y_position, "A ne pas remettre à la banque.")
+        y_position -= 20
+        p.setFillColorRGB(1, 0, 0)  # Couleur rouge (RGB)
+        p.drawString(200, y_position, "--------------------------------------------------")
+        p.setFillColor("black")  # Remettre la couleur par défaut
+
+    p.showPage()
+
+    # 📄 **Seconde page : Liste des factures**
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(100, 800, f"Annexe : Liste des factures liées à l'OV {donnees['reference']}")
+    p.setFont("Helvetica", 12)
+    y_position = 770
+
+    total_ttc = 0
+    total_net = 0
+
+    if not factures:
+        p.drawString(100, y_position, "Aucune facture associée à cet ordre de virement.")
+    else:
+        # 🏷️ **En-tête du tableau**
+        p.setFont("Helvetica-Bold", 12)
+        p.drawString(100, y_position, "Numéro Facture")
+        p.drawString(220, y_position, "Date Facture")
+        p.drawString(340, y_position, "Montant TTC (DH)")
+        p.drawString(460, y_position, "Net à Payer (DH)")
+        p.line(100, y_position - 5, 500, y_position - 5)
+        y_position -= 25
+
+        p.setFont("Helvetica", 12)
+        for facture in factures:
+            if y_position < 100:  # Nouvelle page si nécessaire
+                p.showPage()
+                p.setFont("Helvetica-Bold", 12)
+                p.drawString(100, 800, "Annexe (suite) : Liste des factures liées")
+                y_position = 770
+
+            montant_ttc = Decimal(facture['montant_ttc'])
+            mnt_net_apayer = Decimal(facture['mnt_net_apayer'])
+            p.drawString(100, y_position, facture['num_facture'])
+            p.drawString(220, y_position, facture['date_facture'])
+            p.drawString(340, y_position, f"{montant_ttc:.2f}")
+            p.drawString(460, y_position, f"{mnt_net_apayer:.2f}")
+
+            total_ttc += montant_ttc
+            total_net += mnt_net_apayer
+
+            y_position -= 20
+
+        # Vérifier si on a assez de place pour afficher le total
+        if y_position < 100:
+            p.showPage()
+            p.setFont("Helvetica-Bold", 12)
+            p.drawString(100, 800, "Annexe (suite) : Liste des factures liées")
+            y_position = 770
+
+        # Affichage du total
+        p.setFont("Helvetica-Bold", 12)
+        p.line(100, y_position - 5, 500, y_position - 5)  # Ligne de séparation
+        y_position -= 20
+        p.drawString(100, y_position, "Total")
+        p.drawString(340, y_position, f"{total_ttc:.2f}")
+        p.drawString(460, y_position, f"{total_net:.2f}")
+
+    p.showPage()
+    p.save()
+
+    pdf = buffer.getvalue()
+    buffer.close()
+    return pdf
+
+
+def chemin_cache_ov(donnees):
+    return f"{dossier_cache_ov(donnees['id'])}/{cle_cache_ov(donnees)}.pdf"
+
+
+def lire_cache_ov(donnees):
+    """ Retourne le PDF en cache correspondant à ces données, ou None. """
+    chemin = chemin_cache_ov(donnees)
+    if not default_storage.exists(chemin):
+        return None
+    with default_storage.open(chemin, 'rb') as fichier:
+        return fichier.read()
+
+
+def ecrire_cache_ov(donnees, pdf):
+    """ Enregistre un PDF dans le cache, à la place des anciens rendus de l'OV. """
+    invalider_cache_ov(donnees['id'])
+    default_storage.save(chemin_cache_ov(donnees), ContentFile(pdf))
+
+
+def get_ov_pdf(ordre_virement_id, donnees=None):
+    """
+    Retourne le PDF de l'OV depuis le cache, en le dessinant s'il n'y est pas.
+
+    Un nouveau rendu remplace les anciens fichiers de l'OV dans le cache.
+
+    Returns:
+        bytes: contenu du PDF
+    """
+    if donnees is None:
+        donnees = collecter_donnees_ov(ordre_virement_id)
+
+    pdf = lire_cache_ov(donnees)
+    if pdf is None:
+        pdf = dessiner_ov_pdf(donnees, charger_logo())
+        ecrire_cache_ov(donnees, pdf)
+    return pdf
+
+
+def invalider_cache_ov(ordre_virement_id):
+    """ Supprime les PDF en cache d'un ordre de virement. """
+    if not ordre_virement_id:
+        return
+    dossier = dossier_cache_ov(ordre_virement_id)
+    try:
+        _, fichiers = default_storage.listdir(dossier)
+    except FileNotFoundError:
+        return
+    for nom in fichiers:
+        default_storage.delete(f"{dossier}/{nom}")
+
+
+def pre_generer_ov_pdf(ordre_virement_id):
+    """ Met en cache le PDF d'un OV (appelé après la validation pour signature). """
+    try:
+        get_ov_pdf(ordre_virement_id)
+    except Exception:
+        logger.exception(f"Pré-génération du PDF de l'OV {ordre_virement_id} impossible")
+
+
+# Rendu en lot -----------------------------------------------------------------
+
+_logo_worker = None
+
+
+def _initialiser_worker(logo_path):
+    """ Initialise un processus de rendu : le logo est décodé une seule fois par processus. """
+    global _logo_worker
+    _logo_worker = ImageReader(logo_path) if logo_path and os.path.exists(logo_path) else None
+
+
+def _dessiner_worker(donnees):
+    return dessiner_ov_pdf(donnees, _logo_worker)
+
+
+def _dessiner_en_parallele(lot, max_workers):
+    """ Dessine les PDF d'un lot de données, en parallèle sur plusieurs processus si possible. """
+    if len(lot) < 2 or max_workers == 1:
+        logo = charger_logo()
+        return [dessiner_ov_pdf(donnees, logo) for donnees in lot]
+
+    path = chemin_logo()
+    try:
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_initialiser_worker, initargs=(path,),
+        ) as executor:
+            # Découpage en paquets pour limiter les allers-retours entre processus
+            chunksize = max(1, len(lot) // ((max_workers or os.cpu_count() or 1) * 4))
+            return list(executor.map(_dessiner_worker, lot, chunksize=chunksize))
+    except (OSError, NotImplementedError, BrokenProcessPool) as e:
+        # Hébergement sans multiprocessing (ou pool interrompu) : rendu séquentiel
+        logger.warning(f"Rendu parallèle des OV indisponible ({e}), rendu séquentiel")
+        logo = charger_logo()
+        return [dessiner_ov_pdf(donnees, logo) for donnees in lot]
+
+
+def generer_lot_ov_pdf(ordre_virement_ids, format_sortie='pdf', max_workers=None):
+    """
+    Produit les PDF de plusieurs OV dans un seul document (PDF fusionné ou archive ZIP).
+
+    Les données sont collectées en deux requêtes ; les OV déjà en cache sont relus,
+    les autres sont dessinés en parallèle dans un pool de processus (un par cœur par
+    défaut) puis mis en cache.
+
+    Args:
+        ordre_virement_ids: Identifiants des OV, dans l'ordre voulu du document
+        format_sortie: 'pdf' (document fusionné) ou 'zip' (un fichier par OV)
+        max_workers: Nombre de processus de rendu (défaut : nombre de cœurs)
+
+    Returns:
+        tuple: (contenu en bytes, liste des OV ignorés faute de compte émetteur)
+    """
+    if format_sortie not in ('pdf', 'zip'):
+        raise ValueError(f"Format de sortie inconnu : {format_sortie}")
+
+    donnees_par_ov = collecter_donnees_ovs(ordre_virement_ids)
+    ordre = [pk for pk in ordre_virement_ids if pk in donnees_par_ov]
+    ignores = [pk for pk in ordre if not donnees_par_ov[pk]['emetteur']]
+    ordre = [pk for pk in ordre if pk not in ignores]
+
+    pdfs = {}
+    a_dessiner = []
+    for pk in ordre:
+        pdf = lire_cache_ov(donnees_par_ov[pk])
+        if pdf is None:
+            a_dessiner.append(donnees_par_ov[pk])
+        else:
+            pdfs[pk] = pdf
+
+    for donnees, pdf in zip(a_dessiner, _dessiner_en_parallele(a_dessiner, max_workers)):
+        ecrire_cache_ov(donnees, pdf)
+        pdfs[donnees['id']] = pdf
+
+    sortie = BytesIO()
+    if format_sortie == 'zip':
+        with zipfile.ZipFile(sortie, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for pk in ordre:
+                archive.writestr(f"ordre_virement_{donnees_par_ov[pk]['reference'] or pk}.pdf", pdfs[pk])
+    else:
+        writer = PdfWriter()
+        for pk in ordre:
+            writer.append(BytesIO(pdfs[pk]))
+        writer.write(sortie)
+    return sortie.getvalue(), ignores
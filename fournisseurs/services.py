@@ -1,6 +1,19 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
-from .models import Facture, Contrat
+from decimal import Decimal
+from django.db.models import Count, DecimalField, F, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from core.choices import STATUT_FAC_CHOICES
+from core.middleware import CurrentUserMiddleware
+from .filters import get_factures_queryset
+from .models import (
+    Facture, Contrat, OrdreVirement, EcheancierFournisseur, InstantaneEcheancier, TRANCHES_ECHEANCE,
+    statut_facture_pour_ov, tranche_echeance,
+)
+
+STATUT_FAC_LIBELLES = dict(STATUT_FAC_CHOICES)
 
 
 def get_suppliers_invoices_data():
@@ -117,3 +130,410 @@ def get_suppliers_unsettled_po_data():
         'nombre_contrats': len(enriched_contrats),
         'taux_avancement_global': (total_factures / total_contrats * 100) if total_contrats > 0 else 0,
     }
+
+
+def get_factures_picker_data(beneficiaire_id, ordre_virement_id=None, statut=None,
+                             echeance_min=None, echeance_max=None, page=1, page_size=50):
+    """
+    Collecte les factures affectables à un ordre de virement pour le sélecteur du formulaire OV.
+
+    Les libellés de statut viennent de STATUT_FAC_CHOICES (pas de requête par ligne) ;
+    les totaux et le nombre de lignes sont calculés en une seule agrégation, la page
+    courante en une seule requête `values()`.
+
+    Args:
+        beneficiaire_id: Bénéficiaire dont on liste les factures en attente
+        ordre_virement_id: OV en cours d'édition (ses factures sont incluses)
+        statut: Filtre optionnel sur le statut de la facture
+        echeance_min: Date d'échéance minimale (incluse)
+        echeance_max: Date d'échéance maximale (incluse)
+        page: Numéro de page (à partir de 1)
+        page_size: Nombre de factures par page
+
+    Returns:
+        dict: factures de la page, totaux, pagination, montant courant de l'OV
+        et identifiants de toutes les factures qui lui sont affectées
+    """
+    factures = get_factures_queryset(beneficiaire_id, ordre_virement_id)
+    if statut:
+        factures = factures.filter(statut=statut)
+    if echeance_min:
+        factures = factures.filter(date_echeance__gte=echeance_min)
+    if echeance_max:
+        factures = factures.filter(date_echeance__lte=echeance_max)
+
+    selection = Q(ordre_virement_id=ordre_virement_id) if ordre_virement_id else Q(pk__in=[])
+    totaux = factures.aggregate(
+        nombre=Count('id'),
+        total_ttc=Sum('montant_ttc'),
+        total_net=Sum('mnt_net_apayer'),
+        nombre_selection=Count('id', filter=selection),
+        montant_selection=Sum('mnt_net_apayer', filter=selection),
+    )
+
+    nombre = totaux['nombre']
+    nb_pages = max((nombre + page_size - 1) // page_size, 1)
+    page = min(max(page, 1), nb_pages)
+    debut = (page - 1) * page_size
+
+    lignes = factures.order_by('date_echeance', 'id').values(
+        'id', 'num_facture', 'montant_ttc', 'mnt_net_apayer', 'date_echeance', 'ordre_virement', 'statut'
+    )[debut:debut + page_size]
+
+    factures_list = []
+    for facture in lignes:
+        facture['statut_display'] = STATUT_FAC_LIBELLES.get(facture['statut'], facture['statut'])
+        factures_list.append(facture)
+
+    ov_montant = None
+    selection_ids = []
+    if ordre_virement_id:
+        ov_montant = OrdreVirement.objects.filter(pk=ordre_virement_id).values_list('montant', flat=True).first()
+        # Sélection complète (toutes pages) : le formulaire renvoie l'ensemble voulu
+        selection_ids = list(
+            Facture.objects.filter(ordre_virement_id=ordre_virement_id).order_by('id').values_list('id', flat=True)
+        )
+
+    return {
+        'factures': factures_list,
+        'page': page,
+        'nb_pages': nb_pages,
+        'page_size': page_size,
+        'nombre_factures': nombre,
+        'totaux': {
+            'montant_ttc': totaux['total_ttc'] or Decimal('0.00'),
+            'mnt_net_apayer': totaux['total_net'] or Decimal('0.00'),
+            'nombre_selection': totaux['nombre_selection'],
+            'montant_selection': totaux['montant_selection'] or Decimal('0.00'),
+        },
+        'ov_montant': ov_montant,
+        'selection_ids': selection_ids,
+    }
+
+
+def propager_statut_ov(ordre_virement):
+    """
+    Applique aux factures d'un ordre de virement le statut correspondant à son avancement.
+
+    Le statut est déterminé une seule fois pour l'OV puis appliqué par un UPDATE unique,
+    sans passer par Facture.save() : les montants des factures ne changent pas, donc ni
+    calculate_montants ni la mise à jour du montant de l'OV ne sont nécessaires. Quand
+    l'OV est débité, la date de paiement des factures est renseignée dans le même UPDATE.
+
+    Args:
+        ordre_virement: L'ordre de virement enregistré
+
+    Returns:
+        int: Nombre de factures modifiées
+    """
+    statut = statut_facture_pour_ov(ordre_virement)
+    modifications = {
+        'statut': statut,
+        'updated_at': timezone.now(),
+        'updated_by': CurrentUserMiddleware.get_current_user(),
+    }
+    deja_a_jour = Q(statut=statut)
+
+    if ordre_virement.compte_debite:
+        modifications['date_paiement'] = ordre_virement.date_operation_banque
+        deja_a_jour &= Q(date_paiement=ordre_virement.date_operation_banque)
+
+    nb_factures = Facture.objects.filter(ordre_virement=ordre_virement).exclude(deja_a_jour).update(**modifications)
+
+    # Entrée ou sortie du statut "payée" (débit, ou débit annulé) : l'échéancier change
+    if nb_factures and (statut == 'payee' or ordre_virement.remis_a_banque):
+        reconstruire_echeancier([ordre_virement.beneficiaire_id])
+    return nb_factures
+
+
+def appliquer_selection_factures_ov(ordre_virement_id, facture_ids):
+    """
+    Aligne les factures d'un ordre de virement sur l'ensemble voulu.
+
+    L'OV est verrouillé (SELECT ... FOR UPDATE) le temps de calculer les ajouts et
+    retraits, appliqués par UPDATE en masse dans la même transaction : le nombre de
+    requêtes ne dépend pas du nombre de factures cochées ou décochées.
+
+    Args:
+        ordre_virement_id: Identifiant de l'OV
+        facture_ids: Ensemble complet des factures qui doivent lui être affectées
+
+    Returns:
+        dict: montant recalculé de l'OV, nombres d'ajouts/retraits et nouveaux
+        statuts des factures modifiées
+
+    Raises:
+        OrdreVirement.DoesNotExist: OV inconnu
+        ValidationError: OV remis à la banque ou facture non affectable
+    """
+    voulues = set(facture_ids)
+
+    with transaction.atomic():
+        ordre_virement = OrdreVirement.objects.select_for_update().get(pk=ordre_virement_id)
+        if ordre_virement.remis_a_banque:
+            raise ValidationError("L'ordre de virement est remis à la banque : ses factures ne peuvent plus changer.")
+
+        actuelles = set(ordre_virement.factures_ov.values_list('id', flat=True))
+        ajouts = voulues - actuelles
+        retraits = actuelles - voulues
+
+        if ajouts:
+            affectables = set(
+                get_factures_queryset(ordre_virement.beneficiaire_id, ordre_virement.pk)
+                .filter(pk__in=ajouts).values_list('id', flat=True)
+            )
+            refusees = ajouts - affectables
+            if refusees:
+                raise ValidationError(
+                    f"Factures non affectables à cet ordre de virement : {', '.join(map(str, sorted(refusees)))}"
+                )
+
+        maintenant = timezone.now()
+        utilisateur = CurrentUserMiddleware.get_current_user()
+        if retraits:
+            Facture.objects.filter(pk__in=retraits).update(
+                ordre_virement=None, statut='attente', date_paiement=None,
+                updated_at=maintenant, updated_by=utilisateur,
+            )
+        if ajouts:
+            Facture.objects.filter(pk__in=ajouts).update(
+                ordre_virement=ordre_virement, updated_at=maintenant, updated_by=utilisateur,
+            )
+            # Statut (et date de paiement si l'OV est débité) des factures ajoutées
+            propager_statut_ov(ordre_virement)
+
+        montant = recalculer_montant_ov(ordre_virement)
+
+    statut = statut_facture_pour_ov(ordre_virement)
+    statuts = {facture_id: statut for facture_id in ajouts}
+    statuts.update({facture_id: 'attente' for facture_id in retraits})
+    return {
+        'montant': montant,
+        'nombre_ajouts': len(ajouts),
+        'nombre_retraits': len(retraits),
+        'statuts': statuts,
+    }
+
+
+def appliquer_delta_montant_ov(ordre_virement_id, delta):
+    """
+    Ajoute un écart au montant d'un ordre de virement par un UPDATE atomique.
+
+    L'expression F('montant') + delta est évaluée par la base : deux enregistrements
+    concurrents de factures du même OV cumulent leurs écarts au lieu de s'écraser.
+
+    Args:
+        ordre_virement_id: Identifiant de l'OV (None : rien à faire)
+        delta: Écart à appliquer (Decimal, positif ou négatif)
+    """
+    if not ordre_virement_id or not delta:
+        return
+    OrdreVirement.objects.filter(pk=ordre_virement_id).update(montant=F('montant') + delta)
+
+
+def recalculer_montant_ov(ordre_virement):
+    """
+    Recalcule le montant d'un OV à partir de ses factures.
+
+    Réservé aux chemins qui contournent les signaux (QuerySet.update en masse) ;
+    les enregistrements unitaires de factures passent par appliquer_delta_montant_ov.
+
+    Returns:
+        Decimal: Le montant recalculé
+    """
+    total = ordre_virement.factures_ov.aggregate(total=Sum('mnt_net_apayer'))['total'] or Decimal('0.00')
+    OrdreVirement.objects.filter(pk=ordre_virement.pk).update(montant=total)
+    ordre_virement.montant = total
+    return total
+
+
+def get_ecarts_montants_ov():
+    """
+    Liste les ordres de virement dont le montant diffère de la somme de leurs factures.
+
+    Une seule requête GROUP BY sur l'ensemble des OV.
+
+    Returns:
+        QuerySet de dicts {id, reference, montant, total_factures}
+    """
+    return (
+        OrdreVirement.objects
+        .annotate(total_factures=Coalesce(
+            Sum('factures_ov__mnt_net_apayer'),
+            Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ))
+        .exclude(montant=F('total_factures'))
+        .values('id', 'reference', 'montant', 'total_factures')
+        .order_by('id')
+    )
+
+
+CHAMPS_ECHEANCIER = ['total', 'montant_total'] + [champ for tranche in TRANCHES_ECHEANCE for champ in tranche]
+
+
+def _agregats_echeancier(date_reference):
+    """ Agrégats conditionnels (nombre et montant) de chaque tranche à la date de référence. """
+    bornes = {
+        'factures_en_retard': Q(date_echeance__lt=date_reference),
+        'moins_une_semaine': Q(date_echeance__gte=date_reference, date_echeance__lte=date_reference + timedelta(days=7)),
+        'moins_deux_semaines': Q(date_echeance__gt=date_reference + timedelta(days=7),
+                                 date_echeance__lte=date_reference + timedelta(days=14)),
+        'moins_un_mois': Q(date_echeance__gt=date_reference + timedelta(days=14),
+                           date_echeance__lte=date_reference + timedelta(days=30)),
+        'plus_un_mois': Q(date_echeance__gt=date_reference + timedelta(days=30)),
+    }
+    agregats = {'total': Count('id'), 'montant_total': Sum('mnt_net_apayer')}
+    for champ_nombre, champ_montant in TRANCHES_ECHEANCE:
+        agregats[champ_nombre] = Count('id', filter=bornes[champ_nombre])
+        agregats[champ_montant] = Sum('mnt_net_apayer', filter=bornes[champ_nombre])
+    return agregats
+
+
+def reconstruire_echeancier(beneficiaire_ids=None):
+    """
+    Recalcule l'échéancier des bénéficiaires indiqués (tous par défaut) à la date du jour.
+
+    Une seule requête GROUP BY sur les factures non payées ; les bénéficiaires sans
+    facture non payée n'ont pas de ligne.
+
+    Returns:
+        int: Nombre de lignes écrites
+    """
+    aujourdhui = timezone.now().date()
+    factures = Facture.objects.exclude(statut='payee')
+    echeanciers = EcheancierFournisseur.objects.all()
+    if beneficiaire_ids is not None:
+        factures = factures.filter(beneficiaire_id__in=beneficiaire_ids)
+        echeanciers = echeanciers.filter(beneficiaire_id__in=beneficiaire_ids)
+
+    lignes = factures.order_by().values('beneficiaire_id').annotate(**_agregats_echeancier(aujourdhui))
+    nouveaux = [
+        EcheancierFournisseur(
+            date_reference=aujourdhui,
+            **{champ: valeur if valeur is not None else Decimal('0.00') for champ, valeur in ligne.items()}
+        )
+        for ligne in lignes
+    ]
+
+    with transaction.atomic():
+        echeanciers.delete()
+        # ignore_conflicts : deux reconstructions simultanées écrivent les mêmes lignes
+        EcheancierFournisseur.objects.bulk_create(nouveaux, ignore_conflicts=True)
+    return len(nouveaux)
+
+
+def appliquer_delta_echeancier(ancienne, nouvelle):
+    """
+    Reporte dans l'échéancier le changement d'une facture non payée.
+
+    Args:
+        ancienne: (beneficiaire_id, date_echeance, net) avant modification, ou None
+            si la facture n'était pas comptée (nouvelle ou payée)
+        nouvelle: (beneficiaire_id, date_echeance, net) après modification, ou None
+            si la facture ne doit plus être comptée (supprimée ou payée)
+
+    Les écarts sont appliqués par UPDATE sur les lignes calculées aujourd'hui ; une
+    ligne absente ou d'une date antérieure est recalculée entièrement.
+    """
+    if ancienne == nouvelle:
+        return
+    aujourdhui = timezone.now().date()
+
+    deltas = {}
+    for contribution, signe in ((ancienne, -1), (nouvelle, 1)):
+        if contribution is None:
+            continue
+        beneficiaire_id, date_echeance, net = contribution
+        champ_nombre = tranche_echeance(date_echeance, aujourdhui)
+        champ_montant = dict(TRANCHES_ECHEANCE)[champ_nombre]
+        delta = deltas.setdefault(beneficiaire_id, {})
+        for champ, valeur in ((champ_nombre, signe), ('total', signe),
+                              (champ_montant, signe * net), ('montant_total', signe * net)):
+            delta[champ] = delta.get(champ, 0) + valeur
+
+    for beneficiaire_id, delta in deltas.items():
+        modifications = {champ: F(champ) + valeur for champ, valeur in delta.items() if valeur}
+        if not modifications:
+            continue
+        nb_lignes = EcheancierFournisseur.objects.filter(
+            beneficiaire_id=beneficiaire_id, date_reference=aujourdhui,
+        ).update(**modifications)
+        if not nb_lignes:
+            reconstruire_echeancier([beneficiaire_id])
+
+
+def get_echeancier_dashboard():
+    """
+    Lit l'échéancier matérialisé pour le tableau de bord fournisseurs.
+
+    L'échéancier est reconstruit s'il est vide ou date d'un jour précédent (tâche de
+    nuit non passée) ; sinon trois lectures simples, indépendantes du volume de factures.
+
+    Returns:
+        tuple: (lignes par bénéficiaire, totaux globaux)
+    """
+    assurer_echeancier_a_jour()
+
+    echeanciers = EcheancierFournisseur.objects.filter(total__gt=0)
+    fournisseurs = echeanciers.annotate(
+        id=F('beneficiaire_id'),
+        raison_sociale=F('beneficiaire__raison_sociale'),
+    ).values('id', 'raison_sociale', *CHAMPS_ECHEANCIER).order_by('raison_sociale')
+    total_global = echeanciers.aggregate(**{champ: Sum(champ) for champ in CHAMPS_ECHEANCIER})
+    return fournisseurs, total_global
+
+
+def assurer_echeancier_a_jour():
+    """ Reconstruit l'échéancier s'il est vide ou date d'un jour précédent. """
+    plus_ancienne = EcheancierFournisseur.objects.aggregate(date=Min('date_reference'))['date']
+    if plus_ancienne is None or plus_ancienne < timezone.now().date():
+        reconstruire_echeancier()
+
+
+def enregistrer_instantane_echeancier():
+    """
+    Ajoute à l'historique l'échéancier du jour : une ligne par bénéficiaire et une ligne globale.
+
+    L'historique n'est jamais réécrit : si l'instantané du jour existe déjà, rien n'est fait.
+
+    Returns:
+        int: Nombre de lignes ajoutées (0 si l'instantané du jour existait)
+    """
+    aujourdhui = timezone.now().date()
+    if InstantaneEcheancier.objects.filter(date_instantane=aujourdhui).exists():
+        return 0
+
+    assurer_echeancier_a_jour()
+    echeanciers = EcheancierFournisseur.objects.filter(total__gt=0)
+    lignes = [
+        InstantaneEcheancier(date_instantane=aujourdhui, **ligne)
+        for ligne in echeanciers.values('beneficiaire_id', *CHAMPS_ECHEANCIER)
+    ]
+    total_global = echeanciers.aggregate(**{champ: Sum(champ) for champ in CHAMPS_ECHEANCIER})
+    lignes.append(InstantaneEcheancier(
+        date_instantane=aujourdhui,
+        **{champ: valeur if valeur is not None else 0 for champ, valeur in total_global.items()}
+    ))
+    InstantaneEcheancier.objects.bulk_create(lignes)
+    return len(lignes)
+
+
+def get_tendance_echeancier(jours, beneficiaire_id=None):
+    """
+    Évolution de l'échéancier sur les derniers jours, lue dans les instantanés.
+
+    Args:
+        jours: Profondeur de l'historique (30, 90, 365...)
+        beneficiaire_id: Bénéficiaire suivi (par défaut : totaux globaux)
+
+    Returns:
+        list: un dict par date (ordre chronologique) avec les nombres et montants par tranche
+    """
+    debut = timezone.now().date() - timedelta(days=jours)
+    return list(
+        InstantaneEcheancier.objects
+        .filter(date_instantane__gte=debut, beneficiaire_id=beneficiaire_id)
+        .order_by('date_instantane')
+        .values('date_instantane', *CHAMPS_ECHEANCIER)
+    )
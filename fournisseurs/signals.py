@@ -1,6 +1,5 @@
 from decimal import Decimal
 from django.db import transaction
-from django.db.models import Sum
 from django.db.models.signals import post_save, pre_save, pre_delete, post_delete
 from django.dispatch import receiver
 
@@ -12,44 +11,20 @@ from decouple import config
 
 import os
 from .models import Facture, OrdreVirement
+from .pdf import invalider_cache_ov, pre_generer_ov_pdf
+from .services import appliquer_delta_echeancier, appliquer_delta_montant_ov, reconstruire_echeancier
 from core.choices import *  # Importer toutes les constantes
 
 User = get_user_model()
 
-def update_ordre_virement_montant(ordre_virement):
-    """
-    Met à jour le montant de l'ordre de virement en fonction du total des factures associées.
-    """
-    if ordre_virement is None:
-        return
-
-    if hasattr(ordre_virement, 'factures_ov'):
-        total = ordre_virement.factures_ov.aggregate(total=Sum('mnt_net_apayer'))['total'] or Decimal('0.00')
-
-        # Vérifier si le montant doit être mis à jour
-        if ordre_virement.montant != total:
-
-            # Empêcher la boucle infinie en ajoutant un attribut temporaire
-            if not hasattr(ordre_virement, '_prevent_signal'):
-                ordre_virement._prevent_signal = True
-
-                ordre_virement.montant = total
-                ordre_virement.save(update_fields=['montant'])
-
-                del ordre_virement._prevent_signal  # Nettoyer l'attribut
-
 ################################################################################
 # Ordre de virement
 # Signal pour supprimer les fichiers liés avant la suppression d'un OrdreVirement
 @receiver(pre_save, sender=OrdreVirement) ###
 def supprimer_anciens_pj_ov(sender, instance, **kwargs):
     """ Supprime l'ancien fichier lorsqu'un nouveau fichier est attaché. """
-    if not instance.pk:  # Si c'est une nouvelle instance, ne rien faire
-        return
-
-    try:
-        old_instance = OrdreVirement.objects.get(pk=instance.pk)
-    except OrdreVirement.DoesNotExist:
+    old_instance = instance.etat_precedent
+    if old_instance is None:  # Nouvelle instance : rien à supprimer
         return
 
     # Vérifie si le OV_remis_banque_pdf a été modifié
@@ -62,27 +37,46 @@ def supprimer_anciens_pj_ov(sender, instance, **kwargs):
         if os.path.isfile(old_instance.avis_debit_pdf.path):
             os.remove(old_instance.avis_debit_pdf.path)
 
-# Signal pour mise à jour montant d'un OrdreVirement après son enregistrement
+# Champs de l'OV affichés sur son PDF (les factures sont suivies par leurs propres signaux)
+CHAMPS_PDF_OV = ('reference', 'mode_execution', 'beneficiaire_id', 'compte_tresorerie_id', 'compte_tresorerie_emetteur_id')
+CHAMPS_PDF_FACTURE = ('num_facture', 'date_facture', 'montant_ttc', 'mnt_net_apayer')
+
+def champs_modifies(ancienne_instance, instance, champs):
+    return any(getattr(ancienne_instance, champ) != getattr(instance, champ) for champ in champs)
+
+@receiver(pre_save, sender=OrdreVirement)
+def memoriser_ov_precedent(sender, instance, **kwargs):
+    """ Mémorise l'état en base de l'OV pour les receivers post_save. """
+    instance._ov_precedent = instance.etat_precedent
+
+# Signal pour compléter un OrdreVirement après son enregistrement
 @receiver(post_save, sender=OrdreVirement)
-def update_ordre_virement(sender, instance, **kwargs):
+def update_ordre_virement(sender, instance, created, **kwargs):
     """
-    Met à jour le montant de l'ordre de virement après sa création ou modification.
+    Renseigne la référence de l'ordre de virement après sa création et tient à jour
+    le cache de son PDF.
+
+    Le montant est tenu à jour par les signaux des factures (écarts appliqués à chaque
+    enregistrement ou suppression), il n'est plus recalculé ici.
     """
     if kwargs.get('raw', False):
         return
-    update_ordre_virement_montant(instance)
+
+    ancien = getattr(instance, '_ov_precedent', None)
+    if ancien and champs_modifies(ancien, instance, CHAMPS_PDF_OV):
+        invalider_cache_ov(instance.pk)
+
+    # Les signataires téléchargent l'OV dès sa validation : le PDF est préparé après commit
+    if instance.valide_pour_signature and not (ancien and ancien.valide_pour_signature):
+        transaction.on_commit(lambda: pre_generer_ov_pdf(instance.pk))
 
     # Si la référence de l'OV est vide, y mettre l'ID
     if not instance.reference:
         instance.reference = str(instance.id+ov_start_num)
-        instance.save(update_fields=["reference"])
+        OrdreVirement.objects.filter(pk=instance.pk).update(reference=instance.reference)
 
-    # Met à jour la date de paiement des factures associées si OV exécutés
-    if instance.compte_debite:
-        with transaction.atomic():
-            Facture.objects.filter(ordre_virement=instance).update(
-                date_paiement=instance.date_operation_banque
-            )
+    # La date de paiement des factures associées (OV exécuté) est renseignée
+    # par OrdreVirement.mettre_a_jour_statut_factures, avec leur statut
 
 @receiver(pre_delete, sender=OrdreVirement)
 def remettre_statut_factures_en_attente(sender, instance, **kwargs):
@@ -95,9 +89,14 @@ def remettre_statut_factures_en_attente(sender, instance, **kwargs):
             date_paiement=None,
             ordre_virement=None  # Optionnel
         )
+        # Les factures d'un OV débité redeviennent non payées
+        if instance.compte_debite:
+            reconstruire_echeancier([instance.beneficiaire_id])
 
 @receiver(post_delete, sender=OrdreVirement) ###
 def supprimer_fichiers_OV(sender, instance, **kwargs):
+    invalider_cache_ov(instance.pk)
+
     # Supprime le fichier OV_remis_banque_pdf s'il existe
     if instance.OV_remis_banque_pdf and os.path.isfile(instance.OV_remis_banque_pdf.path):
         os.remove(instance.OV_remis_banque_pdf.path)
@@ -112,12 +111,8 @@ def supprimer_fichiers_OV(sender, instance, **kwargs):
 @receiver(pre_save, sender=Facture) ###
 def supprimer_anciens_pj_facture(sender, instance, **kwargs):
     """ Supprime l'ancien fichier lorsqu'un nouveau fichier est attaché. """
-    if not instance.pk:  # Si c'est une nouvelle instance, ne rien faire
-        return
-
-    try:
-        old_instance = Facture.objects.get(pk=instance.pk)
-    except Facture.DoesNotExist:
+    old_instance = instance.etat_precedent
+    if old_instance is None:  # Nouvelle instance : rien à supprimer
         return
 
     # Vérifie si le proforma_pdf a été modifié
@@ -136,46 +131,88 @@ def supprimer_anciens_pj_facture(sender, instance, **kwargs):
             os.remove(old_instance.PV_reception_pdf.path)
 
 @receiver(pre_save, sender=Facture)
-def update_ordre_virement_on_change(sender, instance, **kwargs):
+def memoriser_montant_ov_precedent(sender, instance, **kwargs):
     """
-    Met à jour l'ancien ordre de virement si la facture change d'affectation.
+    Mémorise l'OV et le net à payer en base avant l'enregistrement de la facture.
     """
-    if instance.pk:  # Vérifie que la facture existe déjà
-        try:
-            old_instance = Facture.objects.get(pk=instance.pk)
-            if old_instance.ordre_virement and old_instance.ordre_virement != instance.ordre_virement:
-                update_ordre_virement_montant(old_instance.ordre_virement)
-        except Facture.DoesNotExist:
-            pass  # Si la facture n'existe pas encore, rien à faire
+    old_instance = instance.etat_precedent
+    instance._facture_precedente = old_instance
+    if old_instance:
+        instance._montant_ov_precedent = (old_instance.ordre_virement_id, old_instance.mnt_net_apayer)
+    else:
+        instance._montant_ov_precedent = (None, Decimal('0.00'))
 
-    """ Supprime l'ancien fichier lorsqu'un nouveau fichier est attaché. """
-    if not instance.pk:  # Si c'est une nouvelle instance, ne rien faire
+@receiver(post_save, sender=Facture)
+def update_ordre_virement_on_save(sender, instance, **kwargs):
+    """
+    Reporte sur le(s) ordre(s) de virement l'écart de net à payer de la facture.
+
+    Même OV : on applique la différence nouveau net - ancien net.
+    Changement d'OV : l'ancien perd l'ancien net, le nouveau gagne le nouveau net.
+    Les écarts sont appliqués dans la transaction de Facture.save().
+    """
+    if kwargs.get('raw', False):
         return
+    ancien_ov_id, ancien_net = getattr(instance, '_montant_ov_precedent', (None, Decimal('0.00')))
+    nouveau_ov_id, nouveau_net = instance.ordre_virement_id, Decimal(instance.mnt_net_apayer or 0)
+    ancien_net = Decimal(ancien_net or 0)
+
+    if ancien_ov_id == nouveau_ov_id:
+        appliquer_delta_montant_ov(nouveau_ov_id, nouveau_net - ancien_net)
+    else:
+        appliquer_delta_montant_ov(ancien_ov_id, -ancien_net)
+        appliquer_delta_montant_ov(nouveau_ov_id, nouveau_net)
+
+@receiver(post_delete, sender=Facture)
+def update_ordre_virement_on_delete(sender, instance, **kwargs):
+    """
+    Retire du montant de l'ordre de virement et de l'échéancier le net à payer de la
+    facture supprimée, et supprime le PDF en cache de l'OV.
+    """
+    appliquer_delta_montant_ov(instance.ordre_virement_id, -Decimal(instance.mnt_net_apayer or 0))
+    invalider_cache_ov(instance.ordre_virement_id)
+    appliquer_delta_echeancier(contribution_echeancier(instance), None)
 
-    try:
-        old_instance = Facture.objects.get(pk=instance.pk)
-    except Facture.DoesNotExist:
+def contribution_echeancier(facture):
+    """ Part d'une facture dans l'échéancier : None si elle est payée. """
+    if facture is None or facture.statut == 'payee':
+        return None
+    return (facture.beneficiaire_id, facture.date_echeance, Decimal(facture.mnt_net_apayer or 0))
+
+@receiver(post_save, sender=Facture)
+def update_echeancier_on_save(sender, instance, **kwargs):
+    """
+    Reporte dans l'échéancier fournisseurs l'écart entre l'ancienne et la nouvelle facture.
+    """
+    if kwargs.get('raw', False):
         return
+    appliquer_delta_echeancier(
+        contribution_echeancier(getattr(instance, '_facture_precedente', None)),
+        contribution_echeancier(instance),
+    )
 
 @receiver(post_save, sender=Facture)
-def update_ordre_virement_on_save(sender, instance, **kwargs):
+def invalider_pdf_ov_facture(sender, instance, **kwargs):
     """
-    Met à jour le montant de l'ordre de virement lorsqu'une facture est ajoutée ou modifiée.
+    Supprime le PDF en cache des OV dont l'annexe change avec cette facture.
     """
-    if instance.ordre_virement:
-        update_ordre_virement_montant(instance.ordre_virement)
+    if kwargs.get('raw', False):
+        return
+    ancienne = getattr(instance, '_facture_precedente', None)
+    if ancienne is None:
+        invalider_cache_ov(instance.ordre_virement_id)
+    elif ancienne.ordre_virement_id != instance.ordre_virement_id:
+        invalider_cache_ov(ancienne.ordre_virement_id)
+        invalider_cache_ov(instance.ordre_virement_id)
+    elif champs_modifies(ancienne, instance, CHAMPS_PDF_FACTURE):
+        invalider_cache_ov(instance.ordre_virement_id)
 
 @receiver(pre_delete, sender=Facture)
 def notify_users_and_update_ordre_virement(sender, instance, **kwargs):
     """
-    1. Met à jour le montant de l'ordre de virement avant suppression
-    2. Notifie les utilisateurs created_by et updated_by de la suppression
+    Notifie les utilisateurs created_by et updated_by de la suppression.
+    Le montant de l'ordre de virement est mis à jour en post_delete.
     """
-    # 1. Mise à jour de l'ordre de virement
-    if instance.ordre_virement:
-        update_ordre_virement_montant(instance.ordre_virement)
-    
-    # 2. Notification des utilisateurs
     subject = f"Suppression de la facture {instance.num_facture} !!! "
     message = f"La facture {instance.num_facture} dont ci-après détail a été supprimée du système :\n Bénéficiaire : {instance.beneficiaire.raison_sociale}\n Montant TTC : {instance.montant_ttc}\n Echéance : {instance.date_echeance}\n Statut : {instance.statut}"
     
@@ -4,24 +4,90 @@ document.addEventListener('DOMContentLoaded', function () {
     const ordreVirementId = document.getElementById('id_ordre_virement_id').value; // ID de l'ordre de virement
     const facturesContainer = document.getElementById('id_factures'); // Conteneur des factures
 
+    // État du sélecteur (filtres et pagination côté serveur)
+    const filtres = { statut: '', echeance_min: '', echeance_max: '' };
+    let pageCourante = 1;
+
+    // Sélection complète de l'OV (toutes pages) envoyée en un seul POST après les clics
+    let selection = new Set();
+    let envoiSelectionTimer = null;
+    const DELAI_ENVOI_SELECTION = 600;
+
+    function formatMontant(valeur) {
+        return parseFloat(valeur || 0).toLocaleString('fr-FR', {minimumFractionDigits: 2, maximumFractionDigits: 2});
+    }
+
+    // Barre de filtres (statut / échéance) insérée une seule fois avant la liste
+    function initFiltres() {
+        if (document.getElementById('factures-filtres')) {
+            return;
+        }
+        const barre = document.createElement('div');
+        barre.id = 'factures-filtres';
+        barre.style.margin = '10px 0';
+        barre.innerHTML = `
+            <label>Statut :
+                <select id="factures-filtre-statut">
+                    <option value="">Tous</option>
+                    <option value="attente">En attente</option>
+                    <option value="etablissement">OV en cours d'établissement</option>
+                    <option value="signature">OV en cours de signature</option>
+                    <option value="banque">OV remis à la banque</option>
+                    <option value="payee">Facture payée</option>
+                </select>
+            </label>
+            <label style="margin-left: 10px;">Échéance du : <input type="date" id="factures-filtre-echeance-min"></label>
+            <label style="margin-left: 10px;">au : <input type="date" id="factures-filtre-echeance-max"></label>
+        `;
+        facturesContainer.parentNode.insertBefore(barre, facturesContainer);
+
+        const champs = {
+            'factures-filtre-statut': 'statut',
+            'factures-filtre-echeance-min': 'echeance_min',
+            'factures-filtre-echeance-max': 'echeance_max',
+        };
+        Object.keys(champs).forEach(id => {
+            document.getElementById(id).addEventListener('change', function () {
+                filtres[champs[id]] = this.value;
+                pageCourante = 1;
+                loadFactures(beneficiaireField.value);
+            });
+        });
+    }
+
     // Fonction pour charger les factures
-    function loadFactures(beneficiaireId) {
+    function loadFactures(beneficiaireId, page = pageCourante) {
         if (!beneficiaireId) {
             facturesContainer.innerHTML = '<p>Aucun bénéficiaire sélectionné.</p>';
             return;
         }
 
         // Construction de l'URL
-        let url = `/api/fournisseurs/get-factures/?beneficiaire_id=${beneficiaireId}`;
+        const params = new URLSearchParams({ beneficiaire_id: beneficiaireId, page: page });
         if (ordreVirementId) {
-            url += `&ordre_virement_id=${ordreVirementId}`;
+            params.append('ordre_virement_id', ordreVirementId);
         }
+        Object.keys(filtres).forEach(cle => {
+            if (filtres[cle]) {
+                params.append(cle, filtres[cle]);
+            }
+        });
+        const url = `/api/fournisseurs/get-factures-ov/?${params.toString()}`;
 
         // Requête vers l'API pour charger les factures
         fetch(url)
             .then(response => response.json())
             .then(data => {
-                if (data.length > 0) {
+                if (!data.success) {
+                    facturesContainer.innerHTML = `<p>${data.error || 'Erreur de chargement.'}</p>`;
+                    return;
+                }
+                pageCourante = data.page;
+                // Ne pas écraser des coches pas encore envoyées
+                if (envoiSelectionTimer === null) {
+                    selection = new Set(data.selection_ids);
+                }
+                if (data.factures.length > 0) {
                     // Construction du tableau HTML
                     let html = `
                         <table class="factures-table" style="width: 100%; border-collapse: collapse; margin-top: 10px;">
@@ -38,22 +104,22 @@ document.addEventListener('DOMContentLoaded', function () {
                             <tbody>
                     `;
                     
-                    data.forEach(facture => {
-                        const isChecked = facture.ordre_virement !== null;
+                    data.factures.forEach(facture => {
+                        const isChecked = selection.has(facture.id);
                         
                         // Définir la couleur du statut
                         let statutColor = '#6c757d'; // Gris par défaut
                         let statutBg = '#f8f9fa';
-                        if (facture.statut === 'en_attente_signature') {
+                        if (facture.statut === 'etablissement') {
                             statutColor = '#856404';
                             statutBg = '#fff3cd';
-                        } else if (facture.statut === 'signee') {
+                        } else if (facture.statut === 'signature') {
                             statutColor = '#004085';
                             statutBg = '#cce5ff';
-                        } else if (facture.statut === 'remise_a_banque') {
+                        } else if (facture.statut === 'banque') {
                             statutColor = '#0c5460';
                             statutBg = '#d1ecf1';
-                        } else if (facture.statut === 'reglee') {
+                        } else if (facture.statut === 'payee') {
                             statutColor = '#155724';
                             statutBg = '#d4edda';
                         }
@@ -67,10 +133,10 @@ document.addEventListener('DOMContentLoaded', function () {
                                     <strong>${facture.num_facture}</strong>
                                 </td>
                                 <td style="padding: 8px; text-align: right; border: 1px solid #dee2e6;">
-                                    ${parseFloat(facture.montant_ttc).toLocaleString('fr-FR', {minimumFractionDigits: 2, maximumFractionDigits: 2})} DH
+                                    ${formatMontant(facture.montant_ttc)} DH
                                 </td>
                                 <td style="padding: 8px; text-align: right; border: 1px solid #dee2e6; font-weight: bold;">
-                                    ${parseFloat(facture.mnt_net_apayer).toLocaleString('fr-FR', {minimumFractionDigits: 2, maximumFractionDigits: 2})} DH
+                                    ${formatMontant(facture.mnt_net_apayer)} DH
                                 </td>
                                 <td style="padding: 8px; text-align: center; border: 1px solid #dee2e6;">
                                     ${facture.date_echeance}
@@ -87,10 +153,33 @@ document.addEventListener('DOMContentLoaded', function () {
                     html += `
                             </tbody>
                         </table>
+                        <p style="margin-top: 8px;">
+                            ${data.nombre_factures} facture(s) -
+                            Total net à payer : <strong>${formatMontant(data.totaux.mnt_net_apayer)} DH</strong> -
+                            Sélection : ${data.totaux.nombre_selection} facture(s), <strong>${formatMontant(data.totaux.montant_selection)} DH</strong>
+                            ${data.ov_montant !== null ? ` - Montant OV : <strong>${formatMontant(data.ov_montant)} DH</strong>` : ''}
+                        </p>
                     `;
+
+                    // Pagination
+                    if (data.nb_pages > 1) {
+                        html += `
+                            <p class="factures-pagination">
+                                <button type="button" class="button" data-page="${data.page - 1}" ${data.page <= 1 ? 'disabled' : ''}>&laquo; Précédent</button>
+                                Page ${data.page} / ${data.nb_pages}
+                                <button type="button" class="button" data-page="${data.page + 1}" ${data.page >= data.nb_pages ? 'disabled' : ''}>Suivant &raquo;</button>
+                            </p>
+                        `;
+                    }
                     
                     facturesContainer.innerHTML = html;
 
+                    facturesContainer.querySelectorAll('.factures-pagination button').forEach(button => {
+                        button.addEventListener('click', function () {
+                            loadFactures(beneficiaireField.value, Number(this.dataset.page));
+                        });
+                    });
+
                     // Ajouter les écouteurs d'événements pour les cases à cocher
                     addCheckboxEventListeners();
                 } else {
@@ -108,43 +197,54 @@ document.addEventListener('DOMContentLoaded', function () {
         const checkboxes = facturesContainer.querySelectorAll('input[type="checkbox"][name="factures"]');
         checkboxes.forEach(checkbox => {
             checkbox.addEventListener('change', function () {
-                const factureId = this.value;
-                const isChecked = this.checked;
-
-                // Mettre à jour l'association de la facture
-                updateFactureAssociation(factureId, isChecked);
+                const factureId = Number(this.value);
+                if (this.checked) {
+                    selection.add(factureId);
+                } else {
+                    selection.delete(factureId);
+                }
+                planifierEnvoiSelection();
             });
         });
     }
 
-    // Fonction pour mettre à jour l'association d'une facture
-    function updateFactureAssociation(factureId, isChecked) {
-        const url = '/api/fournisseurs/update-facture-association/';
+    // Regroupe les clics rapprochés en un seul envoi
+    function planifierEnvoiSelection() {
+        if (!ordreVirementId) {
+            return;
+        }
+        clearTimeout(envoiSelectionTimer);
+        envoiSelectionTimer = setTimeout(envoyerSelection, DELAI_ENVOI_SELECTION);
+    }
+
+    // Envoie l'ensemble des factures cochées : le serveur calcule ajouts et retraits
+    function envoyerSelection() {
+        envoiSelectionTimer = null;
+        const url = '/api/fournisseurs/update-factures-ordre-virement/';
         const data = {
-            facture_id: Number(factureId),  // ✅ Conversion en entier
-            ordre_virement_id: Number(ordreVirementId),  // ✅ Conversion en entier
-            is_associated: Boolean(isChecked)
+            ordre_virement_id: Number(ordreVirementId),
+            facture_ids: Array.from(selection)
         };
 
-        // Envoyer une requête POST pour mettre à jour l'association
         fetch(url, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
-                'X-CSRFToken': getCookie('csrftoken') // Si vous utilisez CSRF protection
+                'X-CSRFToken': getCookie('csrftoken')
             },
             body: JSON.stringify(data)
         })
         .then(response => response.json())
         .then(data => {
-            if (data.success) {
-                console.log('Association mise à jour avec succès');
-            } else {
-                console.error('Erreur lors de la mise à jour de l\'association :', data.error);
+            if (!data.success) {
+                console.error('Erreur lors de la mise à jour des factures :', data.error);
+                alert(data.error || 'Erreur lors de la mise à jour des factures.');
             }
+            // Recharger la page courante : statuts, totaux et montant de l'OV à jour
+            loadFactures(beneficiaireField.value);
         })
         .catch(error => {
-            console.error('Erreur lors de la mise à jour de l\'association :', error);
+            console.error('Erreur lors de la mise à jour des factures :', error);
         });
     }
 
@@ -166,8 +266,11 @@ document.addEventListener('DOMContentLoaded', function () {
 
     // Écouteur pour le changement du champ bénéficiaire
     if (beneficiaireField) {
+        initFiltres();
+
         beneficiaireField.addEventListener('change', function () {
             const beneficiaireId = this.value;
+            pageCourante = 1;
             loadFactures(beneficiaireId);
         });
 
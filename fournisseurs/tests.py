@@ -0,0 +1,942 @@
+"""
+Tests pour l'application fournisseurs
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.urls import reverse
+
+from fournisseurs.models import Beneficiaire, CompteTresorerie, OrdreVirement, Facture
+
+
+class FournisseursTestMixin:
+    """Jeu de données minimal : un bénéficiaire, son compte et un OV"""
+
+    def setUp(self):
+        """Préparation avant chaque test"""
+        self.beneficiaire = Beneficiaire.objects.create(
+            raison_sociale='Fournisseur Test',
+            registre_commerce='RC001',
+            identifiant_fiscale='IF001',
+            code_ice='ICE001',
+        )
+        self.compte = CompteTresorerie.objects.create(
+            beneficiaire=self.beneficiaire,
+            banque='Banque Test',
+            rib='0' * 24,
+        )
+        self.ordre_virement = OrdreVirement.objects.create(
+            type_ov='Virement',
+            beneficiaire=self.beneficiaire,
+            compte_tresorerie=self.compte,
+        )
+
+    def connecter(self, *permissions, email='tresorier@test.com'):
+        """Connecte un utilisateur disposant des permissions données (codenames)"""
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.models import Permission
+
+        utilisateur = get_user_model().objects.create_user(email=email, password='x')
+        utilisateur.user_permissions.add(*Permission.objects.filter(codename__in=permissions))
+        self.client.force_login(utilisateur)
+        return utilisateur
+
+    def creer_facture(self, numero, montant_ht='1000.00', ordre_virement=None, **kwargs):
+        """Crée une facture sans contrat (TVA saisie à 0)"""
+        # Les défauts des champs montants sont des float : on passe des Decimal comme l'admin
+        for champ in ('mnt_tva', 'mnt_avoir', 'mnt_RAS_TVA', 'mnt_RAS_IS', 'mnt_RG', 'mnt_penalite'):
+            kwargs.setdefault(champ, Decimal('0.00'))
+        return Facture.objects.create(
+            beneficiaire=self.beneficiaire,
+            num_facture=numero,
+            date_facture=kwargs.pop('date_facture', date.today()),
+            date_echeance=kwargs.pop('date_echeance', date.today() + timedelta(days=30)),
+            montant_ht=Decimal(montant_ht),
+            ordre_virement=ordre_virement,
+            **kwargs
+        )
+
+
+class FacturesOVPickerTests(FournisseursTestMixin, TestCase):
+    """Tests pour le sélecteur de factures du formulaire OV"""
+
+    def setUp(self):
+        super().setUp()
+        self.connecter('view_ordrevirement')
+
+    def test_factures_ov_nombre_requetes_constant(self):
+        """Test que le nombre de requêtes ne dépend pas du nombre de factures"""
+        for i in range(30):
+            self.creer_facture(f'F{i:03d}', ordre_virement=self.ordre_virement if i < 10 else None)
+
+        url = reverse('get_factures_ov')
+        # Session, utilisateur et ses permissions, puis les 4 requêtes du sélecteur
+        with self.assertNumQueries(8):
+            response = self.client.get(url, {
+                'beneficiaire_id': self.beneficiaire.pk,
+                'ordre_virement_id': self.ordre_virement.pk,
+                'page_size': 20,
+            })
+
+        data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['factures']), 20)
+        self.assertEqual(data['nombre_factures'], 30)
+        self.assertEqual(data['nb_pages'], 2)
+        self.assertEqual(data['totaux']['nombre_selection'], 10)
+        self.assertEqual(Decimal(data['totaux']['montant_selection']), Decimal('10000.00'))
+        self.assertEqual(data['factures'][0]['statut_display'], "OV en cours d'établissement")
+        self.assertEqual(len(data['selection_ids']), 10)
+
+    def test_factures_ov_reserve_aux_utilisateurs_autorises(self):
+        """Test que le sélecteur exige un utilisateur ayant view_ordrevirement"""
+        url = reverse('get_factures_ov')
+        parametres = {'beneficiaire_id': self.beneficiaire.pk}
+        self.assertEqual(self.client.get(url, parametres).status_code, 200)
+
+        self.connecter(email='lecteur@test.com')
+        self.assertEqual(self.client.get(url, parametres).status_code, 403)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(url, parametres).status_code, 302)
+
+    def test_factures_ov_filtre_echeance(self):
+        """Test le filtrage par date d'échéance"""
+        self.creer_facture('F001', date_echeance=date(2026, 1, 10))
+        self.creer_facture('F002', date_echeance=date(2026, 3, 10))
+
+        response = self.client.get(reverse('get_factures_ov'), {
+            'beneficiaire_id': self.beneficiaire.pk,
+            'echeance_max': '2026-02-01',
+        })
+
+        data = response.json()
+        self.assertEqual([f['num_facture'] for f in data['factures']], ['F001'])
+
+    def test_factures_ov_statut_invalide(self):
+        """Test le rejet d'un statut inconnu"""
+        response = self.client.get(reverse('get_factures_ov'), {
+            'beneficiaire_id': self.beneficiaire.pk,
+            'statut': 'inconnu',
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class PropagationStatutOVTests(FournisseursTestMixin, TestCase):
+    """Tests pour la propagation du statut de l'OV vers ses factures"""
+
+    def test_validation_ov_met_a_jour_statut_factures(self):
+        """Test que la validation de l'OV passe ses factures en signature"""
+        factures = [self.creer_facture(f'F{i:03d}', ordre_virement=self.ordre_virement) for i in range(3)]
+
+        self.ordre_virement.valide_pour_signature = True
+        self.ordre_virement.save()
+
+        for facture in factures:
+            facture.refresh_from_db()
+            self.assertEqual(facture.statut, 'signature')
+
+    def test_compte_debite_renseigne_date_paiement(self):
+        """Test que le débit de l'OV marque les factures payées avec la date de l'opération"""
+        facture = self.creer_facture('F001', ordre_virement=self.ordre_virement)
+        date_operation = date(2026, 5, 4)
+
+        OrdreVirement.objects.filter(pk=self.ordre_virement.pk).update(
+            valide_pour_signature=True, remis_a_banque=True,
+        )
+        self.ordre_virement.refresh_from_db()
+        self.ordre_virement.date_operation_banque = date_operation
+        self.ordre_virement.compte_debite = True
+        self.ordre_virement.save()
+
+        facture.refresh_from_db()
+        self.assertEqual(facture.statut, 'payee')
+        self.assertEqual(facture.date_paiement, date_operation)
+
+    def test_propagation_nombre_requetes_constant(self):
+        """Test que la propagation se fait en une requête quel que soit le nombre de factures"""
+        from fournisseurs.services import propager_statut_ov
+
+        for i in range(20):
+            self.creer_facture(f'F{i:03d}', ordre_virement=self.ordre_virement)
+        self.ordre_virement.valide_pour_signature = True
+
+        with self.assertNumQueries(1):
+            nb_factures = propager_statut_ov(self.ordre_virement)
+        self.assertEqual(nb_factures, 20)
+
+
+class EtatPrecedentTests(FournisseursTestMixin, TestCase):
+    """Tests pour le chargement unique de l'état en base lors d'un save()"""
+
+    def test_save_facture_charge_etat_precedent_une_fois(self):
+        """Test que validateurs et signaux partagent une seule relecture de la facture"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        facture = self.creer_facture('F001', ordre_virement=self.ordre_virement)
+        facture = Facture.objects.get(pk=facture.pk)
+        facture.num_facture = 'F001-bis'
+
+        with CaptureQueriesContext(connection) as ctx:
+            facture.save()
+
+        relectures = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith('SELECT') and 'FROM "fournisseurs_facture"' in q['sql']
+            and 'WHERE "fournisseurs_facture"."id" =' in q['sql']
+        ]
+        self.assertEqual(len(relectures), 1)
+        self.assertNotIn('_etat_precedent', facture.__dict__)
+
+
+class MontantOVTests(FournisseursTestMixin, TestCase):
+    """Tests pour la tenue du montant de l'OV par écarts"""
+
+    def montant_ov(self, ordre_virement=None):
+        return OrdreVirement.objects.get(pk=(ordre_virement or self.ordre_virement).pk).montant
+
+    def test_montant_suit_ajout_modification_suppression(self):
+        """Test que le montant de l'OV suit les factures sans réagrégation"""
+        facture = self.creer_facture('F001', ordre_virement=self.ordre_virement)
+        self.creer_facture('F002', montant_ht='500.00', ordre_virement=self.ordre_virement)
+        self.assertEqual(self.montant_ov(), Decimal('1500.00'))
+
+        facture.montant_ht = Decimal('1200.00')
+        facture.save()
+        self.assertEqual(self.montant_ov(), Decimal('1700.00'))
+
+        facture.delete()
+        self.assertEqual(self.montant_ov(), Decimal('500.00'))
+
+    def test_changement_ov_transfere_le_montant(self):
+        """Test qu'une facture réaffectée quitte l'ancien OV et rejoint le nouveau"""
+        autre_ov = OrdreVirement.objects.create(
+            type_ov='Virement', beneficiaire=self.beneficiaire, compte_tresorerie=self.compte,
+        )
+        facture = self.creer_facture('F001', ordre_virement=self.ordre_virement)
+
+        facture.ordre_virement = autre_ov
+        facture.save()
+
+        self.assertEqual(self.montant_ov(), Decimal('0.00'))
+        self.assertEqual(self.montant_ov(autre_ov), Decimal('1000.00'))
+
+    def test_save_ov_ne_reecrit_pas_le_montant(self):
+        """Test qu'un OV chargé avant l'ajout d'une facture n'écrase pas le montant"""
+        ov_perime = OrdreVirement.objects.get(pk=self.ordre_virement.pk)
+        self.creer_facture('F001', ordre_virement=self.ordre_virement)
+
+        ov_perime.valide_pour_signature = True
+        ov_perime.save()
+
+        self.assertEqual(self.montant_ov(), Decimal('1000.00'))
+
+    def test_verify_ov_montants_corrige_les_ecarts(self):
+        """Test la détection et la correction des écarts par la commande"""
+        from io import StringIO
+        from django.core.management import call_command
+
+        self.creer_facture('F001', ordre_virement=self.ordre_virement)
+        OrdreVirement.objects.filter(pk=self.ordre_virement.pk).update(montant=Decimal('1.00'))
+
+        sortie = StringIO()
+        call_command('verify_ov_montants', stdout=sortie)
+        self.assertIn('1 OV en écart', sortie.getvalue())
+        self.assertEqual(self.montant_ov(), Decimal('1.00'))
+
+        call_command('verify_ov_montants', '--corriger', stdout=StringIO())
+        self.assertEqual(self.montant_ov(), Decimal('1000.00'))
+
+
+class SelectionFacturesOVTests(FournisseursTestMixin, TestCase):
+    """Tests pour l'affectation en masse des factures à un OV"""
+
+    def setUp(self):
+        super().setUp()
+        self.utilisateur = self.connecter('change_ordrevirement')
+
+    def poster_selection(self, facture_ids):
+        import json
+        return self.client.post(
+            reverse('update_factures_ordre_virement'),
+            data=json.dumps({'ordre_virement_id': self.ordre_virement.pk, 'facture_ids': facture_ids}),
+            content_type='application/json',
+        )
+
+    def test_selection_applique_ajouts_et_retraits(self):
+        """Test que l'ensemble envoyé remplace les factures de l'OV"""
+        retiree = self.creer_facture('F001', ordre_virement=self.ordre_virement)
+        conservee = self.creer_facture('F002', ordre_virement=self.ordre_virement)
+        ajoutees = [self.creer_facture(f'F1{i:02d}') for i in range(5)]
+
+        response = self.poster_selection([conservee.pk] + [f.pk for f in ajoutees])
+
+        data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['nombre_ajouts'], 5)
+        self.assertEqual(data['nombre_retraits'], 1)
+        self.assertEqual(Decimal(data['montant']), Decimal('6000.00'))
+        self.assertEqual(data['statuts'][str(retiree.pk)], 'attente')
+        self.assertEqual(data['statuts'][str(ajoutees[0].pk)], 'etablissement')
+
+        retiree.refresh_from_db()
+        self.assertIsNone(retiree.ordre_virement_id)
+        self.assertEqual(OrdreVirement.objects.get(pk=self.ordre_virement.pk).montant, Decimal('6000.00'))
+        self.assertEqual(
+            Facture.objects.filter(ordre_virement=self.ordre_virement, statut='etablissement').count(), 6
+        )
+
+    def test_selection_nombre_requetes_constant(self):
+        """Test que le nombre de requêtes ne dépend pas du nombre de factures cochées"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        petites = [self.creer_facture(f'F0{i:02d}').pk for i in range(2)]
+        grandes = [self.creer_facture(f'F1{i:02d}').pk for i in range(40)]
+
+        with CaptureQueriesContext(connection) as petit:
+            self.poster_selection(petites)
+        Facture.objects.filter(pk__in=petites).update(ordre_virement=None, statut='attente')
+        with CaptureQueriesContext(connection) as grand:
+            self.poster_selection(grandes)
+        self.assertEqual(len(petit.captured_queries), len(grand.captured_queries))
+
+    def test_selection_refuse_facture_autre_ov(self):
+        """Test le rejet d'une facture déjà affectée à un autre OV"""
+        autre_ov = OrdreVirement.objects.create(
+            type_ov='Virement', beneficiaire=self.beneficiaire, compte_tresorerie=self.compte,
+        )
+        facture = self.creer_facture('F001', ordre_virement=autre_ov)
+
+        response = self.poster_selection([facture.pk])
+
+        self.assertEqual(response.status_code, 400)
+        facture.refresh_from_db()
+        self.assertEqual(facture.ordre_virement_id, autre_ov.pk)
+
+    def test_selection_renseigne_audit_des_ajouts(self):
+        """Test que les factures ajoutées comme retirées portent l'utilisateur et la date de mise à jour"""
+        from django.utils import timezone
+
+        retiree = self.creer_facture('F001', ordre_virement=self.ordre_virement)
+        ajoutee = self.creer_facture('F002')
+        avant = timezone.now() - timedelta(days=1)
+        Facture.objects.update(updated_at=avant, updated_by=None)
+
+        self.poster_selection([ajoutee.pk])
+
+        for facture in (retiree, ajoutee):
+            facture.refresh_from_db()
+            self.assertEqual(facture.updated_by, self.utilisateur)
+            self.assertGreater(facture.updated_at, avant)
+
+    def test_ecritures_ov_reservees_aux_utilisateurs_autorises(self):
+        """Test que les vues d'écriture exigent un POST d'un utilisateur ayant change_ordrevirement"""
+        facture = self.creer_facture('F001')
+        url_montant = reverse('update_montant_ordre_virement', args=[self.ordre_virement.pk])
+        self.assertEqual(self.client.get(url_montant).status_code, 405)
+        self.assertEqual(self.client.post(url_montant).status_code, 200)
+
+        self.connecter(email='lecteur@test.com')
+        self.assertEqual(self.client.post(url_montant).status_code, 403)
+        self.assertEqual(self.poster_selection([facture.pk]).status_code, 403)
+
+        self.client.logout()
+        self.assertEqual(self.client.post(url_montant).status_code, 302)
+        self.assertEqual(self.poster_selection([facture.pk]).status_code, 302)
+        self.assertIsNone(Facture.objects.get(pk=facture.pk).ordre_virement_id)
+
+
+class CachePdfOVTests(FournisseursTestMixin, TestCase):
+    """Tests pour le cache des PDF d'ordre de virement"""
+
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        reglages = override_settings(MEDIA_ROOT=media.name)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+        self.ordre_virement.compte_tresorerie_emetteur = CompteTresorerie.objects.create(
+            beneficiaire=self.beneficiaire, banque='Banque Emettrice', rib='1' * 24,
+        )
+        self.ordre_virement.save()
+
+    def fichiers_cache(self):
+        from django.core.files.storage import default_storage
+        from fournisseurs.pdf import dossier_cache_ov
+        try:
+            return default_storage.listdir(dossier_cache_ov(self.ordre_virement.pk))[1]
+        except FileNotFoundError:
+            return []
+
+    def test_pdf_resservi_puis_regenere_apres_modification(self):
+        """Test qu'un PDF inchangé n'est dessiné qu'une fois et qu'une facture modifiée le régénère"""
+        from unittest import mock
+        from fournisseurs import pdf
+
+        facture = self.creer_facture('F001', ordre_virement=self.ordre_virement)
+        url = reverse('generate_ov_pdf', args=[self.ordre_virement.pk])
+
+        with mock.patch('fournisseurs.pdf.dessiner_ov_pdf', wraps=pdf.dessiner_ov_pdf) as dessin:
+            premier = self.client.get(url)
+            second = self.client.get(url)
+            self.assertEqual(dessin.call_count, 1)
+            self.assertEqual(premier.content, second.content)
+            self.assertTrue(premier.content.startswith(b'%PDF'))
+
+            facture.montant_ht = Decimal('1500.00')
+            facture.save()
+            self.assertEqual(self.fichiers_cache(), [])
+
+            self.client.get(url)
+            self.assertEqual(dessin.call_count, 2)
+        self.assertEqual(len(self.fichiers_cache()), 1)
+
+    def test_validation_pre_genere_le_pdf(self):
+        """Test que la validation pour signature met le PDF en cache après commit"""
+        self.creer_facture('F001', ordre_virement=self.ordre_virement)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ordre_virement.valide_pour_signature = True
+            self.ordre_virement.save()
+
+        self.assertEqual(len(self.fichiers_cache()), 1)
+
+    def test_lot_pdf_fusionne_et_zip(self):
+        """Test la génération en lot (pool de processus) en PDF fusionné et en ZIP"""
+        import zipfile
+        from io import BytesIO
+        from PyPDF2 import PdfReader
+        from fournisseurs.pdf import generer_lot_ov_pdf
+
+        ids = [self.ordre_virement.pk]
+        for i in range(2):
+            ov = OrdreVirement.objects.create(
+                type_ov='Virement', beneficiaire=self.beneficiaire, compte_tresorerie=self.compte,
+                compte_tresorerie_emetteur=self.ordre_virement.compte_tresorerie_emetteur,
+            )
+            self.creer_facture(f'F{i:03d}', ordre_virement=ov)
+            ids.append(ov.pk)
+        sans_emetteur = OrdreVirement.objects.create(
+            type_ov='Virement', beneficiaire=self.beneficiaire, compte_tresorerie=self.compte,
+        )
+
+        contenu, ignores = generer_lot_ov_pdf(ids + [sans_emetteur.pk], max_workers=2)
+        self.assertEqual(ignores, [sans_emetteur.pk])
+        self.assertEqual(len(PdfReader(BytesIO(contenu)).pages), 2 * len(ids))
+
+        contenu, _ = generer_lot_ov_pdf(ids, format_sortie='zip')
+        self.assertEqual(len(zipfile.ZipFile(BytesIO(contenu)).namelist()), len(ids))
+
+
+class EcheancierFournisseurTests(FournisseursTestMixin, TestCase):
+    """Tests pour l'échéancier fournisseurs matérialisé"""
+
+    def echeancier(self):
+        from fournisseurs.models import EcheancierFournisseur
+        return EcheancierFournisseur.objects.get(beneficiaire=self.beneficiaire)
+
+    def test_echeancier_suit_les_factures(self):
+        """Test la mise à jour par tranche lors de l'ajout, du report et de la suppression"""
+        from fournisseurs.services import reconstruire_echeancier
+
+        reconstruire_echeancier()
+        aujourdhui = date.today()
+        facture = self.creer_facture('F001', date_echeance=aujourdhui - timedelta(days=3))
+        self.creer_facture('F002', montant_ht='500.00', date_echeance=aujourdhui + timedelta(days=10))
+
+        echeancier = self.echeancier()
+        self.assertEqual((echeancier.factures_en_retard, echeancier.montant_retard), (1, Decimal('1000.00')))
+        self.assertEqual((echeancier.moins_deux_semaines, echeancier.montant_moins_deux_semaines), (1, Decimal('500.00')))
+        self.assertEqual((echeancier.total, echeancier.montant_total), (2, Decimal('1500.00')))
+
+        facture.date_echeance = aujourdhui + timedelta(days=60)
+        facture.save()
+        echeancier = self.echeancier()
+        self.assertEqual(echeancier.factures_en_retard, 0)
+        self.assertEqual((echeancier.plus_un_mois, echeancier.montant_plus_un_mois), (1, Decimal('1000.00')))
+
+        facture.delete()
+        echeancier = self.echeancier()
+        self.assertEqual((echeancier.plus_un_mois, echeancier.total, echeancier.montant_total), (0, 1, Decimal('500.00')))
+
+    def test_echeancier_debit_ov_retire_les_factures(self):
+        """Test que les factures payées par le débit de l'OV sortent de l'échéancier"""
+        self.creer_facture('F001', ordre_virement=self.ordre_virement)
+        self.assertEqual(self.echeancier().total, 1)
+
+        OrdreVirement.objects.filter(pk=self.ordre_virement.pk).update(
+            valide_pour_signature=True, remis_a_banque=True,
+        )
+        self.ordre_virement.refresh_from_db()
+        self.ordre_virement.date_operation_banque = date.today()
+        self.ordre_virement.compte_debite = True
+        self.ordre_virement.save()
+
+        from fournisseurs.models import EcheancierFournisseur
+        self.assertFalse(EcheancierFournisseur.objects.filter(beneficiaire=self.beneficiaire, total__gt=0).exists())
+
+    def test_tableau_bord_lecture_constante(self):
+        """Test que le tableau de bord lit l'échéancier en un nombre fixe de requêtes"""
+        from fournisseurs.admin.dashboard import get_tableau_bord_data
+        from fournisseurs.models import EcheancierFournisseur
+
+        for i in range(10):
+            self.creer_facture(f'F{i:03d}', date_echeance=date.today() + timedelta(days=i * 5))
+        # Échéancier d'hier : reconstruit au premier affichage
+        EcheancierFournisseur.objects.update(date_reference=date.today() - timedelta(days=1))
+        get_tableau_bord_data()
+
+        with self.assertNumQueries(3):
+            data = get_tableau_bord_data()
+            fournisseurs = list(data['fournisseurs'])
+
+        self.assertEqual(fournisseurs[0]['id'], self.beneficiaire.pk)
+        self.assertEqual(fournisseurs[0]['total'], 10)
+        self.assertEqual(data['total_global']['montant_total'], Decimal('10000.00'))
+
+
+class InstantaneEcheancierTests(FournisseursTestMixin, TestCase):
+    """Tests pour l'historique journalier de l'échéancier"""
+
+    def test_instantane_journalier_en_ajout_seul(self):
+        """Test l'écriture des lignes globale et par bénéficiaire, une seule fois par jour"""
+        from io import StringIO
+        from django.core.management import call_command
+        from fournisseurs.models import InstantaneEcheancier
+
+        self.creer_facture('F001', date_echeance=date.today() - timedelta(days=1))
+        self.creer_facture('F002', montant_ht='500.00')
+
+        call_command('instantane_echeancier', stdout=StringIO())
+        call_command('instantane_echeancier', stdout=StringIO())
+
+        self.assertEqual(InstantaneEcheancier.objects.count(), 2)
+        global_ = InstantaneEcheancier.objects.get(beneficiaire__isnull=True)
+        self.assertEqual((global_.total, global_.montant_retard), (2, Decimal('1000.00')))
+
+    def test_tendance_lue_dans_les_instantanes(self):
+        """Test que la tendance filtre la période et ne lit que les instantanés"""
+        from fournisseurs.models import InstantaneEcheancier
+        from fournisseurs.services import get_tendance_echeancier
+
+        aujourdhui = date.today()
+        for jours in (0, 20, 60, 200):
+            InstantaneEcheancier.objects.create(
+                date_instantane=aujourdhui - timedelta(days=jours),
+                total=jours, montant_total=Decimal(jours),
+            )
+
+        with self.assertNumQueries(1):
+            tendance = get_tendance_echeancier(90)
+        self.assertEqual([ligne['total'] for ligne in tendance], [60, 20, 0])
+        self.assertEqual(len(get_tendance_echeancier(365)), 4)
+
+    def test_vue_tendance(self):
+        """Test l'affichage de la vue d'évolution dans l'admin fournisseurs"""
+        from django.contrib.auth import get_user_model
+        from fournisseurs.models import InstantaneEcheancier
+
+        InstantaneEcheancier.objects.create(
+            date_instantane=date.today(), total=3, montant_total=Decimal('300.00'), montant_retard=Decimal('100.00'),
+        )
+        admin = get_user_model().objects.create_superuser(email='admin@test.com', password='x')
+        self.client.force_login(admin)
+
+        response = self.client.get(reverse('fournisseur_admin:tendance_echeancier'), {'periode': 90})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['periode'], 90)
+        self.assertEqual(response.context['tendance'][0]['part_retard'], 33)
+
+
+class EcheancesDLPTests(FournisseursTestMixin, TestCase):
+    """Tests du calcul des échéances théoriques de l'export Délais Paiement"""
+
+    def test_echeances_calculees_en_lot(self):
+        """Test que le rapport calcule les échéances en lot et rejoint le calcul unitaire"""
+        from core.echeances import calculer_echeance
+        from fournisseurs.exports import construire_rapport_dlp
+        from fournisseurs.models import Contrat
+
+        contrat = Contrat.objects.create(
+            beneficiaire=self.beneficiaire, numero_contrat='CT001', objet='Maintenance',
+            date_debut=date(2026, 1, 1), date_fin=date(2026, 12, 31), mode_paiement='30JFDM',
+            montant_HT=Decimal('10000.00'), taux_de_TVA=Decimal('20'), taux_RAS_TVA=Decimal('0'),
+            taux_RAS_IS=Decimal('0'), taux_RG=Decimal('0'),
+        )
+        self.creer_facture('F001', contrat=contrat, date_execution=date(2026, 1, 31))
+        self.creer_facture('F002', date_execution=date(2026, 2, 10))
+        self.creer_facture('F003')
+
+        rapport = construire_rapport_dlp(Facture.objects.order_by('num_facture'))
+
+        self.assertEqual(
+            list(rapport['Date échéance théorique']),
+            ['31/03/2026', '11/04/2026', 'NA'],
+        )
+        self.assertEqual(calculer_echeance(date(2026, 1, 31), '30JFDM'), date(2026, 3, 31))
+
+    def test_rapport_dlp_calcule_par_colonnes(self):
+        """Test les colonnes calculées du rapport (retards, à sélectionner) par rapport au trimestre précédent"""
+        from fournisseurs.exports import COLONNES_DLP, construire_rapport_dlp, trimestre_precedent
+        from fournisseurs.models import Contrat
+
+        aujourdhui = date(2026, 5, 15)
+        debut, fin = trimestre_precedent(aujourdhui)
+        self.assertEqual((debut, fin), (date(2026, 1, 1), date(2026, 3, 31)))
+        contrat = Contrat.objects.create(
+            beneficiaire=self.beneficiaire, numero_contrat='CT001', objet='Maintenance', moe='fm',
+            date_debut=debut, date_fin=fin, mode_paiement='30JFDM',
+            montant_HT=Decimal('10000.00'), taux_de_TVA=Decimal('20'), taux_RAS_TVA=Decimal('0'),
+            taux_RAS_IS=Decimal('0'), taux_RG=Decimal('0'),
+        )
+        reglements = {}
+        for jours_reglement in (-40, 10, 120):
+            ov = OrdreVirement.objects.create(type_ov='Virement', beneficiaire=self.beneficiaire, compte_tresorerie=self.compte)
+            OrdreVirement.objects.filter(pk=ov.pk).update(date_remise_banque=debut + timedelta(days=jours_reglement))
+            reglements[jours_reglement] = ov
+
+        cas = [
+            ('F01', contrat, debut - timedelta(days=50), reglements[-40]),
+            ('F02', contrat, debut + timedelta(days=5), reglements[10]),
+            ('F03', None, debut - timedelta(days=70), reglements[120]),
+            ('F04', contrat, fin, None),
+            ('F05', None, debut - timedelta(days=300), None),
+            ('F06', contrat, None, None),
+        ]
+        for numero, contrat_facture, execution, ov in cas:
+            self.creer_facture(numero, montant_ht='1234567.50', contrat=contrat_facture,
+                               date_execution=execution, ordre_virement=ov, date_facture=date(2026, 1, 2))
+
+        with self.assertNumQueries(1):
+            rapport = construire_rapport_dlp(Facture.objects.order_by('num_facture'), aujourdhui)
+
+        self.assertEqual(list(rapport.columns), list(COLONNES_DLP))
+        self.assertEqual(
+            list(rapport.iloc[0]),
+            ['fm', 'CT001', '2026-01-02', 'F01', '1234567.50', '1481481.00', 'Fournisseur Test', 'ICE001', 'RC001',
+             '2025-11-12', '30JFDM', '2025-11-22', '1481481.00', '31/12/2025', '1', 'FReglée', '0'],
+        )
+        # Sans contrat : délai par défaut (60 jours) et colonnes du contrat vides
+        self.assertEqual(list(rapport.iloc[2][['MOE', 'Contrat', 'Echéance contractuelle']]), ['', '', ''])
+        self.assertEqual(
+            [list(ligne) for ligne in rapport.iloc[:, -4:].itertuples(index=False)],
+            [
+                ['31/12/2025', '1', 'FReglée', '0'],
+                ['28/02/2026', '0', 'FReglée', '1'],
+                ['22/12/2025', '99', 'FReglée', '0'],  # Réglée après le trimestre : retard à sa fin
+                ['30/04/2026', 'FNReglée', '0', '1'],
+                ['06/05/2025', 'FNReglée', '329', '0'],
+                ['NA', 'FNReglée', 'Echéance invalide', '0'],
+            ],
+        )
+
+
+class ExportsFluxTests(FournisseursTestMixin, TestCase):
+    """Tests des exports CSV/XLSX en flux de l'admin factures"""
+
+    def setUp(self):
+        super().setUp()
+        from django.contrib.auth import get_user_model
+
+        for i in range(5):
+            self.creer_facture(f'F{i:03d}', date_execution=date.today() - timedelta(days=30 * i))
+        self.client.force_login(get_user_model().objects.create_superuser(email='admin@test.com', password='x'))
+
+    def exporter(self, action, export_format):
+        return self.client.post(reverse('fournisseur_admin:fournisseurs_facture_changelist'), {
+            'action': action,
+            '_selected_action': list(Facture.objects.values_list('pk', flat=True)),
+            'format': export_format,
+        })
+
+    def test_csv_en_flux_identique_au_dataset(self):
+        """Test que le CSV en flux reproduit l'export tablib de la resource"""
+        from fournisseurs.admin.facture_admin import FactureResourceSTD
+
+        response = self.exporter('export_std_selected', 'csv')
+
+        self.assertTrue(response.streaming)
+        attendu = FactureResourceSTD().export(Facture.objects.order_by('-pk')).csv
+        self.assertEqual(b''.join(response.streaming_content).decode(), attendu)
+
+    def test_xlsx_write_only(self):
+        """Test que l'export XLSX DLP contient l'en-tête et toutes les lignes"""
+        from io import BytesIO
+        from openpyxl import load_workbook
+        from fournisseurs.exports import COLONNES_DLP, construire_rapport_dlp
+
+        response = self.exporter('export_dlp_selected', 'xlsx')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('export_dlp_', response['Content-Disposition'])
+        feuille = load_workbook(BytesIO(b''.join(response.streaming_content))).active
+        lignes = list(feuille.iter_rows(values_only=True))
+        self.assertEqual(list(lignes[0]), list(COLONNES_DLP))
+        attendu = construire_rapport_dlp(Facture.objects.order_by('-pk'))
+        # Les cellules vides sont relues à None
+        self.assertEqual(
+            [[valeur or '' for valeur in ligne] for ligne in lignes[1:]],
+            [list(ligne) for ligne in attendu.itertuples(index=False)],
+        )
+
+    def test_lots_dlp_conservent_l_ordre(self):
+        """Test que le calcul par lots du rapport DLP suit l'ordre du queryset"""
+        from fournisseurs.exports import lignes_rapport_dlp
+
+        queryset = Facture.objects.order_by('num_facture')
+        lignes = list(lignes_rapport_dlp(queryset, taille_lot=2))
+
+        self.assertEqual([ligne[3] for ligne in lignes], [f'F{i:03d}' for i in range(5)])
+
+
+class SauvegardeBddFrsTests(FournisseursTestMixin, TestCase):
+    """Tests de la commande sauvgarde_bdd_frs (complète puis différentielle)"""
+
+    def sauvegarder(self, *args):
+        """Lance la commande et retourne l'email envoyé"""
+        from io import StringIO
+        from django.core import mail
+        from django.core.management import call_command
+
+        mail.outbox = []
+        call_command('sauvgarde_bdd_frs', '--email', 'compta@test.com', *args, stdout=StringIO(), stderr=StringIO())
+        return mail.outbox[0]
+
+    def feuilles(self, message):
+        from io import BytesIO
+        from openpyxl import load_workbook
+
+        if not message.attachments:
+            return {}
+        _, contenu, _ = message.attachments[0]
+        classeur = load_workbook(BytesIO(contenu), read_only=True)
+        return {feuille.title: list(feuille.iter_rows(values_only=True)) for feuille in classeur}
+
+    def test_sauvegarde_complete_puis_differentielle(self):
+        """Test que seules les lignes modifiées depuis la dernière sauvegarde sont renvoyées"""
+        from fournisseurs.models import SauvegardeBdd
+
+        for i in range(3):
+            self.creer_facture(f'F{i:03d}')
+
+        message = self.sauvegarder()
+        feuilles = self.feuilles(message)
+        self.assertEqual(message.to, ['compta@test.com'])
+        self.assertEqual(len(feuilles['factures']), 4)
+        self.assertEqual(feuilles['factures'][0][:2], ('id', 'created_at'))
+
+        # Rien de modifié : pas de pièce jointe
+        message = self.sauvegarder()
+        self.assertIn('Aucune modification', message.body)
+        self.assertEqual(message.attachments, [])
+
+        facture = Facture.objects.get(num_facture='F001')
+        facture.nature_achat = 'Maintenance'
+        facture.save()
+        feuilles = self.feuilles(self.sauvegarder())
+        self.assertEqual([ligne[0] for ligne in feuilles['factures'][1:]], [facture.pk])
+        self.assertEqual(len(feuilles['beneficiaires']), 1)
+        self.assertEqual(list(SauvegardeBdd.objects.order_by('borne_fin').values_list('mode', 'lignes_exportees')),
+                         [('complet', 6), ('delta', 0), ('delta', 1)])
+
+    def test_sauvegarde_complete_csv(self):
+        """Test la sauvegarde complète forcée en archive de fichiers CSV"""
+        import zipfile
+        from io import BytesIO
+
+        self.creer_facture('F001')
+        self.sauvegarder()
+        nom, contenu, _ = self.sauvegarder('--complet', '--format', 'csv').attachments[0]
+
+        self.assertTrue(nom.endswith('.zip'))
+        archive = zipfile.ZipFile(BytesIO(contenu))
+        self.assertEqual(len(archive.read('factures.csv').decode().splitlines()), 2)
+
+
+class RapportsCacheTests(FournisseursTestMixin, TestCase):
+    """Tests du cache des rapports PDF (empreinte des données, politique de réutilisation)"""
+
+    def setUp(self):
+        from unittest import mock
+
+        super().setUp()
+        self.creer_facture('F001')
+        environnement = mock.patch.dict('os.environ', {'TO_DESTINATAIRES_FACTURES': 'compta@test.com'})
+        environnement.start()
+        self.addCleanup(environnement.stop)
+
+    def executer(self, politique=None):
+        from django.core import mail
+        from utils.emails import executer_rapports
+
+        mail.outbox = []
+        resultats, envoyes, _ = executer_rapports(['factures_impayees'], threads=1, processus=1, politique=politique)
+        return resultats[0], envoyes
+
+    def test_rendu_reutilise_puis_envoi_ignore(self):
+        """Test que des données inchangées ne déclenchent ni nouveau PDF ni, selon la politique, nouvel envoi"""
+        from unittest import mock
+        from core.models import ArtefactRapport
+
+        resultat, envoyes = self.executer()
+        self.assertEqual((envoyes, resultat.reutilise), (1, False))
+        artefact = ArtefactRapport.objects.get(cle='factures_impayees')
+        self.assertIsNotNone(artefact.date_envoi)
+
+        with mock.patch('utils.emails.rendre_pdf_chronometre') as rendu:
+            resultat, envoyes = self.executer()
+            self.assertEqual((envoyes, resultat.reutilise), (1, True))
+            self.assertEqual(resultat.pdf, bytes(artefact.pdf))
+
+            resultat, envoyes = self.executer('ignorer')
+            self.assertEqual((envoyes, resultat.ignore), (0, True))
+        rendu.assert_not_called()
+
+        # Nouvelle facture : nouveau rendu et envoi
+        self.creer_facture('F002')
+        resultat, envoyes = self.executer('ignorer')
+        self.assertEqual((envoyes, resultat.ignore, resultat.reutilise), (1, False, False))
+        self.assertNotEqual(ArtefactRapport.objects.get(cle='factures_impayees').empreinte, artefact.empreinte)
+
+    def test_empreinte_stable(self):
+        """Test que l'empreinte ignore la date de génération et l'ordre des clés"""
+        from core.rapports import empreinte_donnees
+
+        self.assertEqual(
+            empreinte_donnees({'date_generation': date(2026, 1, 1), 'total': Decimal('10.50'), 'n': 1}),
+            empreinte_donnees({'n': 1, 'total': Decimal('10.5'), 'date_generation': date(2026, 1, 2)}),
+        )
+        self.assertNotEqual(empreinte_donnees({'total': Decimal('10.5')}), empreinte_donnees({'total': Decimal('10.6')}))
+
+
+class RapportsReportLabTests(FournisseursTestMixin, TestCase):
+    """Tests du choix du moteur de rendu PDF selon le volume du rapport"""
+
+    def setUp(self):
+        from unittest import mock
+
+        super().setUp()
+        self.creer_facture('F001')
+        self.creer_facture('F002')
+        environnement = mock.patch.dict('os.environ', {'TO_DESTINATAIRES_FACTURES': 'compta@test.com'})
+        environnement.start()
+        self.addCleanup(environnement.stop)
+
+    def executer(self, seuil):
+        from unittest import mock
+        from utils.emails import executer_rapports
+
+        with mock.patch('utils.emails.SEUIL_LIGNES_REPORTLAB', seuil):
+            resultats, _, _ = executer_rapports(['factures_impayees'], envoyer=False, threads=1, processus=1,
+                                                politique='toujours')
+        return resultats[0]
+
+    def test_moteur_selon_nombre_de_lignes(self):
+        """Test que xhtml2pdf rend les petits rapports et ReportLab ceux qui atteignent le seuil"""
+        resultat = self.executer(seuil=3)
+        self.assertIsNone(resultat.document)
+        self.assertIn('F001', resultat.html)
+
+        resultat = self.executer(seuil=2)
+        self.assertEqual(resultat.erreur, '')
+        self.assertEqual(resultat.document.nombre_lignes, 2)
+        self.assertEqual(resultat.html, None)
+        self.assertTrue(resultat.pdf.startswith(b'%PDF'))
+
+    def test_mise_en_page_reprend_le_template(self):
+        """Test le contenu du document ReportLab (mêmes colonnes, formats et total que le template)"""
+        from fournisseurs.services import get_suppliers_invoices_data
+        from utils.mises_en_page import factures_impayees
+        from utils.pdf import tableaux_vers_pdf
+
+        document = factures_impayees(get_suppliers_invoices_data())
+        section = document.sections[0]
+        self.assertEqual([colonne.entete for colonne in section.colonnes],
+                         ['Fournisseur', 'N° Facture', 'Date Facture', 'Échéance', 'Statut', 'Montant'])
+        self.assertEqual(section.lignes[0][0], 'Fournisseur Test')
+        self.assertEqual(section.total, ('TOTAL', ['2000.00 DH']))
+        self.assertEqual(document.indicateurs[0], ('Nombre Factures', '2', False))
+        self.assertTrue(tableaux_vers_pdf(document).startswith(b'%PDF'))
+
+
+class RapportsPipelineTests(FournisseursTestMixin, TestCase):
+    """Tests de la chaîne commune des rapports (executer_rapports, commande envoyer_rapports)"""
+
+    def setUp(self):
+        from unittest import mock
+
+        super().setUp()
+        self.creer_facture('F001', date_echeance=date.today() - timedelta(days=3))
+        environnement = mock.patch.dict('os.environ', {
+            'TO_DESTINATAIRES_FACTURES': 'compta@test.com',
+            'TO_DESTINATAIRES_BC': 'direction@test.com, achats@test.com',
+        })
+        environnement.start()
+        self.addCleanup(environnement.stop)
+
+    def envoyer_rapports(self, *args):
+        from io import StringIO
+        from django.core import mail
+        from django.core.management import call_command
+
+        mail.outbox = []
+        sortie = StringIO()
+        call_command('envoyer_rapports', '--threads', '1', '--processus', '1', '--politique', 'toujours',
+                     *args, stdout=sortie)
+        return sortie.getvalue()
+
+    def test_commande_envoie_tous_les_rapports(self):
+        """Test de bout en bout : un email avec son PDF par rapport"""
+        from django.core import mail
+        from utils.emails import RAPPORTS
+
+        sortie = self.envoyer_rapports()
+
+        self.assertIn('4 email(s) envoyé(s).', sortie)
+        self.assertEqual(len(mail.outbox), len(RAPPORTS))
+        envois = {message.attachments[0][0].rsplit('_', 3)[0]: message for message in mail.outbox}
+        self.assertEqual(set(envois), set(RAPPORTS))
+        self.assertEqual(envois['factures_impayees'].to, ['compta@test.com'])
+        self.assertEqual(envois['bc_non_soldes'].to, ['direction@test.com', 'achats@test.com'])
+        for message in mail.outbox:
+            nom, contenu, type_mime = message.attachments[0]
+            self.assertEqual(type_mime, 'application/pdf')
+            self.assertTrue(contenu.startswith(b'%PDF'))
+        for cle in RAPPORTS:
+            self.assertIn(f'{cle} : envoyé', sortie)
+
+    def test_rapport_en_erreur_n_empeche_pas_les_autres(self):
+        """Test qu'une collecte en échec n'empêche ni la génération ni l'envoi des autres rapports"""
+        import dataclasses
+        from unittest import mock
+        from django.core import mail
+        from utils.emails import RAPPORTS, executer_rapports
+
+        def collecte_en_echec():
+            raise RuntimeError("Base indisponible")
+
+        rapports = dict(RAPPORTS, factures_depassement=dataclasses.replace(
+            RAPPORTS['factures_depassement'], collecter=collecte_en_echec,
+        ))
+        with mock.patch.dict('utils.emails.RAPPORTS', rapports):
+            mail.outbox = []
+            resultats, envoyes, _ = executer_rapports(threads=1, processus=1, politique='toujours')
+            etats = {resultat.rapport.cle: (resultat.envoye, resultat.erreur) for resultat in resultats}
+            self.assertEqual(etats.pop('factures_depassement'), (False, "Base indisponible"))
+            self.assertEqual(set(etats.values()), {(True, '')})
+            self.assertEqual((envoyes, len(mail.outbox)), (3, 3))
+
+            sortie = self.envoyer_rapports('--dry-run')
+        self.assertIn('factures_depassement : Base indisponible', sortie)
+        self.assertIn('factures_impayees : généré', sortie)
+        self.assertIn('aucun email envoyé', sortie)
+        self.assertEqual(mail.outbox, [])
@@ -8,7 +8,8 @@ urlpatterns = [
     path('get_comptes_tresorerie/', views.get_comptes_tresorerie, name='get_comptes_tresorerie'),
     path('get-contrats/', views.get_contrats_all, name='get_contrats'),
     path('get-factures/', views.get_factures_all, name='get_factures'),
-    path('update-facture-association/', views.update_facture_association, name='update_facture_association'),
-    path('update-montant-ordre-virement/', views.update_montant_ordre_virement, name='update_montant_ordre_virement'),
-    path('ordrevirement/generate-ov-pdf/<int:pk>/', views.generate_ov_pdf, name='generate_ov_pdf'),
+    path('get-factures-ov/', views.get_factures_ov, name='get_factures_ov'),
+    path('update-factures-ordre-virement/', views.update_factures_ordre_virement, name='update_factures_ordre_virement'),
+    path('update-montant-ordre-virement/<int:ordre_virement_id>/', views.update_montant_ordre_virement, name='update_montant_ordre_virement'),
+    path('ordrevirement/generate-ov-pdf/<int:ordre_virement_id>/', views.generate_ov_pdf, name='generate_ov_pdf'),
 ]
\ No newline at end of file
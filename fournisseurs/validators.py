@@ -13,8 +13,9 @@ def verifier_modifications_autorisees(instance, ancienne_instance, champs_modifi
     for field in instance._meta.fields:
         field_name = field.name
         if field_name not in champs_modifiables:
-            ancienne_valeur = getattr(ancienne_instance, field_name)
-            nouvelle_valeur = getattr(instance, field_name)
+            # attname : pour une clé étrangère on compare les ids sans charger l'objet lié
+            ancienne_valeur = getattr(ancienne_instance, field.attname)
+            nouvelle_valeur = getattr(instance, field.attname)
             if ancienne_valeur != nouvelle_valeur:
                 raise ValidationError(
                     f"Vous ne pouvez pas modifier le champ '{field_name}' dans cet état."
@@ -21,6 +21,9 @@ SOCIETE = config('SOCIETE')
 # settings/base.py -> settings/ -> mysite/ -> mysite_backend/ (racine)
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 
+# Fichiers privés (exports en arrière-plan) : hors de MEDIA_ROOT, qui est servi publiquement
+EXPORTS_ROOT = BASE_DIR / 'private' / 'exports'
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/3.2/howto/deployment/checklist/
 
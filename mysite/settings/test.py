@@ -30,6 +30,7 @@ REST_FRAMEWORK = {
 
 # Configuration simplifiée pour les tests
 MEDIA_ROOT = '/tmp/test_media'
+EXPORTS_ROOT = '/tmp/test_exports'
 STATIC_ROOT = '/tmp/test_static'
 
 # Désactiver les migrations pour accélérer les tests
@@ -1,5 +1,6 @@
 from django.db import models
 from django.core.mail import EmailMessage
+from core.mails import mettre_en_file
 from django.dispatch import receiver
 from django.db.models.signals import post_save
 from .validators import validate_file_extension
@@ -56,4 +57,4 @@ def envoyer_email_nouvel_enregistrement(sender, instance, created, **kwargs):
             bcc=cci_destinataires
         )
 
-        email.send()
\ No newline at end of file
+        mettre_en_file(email, origine='omra.Omra')
\ No newline at end of file
@@ -2,7 +2,9 @@ from django.contrib import admin
 from import_export import resources, fields
 from import_export.admin import ImportExportModelAdmin
 from import_export.widgets import Widget  # ForeignKeyWidget
-from django.core.mail import EmailMessage
+from core.exports import enregistrer_export, lancer_export
+from core.mails import lancer_envoi_groupe
+from core.resources import RelationsExportMixin
 from .models import Ville, Periode, Stage
 
 # Register your models here.
@@ -24,7 +26,7 @@ class PeriodeWidget(Widget):
         return value.periode if value else ''
 
 # Define a custom resource for Stage
-class StageResource(resources.ModelResource):
+class StageResource(RelationsExportMixin, resources.ModelResource):
     ville = fields.Field(attribute='ville__ville', column_name='Ville')
     villeEcole = fields.Field(attribute='villeEcole__ville', column_name='VilleEcole')
     selectedPeriode = fields.Field(attribute='selectedPeriode__periode', column_name='selectedPeriode')
@@ -35,8 +37,9 @@ class StageResource(resources.ModelResource):
         export_order = fields
 
 def send_mass_email(modeladmin, request, queryset):
-    for stage in queryset:
-        sujet = 'Candidature de stage'
+    # Envoi en arrière-plan, par lots sur une même connexion SMTP : l'action rend la main immédiatement
+    destinataires = []
+    for stage in queryset.select_related('ville'):
         message = (
             f'Suite à votre demande de stage sur www.supratourstravel.com, vous êtes invités à l\'entretient à la gare ONCF de {stage.ville} le xx/xx/2024.\n\n'
             f'Détails du stage :\n'
@@ -45,27 +48,27 @@ def send_mass_email(modeladmin, request, queryset):
             f'Email : {stage.email}\n'
             f'Téléphone : {stage.tel}\n'
         )
-        destinataires = [stage.email]  # Ajouter l'email du candidat
-        cc_destinataires = []  # Vous pouvez ajouter d'autres destinataires en copie
-        cci_destinataires = ['ahmederrami@gmail.com']  # Vous pouvez ajouter d'autres destinataires en copie cachée
-
-        email = EmailMessage(
-            sujet,
-            message,
-            'supratourstravel2009@gmail.com',
-            to=destinataires,
-            cc=cc_destinataires,
-            bcc=cci_destinataires
-        )
+        destinataires.append((stage.email, message))  # Email du candidat
+
+    lancer_envoi_groupe(
+        modeladmin,
+        request,
+        libelle="Invitation des stagiaires",
+        sujet='Candidature de stage',
+        destinataires=destinataires,
+        expediteur='supratourstravel2009@gmail.com',
+        cc=[],  # Vous pouvez ajouter d'autres destinataires en copie
+        cci=['ahmederrami@gmail.com'],  # Vous pouvez ajouter d'autres destinataires en copie cachée
+    )
+
+send_mass_email.short_description = "Envoyer un email aux stagiaires sélectionnés"
 
-        try:
-            email.send()
-        except Exception as e:
-            modeladmin.message_user(request, f"Erreur lors de l'envoi à {stage.email}: {e}", level='error')
+enregistrer_export('stages', "Candidatures de stage", Stage, resource_class=StageResource)
 
-    modeladmin.message_user(request, "Emails envoyés avec succès")
+def export_arriere_plan(modeladmin, request, queryset):
+    lancer_export(modeladmin, request, queryset, 'stages')
 
-send_mass_email.short_description = "Envoyer un email aux stagiaires sélectionnés"
+export_arriere_plan.short_description = "Exporter en arrière-plan"
 
 class StageAdmin(ImportExportModelAdmin):
     resource_class = StageResource
@@ -73,7 +76,7 @@ class StageAdmin(ImportExportModelAdmin):
     list_editable = ('ville', 'villeEcole', 'selectedPeriode')
     list_filter = ('traite', 'ville', 'selectedPeriode', 'created_at', 'encore_scolarise')
     list_per_page = 50
-    actions = [send_mass_email]  # Ajoutez l'action ici
+    actions = [send_mass_email, export_arriere_plan]  # Ajoutez l'action ici
 
     # Define all fields
     all_fields = ['civilite', 'nom', 'prenom', 'cin', 'dateN', 'tel', 'email', 'adress', 'ville', 'niveau', 'ecole', 'specialite', 'villeEcole', 'encore_scolarise', 'selectedPeriode', 'created_at', 'cv', 'lettre', 'isChecked', 'traite', 'commentaire']
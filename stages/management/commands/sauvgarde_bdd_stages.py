@@ -1,125 +1,126 @@
 # sauvgarde_bdd_stages.py
 
+import os
+import time
+from datetime import datetime
+from tempfile import TemporaryDirectory
+
 from django.core.management.base import BaseCommand
 from django.core.mail import EmailMessage
-from django.db import models
 from decouple import config
+from openpyxl import Workbook
 import pandas as pd
-from datetime import datetime
 
-from stages.models import Stage, Ville, Periode
+from core.exports import TAILLE_LOT_EXPORT, ajouter_feuille
+from stages.models import Stage, Periode
+
+# Colonnes du classeur -> champ values()
+COLONNES_STAGES = {
+    'CIN': 'cin',
+    'Civilité': 'civilite',
+    'Nom': 'nom',
+    'Prénom': 'prenom',
+    'Date de naissance': 'dateN',
+    'Téléphone': 'tel',
+    'Email': 'email',
+    'Adresse': 'adress',
+    'Ville origine': 'ville__ville',
+    'Niveau': 'niveau',
+    'École': 'ecole',
+    'Spécialité': 'specialite',
+    'Ville école': 'villeEcole__ville',
+    'Période': 'selectedPeriode__periode',
+    'Date création': 'created_at',
+}
+
+COLONNES_STATISTIQUES = ['Type', 'Catégorie', 'Nombre de stages']
+
+
+def charger_stages():
+    """Tous les stages en une requête, du plus récent au plus ancien"""
+    valeurs = (
+        Stage.objects.order_by('-created_at')
+        .values_list(*COLONNES_STAGES.values())
+        .iterator(chunk_size=TAILLE_LOT_EXPORT)
+    )
+    stages = pd.DataFrame.from_records(valeurs, columns=list(COLONNES_STAGES))
+    # Dates de création en UTC sans fuseau (non supportées par Excel)
+    stages['Date création'] = pd.to_datetime(stages['Date création'], utc=True).dt.tz_localize(None)
+    return stages
+
+
+def nom_feuille(ville):
+    """Nom de feuille Excel valide pour une ville"""
+    return ville[:31].replace('/', '-')  # Excel limite à 31 caractères
+
+
+def calculer_statistiques(stages, periodes):
+    """
+    Statistiques des stages, déduites du DataFrame des stages.
+
+    Args:
+        stages: DataFrame retourné par charger_stages
+        periodes: Libellés de toutes les périodes (comptées même sans stage)
+    """
+    par_ville = stages.groupby('Ville origine').size()
+    par_periode = stages.groupby('Période').size().reindex(periodes, fill_value=0)
+
+    def lignes(type_stat, effectifs):
+        effectifs = effectifs.rename_axis('Catégorie').reset_index(name='Nombre de stages')
+        effectifs = effectifs.sort_values(['Nombre de stages', 'Catégorie'], ascending=[False, True])
+        effectifs.insert(0, 'Type', type_stat)
+        return effectifs
+
+    general = pd.DataFrame([{'Type': 'Général', 'Catégorie': 'Total stages', 'Nombre de stages': len(stages)}])
+    return pd.concat([lignes('Par ville', par_ville), lignes('Par période', par_periode), general],
+                     ignore_index=True)[COLONNES_STATISTIQUES]
 
-def export_stages_by_ville():
+
+def _lignes(df):
+    return df.itertuples(index=False, name=None)
+
+
+def export_stages_by_ville(fichier):
     """
-    Exporte les données des stages vers un fichier Excel avec une feuille par ville
+    Exporte les données des stages vers un classeur Excel avec une feuille par ville.
+
+    Une seule lecture des stages ; les feuilles par ville et les statistiques en sont
+    déduites (groupby) et écrites en mode write-only, feuille après feuille.
+
+    Args:
+        fichier: Chemin ou fichier binaire ouvert du classeur
+
+    Returns:
+        dict: Durée (secondes) de chaque phase
     """
-    # Nom du fichier Excel avec timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f'stages_par_ville_{timestamp}.xlsx'
-
-    # Créer un writer Excel
-    writer = pd.ExcelWriter(filename, engine='xlsxwriter')
-
-    def make_timezone_naive(df):
-        """Convert timezone-aware datetime columns to naive"""
-        for col in df.columns:
-            if pd.api.types.is_datetime64_any_dtype(df[col]):
-                # Si c'est timezone-aware, le rendre naive
-                if hasattr(df[col].dtype, 'tz') and df[col].dtype.tz is not None:
-                    df[col] = df[col].dt.tz_localize(None)
-        return df
-
-    def prepare_stage_data(stages_queryset):
-        """Prépare les données des stages pour l'export Excel"""
-        stages_data = []
-        
-        for stage in stages_queryset:
-            stages_data.append({
-                'CIN': stage.cin,
-                'Civilité': stage.civilite,
-                'Nom': stage.nom,
-                'Prénom': stage.prenom,
-                'Date de naissance': stage.dateN,
-                'Téléphone': stage.tel,
-                'Email': stage.email,
-                'Adresse': stage.adress,
-                'Ville origine': stage.ville.ville,
-                'Niveau': stage.niveau,
-                'École': stage.ecole,
-                'Spécialité': stage.specialite,
-                'Ville école': stage.villeEcole.ville,
-                'Période': stage.selectedPeriode.periode,
-                'Date création': stage.created_at,
-            })
-        
-        df = pd.DataFrame(stages_data)
-        return make_timezone_naive(df)
-
-    # Récupérer toutes les villes qui ont des stages
-    villes_avec_stages = Ville.objects.filter(ville_origine__isnull=False).distinct().order_by('ville')
-    
+    durees = {}
+    debut = time.perf_counter()
+
+    stages = charger_stages()
+    periodes = list(Periode.objects.values_list('periode', flat=True))
+    durees['lecture'] = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    villes = stages.groupby('Ville origine', sort=True)
+    statistiques = calculer_statistiques(stages, periodes)
+    durees['calcul'] = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    classeur = Workbook(write_only=True)
+    entetes = list(COLONNES_STAGES)
     # Feuille de synthèse générale
-    all_stages = Stage.objects.select_related('ville', 'villeEcole', 'selectedPeriode').order_by('-created_at')
-    df_synthese = prepare_stage_data(all_stages)
-    df_synthese.to_excel(writer, sheet_name='Synthèse générale', index=False)
-    
-    # Feuille par ville
-    for ville in villes_avec_stages:
-        # Nettoyer le nom de la ville pour le nom de la feuille Excel
-        sheet_name = ville.ville[:31]  # Excel limite à 31 caractères
-        sheet_name = sheet_name.replace('/', '-')  # Remplacer les caractères invalides
-        
-        # Récupérer les stages pour cette ville
-        stages_ville = Stage.objects.filter(ville=ville).select_related('ville', 'villeEcole', 'selectedPeriode').order_by('-created_at')
-        
-        if stages_ville.exists():
-            df_ville = prepare_stage_data(stages_ville)
-            df_ville.to_excel(writer, sheet_name=sheet_name, index=False)
-    
+    ajouter_feuille(classeur, 'Synthèse générale', entetes, _lignes(stages))
+    # Feuille par ville (villes ayant des stages)
+    for ville, stages_ville in villes:
+        ajouter_feuille(classeur, nom_feuille(ville), entetes, _lignes(stages_ville))
     # Feuille statistiques
-    create_stats_sheet(writer)
-    
-    # Sauvegarder
-    writer.close()
-    return filename
-
-def create_stats_sheet(writer):
-    """Crée une feuille avec les statistiques des stages"""
-    stats_data = []
-    
-    # Statistiques par ville
-    villes_stats = Ville.objects.filter(ville_origine__isnull=False).annotate(
-        nb_stages=models.Count('ville_origine')
-    ).order_by('-nb_stages')
-    
-    for ville_stat in villes_stats:
-        stats_data.append({
-            'Type': 'Par ville',
-            'Catégorie': ville_stat.ville,
-            'Nombre de stages': ville_stat.nb_stages
-        })
-    
-    # Statistiques par période
-    periodes_stats = Periode.objects.annotate(
-        nb_stages=models.Count('stages')
-    ).order_by('-nb_stages')
-    
-    for periode_stat in periodes_stats:
-        stats_data.append({
-            'Type': 'Par période',
-            'Catégorie': periode_stat.periode,
-            'Nombre de stages': periode_stat.nb_stages
-        })
-    
-    # Statistiques générales
-    total_stages = Stage.objects.count()
-    
-    stats_data.extend([
-        {'Type': 'Général', 'Catégorie': 'Total stages', 'Nombre de stages': total_stages},
-    ])
-    
-    df_stats = pd.DataFrame(stats_data)
-    df_stats.to_excel(writer, sheet_name='Statistiques', index=False)
+    ajouter_feuille(classeur, 'Statistiques', COLONNES_STATISTIQUES, _lignes(statistiques))
+    classeur.save(fichier)
+    durees['ecriture'] = time.perf_counter() - debut
+
+    return durees
+
+
 def send_email_with_attachment(filename, subject, body, to_emails=None):
     """
     Envoie un email avec le fichier en pièce jointe
@@ -128,7 +129,7 @@ def send_email_with_attachment(filename, subject, body, to_emails=None):
         # Utiliser les destinataires par défaut pour les stages
         cci_destinataires = config('CCI_DESTINATAIRES_STAGES', default='').split(',')
         to_emails = [email.strip() for email in cci_destinataires if email.strip()]
-        
+
         if not to_emails:
             to_emails = ['a.errami@supratourstravel.com']
 
@@ -140,8 +141,7 @@ def send_email_with_attachment(filename, subject, body, to_emails=None):
     )
 
     # Attacher le fichier Excel
-    with open(filename, 'rb') as file:
-        email.attach(filename, file.read(), 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    email.attach_file(filename, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
 
     email.send()
 
@@ -158,31 +158,37 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         try:
-            # Importer les models nécessaires pour les statistiques
-            from django.db import models
-            
-            # Exporter les données vers Excel
-            filename = export_stages_by_ville()
-            self.stdout.write(self.style.SUCCESS('Export des stages par ville terminé'))
-
-            # Déterminer les destinataires
-            recipients = options['email'] if options['email'] else None
-
-            # Envoyer par email
-            subject = 'Export des stages regroupés par ville'
-            body = ('Veuillez trouver ci-joint l\'export des stages regroupés par ville.\n\n'
-                   'Le classeur contient :\n'
-                   '- Une feuille de synthèse générale avec tous les stages\n'
-                   '- Une feuille par ville avec les stages correspondants\n'
-                   '- Une feuille de statistiques\n\n'
-                   'Export généré automatiquement.')
-
-            send_email_with_attachment(
-                filename=filename,
-                subject=subject,
-                body=body,
-                to_emails=recipients
-            )
+            with TemporaryDirectory() as dossier:
+                # Nom du fichier Excel avec timestamp
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                filename = os.path.join(dossier, f'stages_par_ville_{timestamp}.xlsx')
+
+                # Exporter les données vers Excel
+                durees = export_stages_by_ville(filename)
+                self.stdout.write(self.style.SUCCESS('Export des stages par ville terminé'))
+
+                # Déterminer les destinataires
+                recipients = options['email'] if options['email'] else None
+
+                # Envoyer par email
+                subject = 'Export des stages regroupés par ville'
+                body = ('Veuillez trouver ci-joint l\'export des stages regroupés par ville.\n\n'
+                       'Le classeur contient :\n'
+                       '- Une feuille de synthèse générale avec tous les stages\n'
+                       '- Une feuille par ville avec les stages correspondants\n'
+                       '- Une feuille de statistiques\n\n'
+                       'Export généré automatiquement.')
+
+                debut = time.perf_counter()
+                send_email_with_attachment(
+                    filename=filename,
+                    subject=subject,
+                    body=body,
+                    to_emails=recipients
+                )
+                durees['envoi'] = time.perf_counter() - debut
+
+            self.stdout.write(', '.join(f'{phase} : {duree:.2f}s' for phase, duree in durees.items()))
 
             if recipients:
                 self.stdout.write(self.style.SUCCESS(f'Fichier envoyé par email à {", ".join(recipients)}'))
@@ -190,4 +196,4 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.SUCCESS('Fichier envoyé par email au destinataire par défaut'))
 
         except Exception as e:
-            self.stderr.write(self.style.ERROR(f'Erreur lors de l\'export: {str(e)}'))
\ No newline at end of file
+            self.stderr.write(self.style.ERROR(f'Erreur lors de l\'export: {str(e)}'))
@@ -1,5 +1,6 @@
 from django.db import models
 from django.core.mail import EmailMessage
+from core.mails import mettre_en_file
 from django.dispatch import receiver
 from django.db.models.signals import pre_save, post_save, post_delete
 from .validators import validate_file_extension
@@ -96,7 +97,7 @@ def envoyer_email_nouvel_enregistrement(sender, instance, created, **kwargs):
             bcc=cci_destinataires
         )
 
-        email.send()
+        mettre_en_file(email, origine='stages.Stage')
 
 # Signal pour supprimer les fichiers liés (cv et lettre) après la suppression d'un Stage
 @receiver(post_delete, sender=Stage)
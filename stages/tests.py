@@ -1,3 +1,221 @@
+"""
+Tests pour l'application stages
+"""
+from datetime import date, datetime, timezone as dt_timezone
+from io import BytesIO, StringIO
+
+from django.core import mail
+from django.core.management import call_command
 from django.test import TestCase
+from openpyxl import load_workbook
+
+from stages.models import Periode, Stage, Ville
+
+
+class StagesTestMixin:
+    """Trois candidatures (deux à Rabat, une à Fès) sur la période de juillet"""
+
+    def setUp(self):
+        self.rabat = Ville.objects.create(ville='Rabat')
+        self.fes = Ville.objects.create(ville='Fès')
+        self.juillet = Periode.objects.create(periode='Juillet')
+        Periode.objects.create(periode='Août')
+        # bulk_create : sans les emails des signaux
+        Stage.objects.bulk_create([self.stage(i, ville) for i, ville in enumerate([self.rabat, self.fes, self.rabat])])
+        for i in range(3):
+            Stage.objects.filter(cin=f'CIN{i}').update(created_at=datetime(2026, 1, 1 + i, tzinfo=dt_timezone.utc))
+
+
+    def stage(self, i, ville):
+        return Stage(civilite='M', nom=f'Nom{i}', prenom='Prénom', cin=f'CIN{i}', dateN=date(2000, 1, 1),
+                     tel='0600000000', email=f'stage{i}@test.com', adress='Adresse', ville=ville,
+                     niveau='Bac+3', ecole='École', specialite='Info', villeEcole=self.rabat,
+                     selectedPeriode=self.juillet, cv='stages/cv.pdf', lettre='stages/lettre.pdf')
+
+
+class SauvegardeBddStagesTests(StagesTestMixin, TestCase):
+    """Tests de la commande sauvgarde_bdd_stages"""
+
+    def test_classeur_par_ville_en_requetes_constantes(self):
+        """Test le contenu du classeur et le nombre de requêtes (indépendant du nombre de villes)"""
+        stdout = StringIO()
+        # Stages + périodes
+        with self.assertNumQueries(2):
+            call_command('sauvgarde_bdd_stages', '--email', 'rh@test.com', stdout=stdout, stderr=StringIO())
+
+        self.assertIn('lecture :', stdout.getvalue())
+        _, contenu, _ = mail.outbox[0].attachments[0]
+        classeur = load_workbook(BytesIO(contenu), read_only=True)
+        feuilles = {feuille.title: list(feuille.iter_rows(values_only=True)) for feuille in classeur}
+
+        self.assertEqual(list(feuilles), ['Synthèse générale', 'Fès', 'Rabat', 'Statistiques'])
+        self.assertEqual(len(feuilles['Synthèse générale']), 4)
+        self.assertEqual([ligne[0] for ligne in feuilles['Rabat'][1:]], ['CIN2', 'CIN0'])
+        self.assertEqual(feuilles['Fès'][1][8], 'Fès')
+        self.assertEqual(feuilles['Statistiques'][1:], [
+            ('Par ville', 'Rabat', 2),
+            ('Par ville', 'Fès', 1),
+            ('Par période', 'Juillet', 3),
+            ('Par période', 'Août', 0),
+            ('Général', 'Total stages', 3),
+        ])
+
+
+class EnvoiGroupeStagesTests(StagesTestMixin, TestCase):
+    """Tests de l'envoi groupé des invitations (action d'admin et envoi par lots)"""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+
+        super().setUp()
+        self.admin = get_user_model().objects.create_superuser(email='admin@test.com', password='x')
+        self.client.force_login(self.admin)
+
+    def test_action_programme_puis_envoie_par_lots(self):
+        """Test que l'action rend la main et que l'envoi consigne le résultat de chaque destinataire"""
+        from unittest import mock
+        from django.urls import reverse
+        from core.mails import executer_envoi_groupe
+        from core.models import EnvoiGroupe
+
+        with mock.patch('core.mails.demarrer_envoi_groupe') as demarrer, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin:stages_stage_changelist'), {
+                'action': 'send_mass_email',
+                '_selected_action': list(Stage.objects.values_list('pk', flat=True)),
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(mail.outbox, [])
+
+        envoi = EnvoiGroupe.objects.get()
+        demarrer.assert_called_once_with(envoi.pk)
+        self.assertEqual((envoi.statut, envoi.destinataires.count(), envoi.created_by), ('en_attente', 3, self.admin))
+
+        attentes = []
+        self.assertTrue(executer_envoi_groupe(envoi.pk, taille_lot=2, attendre=attentes.append))
+        self.assertFalse(executer_envoi_groupe(envoi.pk))
+
+        envoi.refresh_from_db()
+        self.assertEqual((envoi.statut, envoi.nombre_envoyes, envoi.nombre_echecs), ('termine', 3, 0))
+        self.assertEqual(attentes, [1.0])  # Une pause entre les deux lots
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].bcc, ['ahmederrami@gmail.com'])
+        self.assertIn('gare ONCF de Rabat', mail.outbox[0].body)
+
+    def test_commande_reprend_les_envois_interrompus(self):
+        """Test que envoyer_emails reprend un envoi arrêté en cours ou jamais démarré, pas un envoi actif"""
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+        from core.models import DestinataireEnvoi, EnvoiGroupe
+
+        il_y_a_une_heure = timezone.now() - timedelta(hours=1)
+        envois = {}
+        for libelle, statut, date_debut in [
+            ('interrompu', 'en_cours', il_y_a_une_heure),
+            ('non_demarre', 'en_attente', None),
+            ('actif', 'en_cours', il_y_a_une_heure),
+        ]:
+            envoi = EnvoiGroupe.objects.create(libelle=libelle, sujet='Invitation', statut=statut, date_debut=date_debut)
+            DestinataireEnvoi.objects.create(envoi=envoi, email=f'{libelle}.envoye@test.com', corps='Corps',
+                                             statut='envoye', date_envoi=date_debut)
+            DestinataireEnvoi.objects.create(envoi=envoi, email=f'{libelle}@test.com', corps='Corps')
+            envois[libelle] = envoi
+        # Dernier email de l'envoi actif à l'instant : son thread progresse encore
+        envois['actif'].destinataires.filter(statut='envoye').update(date_envoi=timezone.now())
+
+        sortie = StringIO()
+        call_command('envoyer_emails', '--une-fois', stdout=sortie)
+
+        self.assertIn('2 envoi(s) groupé(s) repris.', sortie.getvalue())
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['interrompu@test.com', 'non_demarre@test.com'])
+        statuts = dict(EnvoiGroupe.objects.values_list('libelle', 'statut'))
+        self.assertEqual(statuts, {'interrompu': 'termine', 'non_demarre': 'termine', 'actif': 'en_cours'})
+        self.assertEqual(EnvoiGroupe.objects.get(libelle='interrompu').nombre_envoyes, 2)
+
+    def test_reessai_des_erreurs_temporaires(self):
+        """Test qu'une erreur 4xx est réessayée et qu'un refus définitif ne l'est pas"""
+        import smtplib
+        from django.core.mail import EmailMessage
+        from django.core.mail.backends.locmem import EmailBackend
+        from core.mails import envoyer_en_lots
+
+        class Connexion(EmailBackend):
+            erreurs = [smtplib.SMTPServerDisconnected('Coupure'), None, smtplib.SMTPDataError(550, b'Refus')]
+
+            def send_messages(self, messages):
+                erreur = self.erreurs.pop(0) if self.erreurs else None
+                if erreur:
+                    raise erreur
+                return super().send_messages(messages)
+
+        messages = [EmailMessage('Sujet', 'Corps', 'rh@test.com', [f'stage{i}@test.com']) for i in range(2)]
+        attentes = []
+        resultats = list(envoyer_en_lots(messages, connection=Connexion(), attendre=attentes.append))
+
+        self.assertEqual([(r.envoye, r.tentatives) for r in resultats], [(True, 2), (False, 1)])
+        self.assertIn('Refus', resultats[1].erreur)
+        self.assertEqual(attentes, [2.0])
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class BoiteEnvoiTests(StagesTestMixin, TestCase):
+    """Tests de la boîte d'envoi des signaux (EmailSortant) et de la commande envoyer_emails"""
+
+    def test_signal_met_en_file_puis_commande_envoie(self):
+        """Test que l'email de confirmation n'est envoyé que par la commande, et pas si l'enregistrement est annulé"""
+        from django.db import transaction
+        from core.models import EmailSortant
+
+        try:
+            with transaction.atomic():
+                self.stage(10, self.rabat).save()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(EmailSortant.objects.exists())
+
+        self.stage(11, self.fes).save()
+        email = EmailSortant.objects.get()
+        self.assertEqual((email.statut, email.destinataires, email.origine),
+                         ('en_attente', ['stage11@test.com'], 'stages.Stage'))
+        self.assertEqual(mail.outbox, [])
+
+        stdout = StringIO()
+        call_command('envoyer_emails', '--une-fois', stdout=stdout)
+
+        email.refresh_from_db()
+        self.assertEqual((email.statut, email.tentatives), ('envoye', 1))
+        self.assertIn('1 email(s) envoyé(s)', stdout.getvalue())
+        self.assertEqual(mail.outbox[0].to, ['stage11@test.com'])
+        self.assertIn('Ville : Fès', mail.outbox[0].body)
+
+    def test_reessai_espace_puis_abandon(self):
+        """Test qu'une erreur temporaire reprogramme l'email plus tard et qu'une erreur définitive l'abandonne"""
+        import smtplib
+        from datetime import timedelta
+        from unittest import mock
+        from django.utils import timezone
+        from core.mails import DELAI_REESSAI_EMAIL_SORTANT, vider_boite_envoi
+        from core.models import EmailSortant
+
+        self.stage(10, self.rabat).save()
+        connexion = mock.Mock()
+        connexion.send_messages.side_effect = smtplib.SMTPServerDisconnected('Coupure')
+        with mock.patch('core.mails.get_connection', return_value=connexion):
+            self.assertEqual(vider_boite_envoi(), {'envoye': 0, 'en_attente': 1, 'echec': 0})
+            email = EmailSortant.objects.get()
+            self.assertEqual((email.statut, email.tentatives), ('en_attente', 1))
+            self.assertGreater(email.prochain_essai, timezone.now() + DELAI_REESSAI_EMAIL_SORTANT / 2)
+
+            # Pas encore dû
+            self.assertEqual(vider_boite_envoi(), {'envoye': 0, 'en_attente': 0, 'echec': 0})
+
+            EmailSortant.objects.update(prochain_essai=timezone.now() - timedelta(seconds=1))
+            connexion.send_messages.side_effect = smtplib.SMTPRecipientsRefused({'stage10@test.com': (550, b'Inconnu')})
+            self.assertEqual(vider_boite_envoi(), {'envoye': 0, 'en_attente': 0, 'echec': 1})
 
-# Create your tests here.
+        email.refresh_from_db()
+        self.assertEqual((email.statut, email.tentatives), ('echec', 2))
+        self.assertEqual(connexion.send_messages.call_count, 2)
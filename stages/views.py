@@ -6,6 +6,7 @@
     #queryset = Stage.objects.all()
     #serializer_class = StageSerializer
 
+from django.db import transaction
 from rest_framework import generics
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -30,6 +31,8 @@ class StageCreateAPIView(APIView):
     def post(self, request, *args, **kwargs):
         serializer = StageSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            # La candidature et son email de confirmation (boîte d'envoi) sont enregistrés ensemble
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
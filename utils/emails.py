@@ -1,179 +1,341 @@
-from io import BytesIO
+"""
+Rapports PDF envoyés par email (tableau de bord hebdomadaire, factures fournisseurs, BC non soldés).
 
-from django.core.mail import EmailMessage
+Chaque rapport est déclaré dans RAPPORTS ; executer_rapports() les traite ensemble :
+1. collecte des données et rendu HTML en parallèle (threads, une connexion base par thread)
+2. rendu PDF en parallèle (processus, le rendu étant limité par le GIL) : xhtml2pdf depuis le
+   template HTML, ou ReportLab (utils.mises_en_page) au-delà de SEUIL_LIGNES_REPORTLAB lignes
+3. envoi de tous les emails sur une seule connexion SMTP
+
+Les données inchangées depuis le dernier rendu (empreinte, core.rapports) évitent un nouveau
+rendu PDF, voire l'envoi, selon la politique de cache du rapport.
+"""
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Callable
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections
 from django.template.loader import render_to_string
 from decouple import config
-from xhtml2pdf import pisa
 
 from clients.services import get_weekly_dashboard_data
+from core.rapports import (
+    artefacts_inchanges,
+    empreinte_donnees,
+    enregistrer_artefact,
+    envoi_inutile,
+    marquer_envoyes,
+)
 from fournisseurs.services import (
     get_suppliers_invoices_data,
     get_suppliers_overdue_invoices_data,
     get_suppliers_unsettled_po_data,
 )
+from utils import mises_en_page
+from utils.pdf import rendre_pdf_chronometre
 
-def generer_et_envoyer_dashboard_hebdo():
-    # 1. Collecter les données de vos modèles
-    data = get_weekly_dashboard_data()
-    
-    # 2. Rendre le template HTML avec les données
-    html_string = render_to_string('clients/pdf/dashboard_hebdo.html', {'data': data})
-    
-    # 3. Convertir le HTML en PDF avec xhtml2pdf/reportlab
-    pdf_buffer = BytesIO()
-    pdf_status = pisa.CreatePDF(src=html_string, dest=pdf_buffer, encoding='utf-8')
-    if pdf_status.err:
-        raise ValueError("La generation du PDF dashboard a echoue avec xhtml2pdf.")
-
-    pdf_file = pdf_buffer.getvalue()
-    
-    # 4. Préparer l'email
-    sujet = f"Rapport Hebdomadaire Recouvrement - {data['date_generation'].strftime('%d/%m/%Y')}"
-    corps_email = (
+logger = logging.getLogger(__name__)
+
+# Parallélisme par défaut des étapes collecte (threads) et rendu PDF (processus)
+THREADS_COLLECTE = 4
+PROCESSUS_PDF = 2
+
+# Nombre de lignes de tableau à partir duquel le PDF est construit avec ReportLab plutôt que xhtml2pdf
+SEUIL_LIGNES_REPORTLAB = 300
+
+
+@dataclass(frozen=True)
+class Rapport:
+    cle: str
+    collecter: Callable  # () -> dict contenant 'date_generation'
+    template: str
+    sujet: str  # {date} : date de génération
+    corps: str
+    prefixe_fichier: str
+    variable_destinataires: str  # variable d'environnement, adresses séparées par des virgules
+    libelle_pdf: str
+    politique_cache: str = 'reutiliser'  # voir core.rapports.POLITIQUES_CACHE
+    mise_en_page: Callable = None  # (data) -> utils.pdf.DocumentTableaux, rendu ReportLab des gros volumes
+
+    def destinataires(self):
+        to_emails = [email.strip() for email in config(self.variable_destinataires, default='').split(',') if email.strip()]
+        if not to_emails:
+            raise ValueError(f"Aucun destinataire configure dans {self.variable_destinataires}.")
+        return to_emails
+
+
+@dataclass
+class ResultatRapport:
+    rapport: Rapport
+    destinataires: list = field(default_factory=list)
+    data: dict = None
+    html: str = None
+    document: object = None  # DocumentTableaux si le rapport est rendu avec ReportLab
+    pdf: bytes = None
+    empreinte: str = ''
+    reutilise: bool = False  # PDF du rendu précédent, données inchangées
+    ignore: bool = False  # Données inchangées et déjà envoyées
+    envoye: bool = False
+    erreur: str = ''
+    durees: dict = field(default_factory=dict)
+
+    @property
+    def nom_fichier(self):
+        return f"{self.rapport.prefixe_fichier}_{self.data['date_generation'].strftime('%Y_%m_%d')}.pdf"
+
+    def message(self, connection=None):
+        email = EmailMessage(
+            subject=self.rapport.sujet.format(date=self.data['date_generation'].strftime('%d/%m/%Y')),
+            body=self.rapport.corps,
+            from_email=config('AUTHEMAIL_EMAIL_HOST_USER'),
+            to=self.destinataires,
+            connection=connection,
+        )
+        # PDF généré en mémoire
+        email.attach(self.nom_fichier, self.pdf, 'application/pdf')
+        return email
+
+
+RAPPORTS = {}
+
+
+def enregistrer_rapport(rapport):
+    RAPPORTS[rapport.cle] = rapport
+    return rapport
+
+
+enregistrer_rapport(Rapport(
+    cle='dashboard_hebdo',
+    collecter=get_weekly_dashboard_data,
+    template='clients/pdf/dashboard_hebdo.html',
+    sujet="Rapport Hebdomadaire Recouvrement - {date}",
+    corps=(
         "Bonjour,\n\nVeuillez trouver ci-joint le tableau de bord hebdomadaire "
         "relatif au suivi des clients, encaissements et retards de paiement.\n\nCordialement."
-    )
-
-    to_emails = [email.strip() for email in config('TO_DESTINATAIRES_BC', default='').split(',') if email.strip()]
-    if not to_emails:
-        raise ValueError("Aucun destinataire configure dans TO_DESTINATAIRES_BC.")
-    
-    email = EmailMessage(
-        subject=sujet,
-        body=corps_email,
-        from_email=config('AUTHEMAIL_EMAIL_HOST_USER'),
-        to=to_emails,
-    )
-    
-    # 5. Attacher le PDF généré en mémoire
-    nom_fichier = f"dashboard_hebdo_{data['date_generation'].strftime('%Y_%m_%d')}.pdf"
-    email.attach(nom_fichier, pdf_file, 'application/pdf')
-    
-    # 6. Envoyer !
-    return email.send()
+    ),
+    prefixe_fichier='dashboard_hebdo',
+    variable_destinataires='TO_DESTINATAIRES_BC',
+    libelle_pdf='dashboard',
+    mise_en_page=mises_en_page.dashboard_hebdo,
+))
+
+enregistrer_rapport(Rapport(
+    cle='factures_impayees',
+    collecter=get_suppliers_invoices_data,
+    template='fournisseurs/pdf/invoices_impayees.html',
+    sujet="Suivi Factures Impayées - {date}",
+    corps=(
+        "Bonjour,\n\nVeuillez trouver ci-joint le rapport détaillé des factures "
+        "impayées auprès de vos fournisseurs.\n\nCordialement."
+    ),
+    prefixe_fichier='factures_impayees',
+    variable_destinataires='TO_DESTINATAIRES_FACTURES',
+    libelle_pdf='factures impayees',
+    mise_en_page=mises_en_page.factures_impayees,
+))
+
+enregistrer_rapport(Rapport(
+    cle='factures_depassement',
+    collecter=get_suppliers_overdue_invoices_data,
+    template='fournisseurs/pdf/invoices_depassement.html',
+    sujet="Factures - Dépassement d'Échéance - {date}",
+    corps=(
+        "Bonjour,\n\nVeuillez trouver ci-joint le rapport des factures dont l'échéance "
+        "a dépassé ou s'approche (5 prochains jours).\n\nAction requise.\n\nCordialement."
+    ),
+    prefixe_fichier='factures_depassement',
+    variable_destinataires='TO_DESTINATAIRES_FACTURES',
+    libelle_pdf='factures depassement',
+    mise_en_page=mises_en_page.factures_depassement,
+))
+
+enregistrer_rapport(Rapport(
+    cle='bc_non_soldes',
+    collecter=get_suppliers_unsettled_po_data,
+    template='fournisseurs/pdf/bc_non_soldes.html',
+    sujet="Bons de Commande Non Soldés - {date}",
+    corps=(
+        "Bonjour,\n\nVeuillez trouver ci-joint le rapport hebdomadaire des bons de commande "
+        "non soldés avec détail de suivi de facturation.\n\nCordialement."
+    ),
+    prefixe_fichier='bc_non_soldes',
+    variable_destinataires='TO_DESTINATAIRES_BC',
+    libelle_pdf='BC non soldes',
+    mise_en_page=mises_en_page.bc_non_soldes,
+))
+
+
+def _preparer(resultat):
+    """Collecte les données du rapport et prépare son rendu : template HTML, ou document ReportLab si volumineux"""
+    debut = perf_counter()
+    resultat.data = resultat.rapport.collecter()
+    resultat.empreinte = empreinte_donnees(resultat.data)
+    if resultat.rapport.mise_en_page is not None:
+        document = resultat.rapport.mise_en_page(resultat.data)
+        if document.nombre_lignes >= SEUIL_LIGNES_REPORTLAB:
+            resultat.document = document
+    if resultat.document is None:
+        resultat.html = render_to_string(resultat.rapport.template, {'data': resultat.data})
+    resultat.durees['collecte'] = perf_counter() - debut
+
+
+def _preparer_dans_thread(resultat):
+    try:
+        _preparer(resultat)
+    finally:
+        # Chaque thread ouvre sa propre connexion : la fermer avant de rendre le thread au pool
+        connections.close_all()
+
+
+def _collecter(resultats, threads):
+    if threads > 1 and len(resultats) > 1:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            futures = [(resultat, pool.submit(_preparer_dans_thread, resultat)) for resultat in resultats]
+    else:
+        futures = []
+        for resultat in resultats:
+            try:
+                _preparer(resultat)
+            except Exception as e:
+                resultat.erreur = str(e)
+    for resultat, future in futures:
+        if future.exception() is not None:
+            resultat.erreur = str(future.exception())
+
+
+def _appliquer_cache(resultats, politique):
+    """Réutilise le PDF (ou ignore l'envoi) des rapports dont les données n'ont pas changé"""
+    inchanges = artefacts_inchanges({resultat.rapport.cle: resultat.empreinte for resultat in resultats})
+    for resultat in resultats:
+        artefact = inchanges.get(resultat.rapport.cle)
+        politique_rapport = politique or resultat.rapport.politique_cache
+        if artefact is None or politique_rapport == 'toujours':
+            continue
+        if envoi_inutile(artefact, politique_rapport):
+            resultat.ignore = True
+        elif artefact.pdf:
+            resultat.pdf = bytes(artefact.pdf)
+            resultat.reutilise = True
+
+
+def _rendre_pdf(resultats, processus):
+    resultats = [resultat for resultat in resultats if resultat.pdf is None]
+    sources = [resultat.document or resultat.html for resultat in resultats]
+    if processus > 1 and len(resultats) > 1:
+        with ProcessPoolExecutor(max_workers=processus) as pool:
+            rendus = list(pool.map(rendre_pdf_chronometre, sources))
+    else:
+        rendus = [rendre_pdf_chronometre(source) for source in sources]
+
+    for resultat, (pdf, duree) in zip(resultats, rendus):
+        resultat.durees['pdf'] = duree
+        if pdf is None:
+            moteur = 'ReportLab' if resultat.document is not None else 'xhtml2pdf'
+            resultat.erreur = f"La generation du PDF {resultat.rapport.libelle_pdf} a echoue avec {moteur}."
+            continue
+        resultat.pdf = pdf
+        enregistrer_artefact(resultat.rapport.cle, resultat.empreinte, resultat.html or '', pdf)
+
+
+def _envoyer(resultats):
+    """Envoie tous les emails sur une seule connexion"""
+    if not resultats:
+        return 0
+    connection = get_connection()
+    messages = [resultat.message(connection) for resultat in resultats]
+    try:
+        envoyes = connection.send_messages(messages) or 0
+    except Exception as e:
+        for resultat in resultats:
+            resultat.erreur = str(e)
+        return 0
+    for resultat in resultats:
+        resultat.envoye = True
+    marquer_envoyes(resultat.rapport.cle for resultat in resultats)
+    return envoyes
+
+
+def executer_rapports(cles=None, envoyer=True, threads=THREADS_COLLECTE, processus=PROCESSUS_PDF, politique=None):
+    """
+    Génère les rapports demandés et envoie leurs emails.
+
+    Un rapport en erreur (destinataires absents, collecte ou PDF en échec) n'empêche pas les autres.
+
+    Args:
+        cles: Clés de RAPPORTS à traiter (tous par défaut)
+        envoyer: False pour générer les PDF sans rien envoyer (essai)
+        threads: Threads de collecte (1 : dans le thread courant)
+        processus: Processus de rendu PDF (1 : dans le processus courant)
+        politique: Politique de cache imposée à tous les rapports (celle de chaque rapport par défaut)
+
+    Returns:
+        tuple: (liste de ResultatRapport, nombre d'emails envoyés, durée de chaque étape)
+    """
+    resultats = [ResultatRapport(RAPPORTS[cle]) for cle in (cles or RAPPORTS)]
+    durees = {}
+
+    def en_cours():
+        return [resultat for resultat in resultats if not resultat.erreur and not resultat.ignore]
+
+    for resultat in resultats:
+        try:
+            resultat.destinataires = resultat.rapport.destinataires()
+        except ValueError as e:
+            resultat.erreur = str(e)
+
+    etapes = [
+        ('collecte', lambda: _collecter(en_cours(), threads)),
+        ('cache', lambda: _appliquer_cache(en_cours(), politique)),
+        ('pdf', lambda: _rendre_pdf(en_cours(), processus)),
+    ]
+    if envoyer:
+        etapes.append(('envoi', lambda: _envoyer(en_cours())))
+
+    envoyes = 0
+    for etape, executer in etapes:
+        debut = perf_counter()
+        retour = executer()
+        durees[etape] = perf_counter() - debut
+        if etape == 'envoi':
+            envoyes = retour
+        logger.info("Rapports - étape %s : %.2fs", etape, durees[etape])
+
+    for resultat in resultats:
+        if resultat.erreur:
+            logger.error("Rapport %s en erreur : %s", resultat.rapport.cle, resultat.erreur)
+        elif resultat.ignore:
+            logger.info("Rapport %s inchangé depuis le dernier envoi : non renvoyé", resultat.rapport.cle)
+        else:
+            logger.info("Rapport %s : %s", resultat.rapport.cle,
+                        ', '.join(f'{etape} {duree:.2f}s' for etape, duree in resultat.durees.items()))
+    return resultats, envoyes, durees
+
+
+def envoyer_rapport(cle):
+    """Génère et envoie un seul rapport ; ValueError si le rapport est en erreur"""
+    resultats, envoyes, _ = executer_rapports([cle], threads=1, processus=1)
+    if resultats[0].erreur:
+        raise ValueError(resultats[0].erreur)
+    return envoyes
+
+
+def generer_et_envoyer_dashboard_hebdo():
+    return envoyer_rapport('dashboard_hebdo')
 
 
 def generer_et_envoyer_factures_impayees_fournisseurs():
     """Génère et envoie le rapport des factures impayées aux fournisseurs."""
-    # 1. Collecter les données
-    data = get_suppliers_invoices_data()
-    
-    # 2. Rendre le template HTML
-    html_string = render_to_string('fournisseurs/pdf/invoices_impayees.html', {'data': data})
-    
-    # 3. Convertir en PDF
-    pdf_buffer = BytesIO()
-    pdf_status = pisa.CreatePDF(src=html_string, dest=pdf_buffer, encoding='utf-8')
-    if pdf_status.err:
-        raise ValueError("La generation du PDF factures impayees a echoue avec xhtml2pdf.")
-
-    pdf_file = pdf_buffer.getvalue()
-    
-    # 4. Préparer l'email
-    sujet = f"Suivi Factures Impayées - {data['date_generation'].strftime('%d/%m/%Y')}"
-    corps_email = (
-        "Bonjour,\n\nVeuillez trouver ci-joint le rapport détaillé des factures "
-        "impayées auprès de vos fournisseurs.\n\nCordialement."
-    )
-
-    to_emails = [email.strip() for email in config('TO_DESTINATAIRES_FACTURES', default='').split(',') if email.strip()]
-    if not to_emails:
-        raise ValueError("Aucun destinataire configure dans TO_DESTINATAIRES_FACTURES.")
-    
-    email = EmailMessage(
-        subject=sujet,
-        body=corps_email,
-        from_email=config('AUTHEMAIL_EMAIL_HOST_USER'),
-        to=to_emails,
-    )
-    
-    # 5. Attacher le PDF
-    nom_fichier = f"factures_impayees_{data['date_generation'].strftime('%Y_%m_%d')}.pdf"
-    email.attach(nom_fichier, pdf_file, 'application/pdf')
-    
-    # 6. Envoyer
-    return email.send()
+    return envoyer_rapport('factures_impayees')
 
 
 def generer_et_envoyer_factures_depassement_fournisseurs():
     """Génère et envoie le rapport des factures dépassement d'échéance."""
-    # 1. Collecter les données
-    data = get_suppliers_overdue_invoices_data()
-    
-    # 2. Rendre le template HTML
-    html_string = render_to_string('fournisseurs/pdf/invoices_depassement.html', {'data': data})
-    
-    # 3. Convertir en PDF
-    pdf_buffer = BytesIO()
-    pdf_status = pisa.CreatePDF(src=html_string, dest=pdf_buffer, encoding='utf-8')
-    if pdf_status.err:
-        raise ValueError("La generation du PDF factures depassement a echoue avec xhtml2pdf.")
-
-    pdf_file = pdf_buffer.getvalue()
-    
-    # 4. Préparer l'email
-    sujet = f"Factures - Dépassement d'Échéance - {data['date_generation'].strftime('%d/%m/%Y')}"
-    corps_email = (
-        "Bonjour,\n\nVeuillez trouver ci-joint le rapport des factures dont l'échéance "
-        "a dépassé ou s'approche (5 prochains jours).\n\nAction requise.\n\nCordialement."
-    )
-
-    to_emails = [email.strip() for email in config('TO_DESTINATAIRES_FACTURES', default='').split(',') if email.strip()]
-    if not to_emails:
-        raise ValueError("Aucun destinataire configure dans TO_DESTINATAIRES_FACTURES.")
-    
-    email = EmailMessage(
-        subject=sujet,
-        body=corps_email,
-        from_email=config('AUTHEMAIL_EMAIL_HOST_USER'),
-        to=to_emails,
-    )
-    
-    # 5. Attacher le PDF
-    nom_fichier = f"factures_depassement_{data['date_generation'].strftime('%Y_%m_%d')}.pdf"
-    email.attach(nom_fichier, pdf_file, 'application/pdf')
-    
-    # 6. Envoyer
-    return email.send()
+    return envoyer_rapport('factures_depassement')
 
 
 def generer_et_envoyer_bc_non_soldes_fournisseurs():
     """Génère et envoie le rapport des bons de commande non soldés."""
-    # 1. Collecter les données
-    data = get_suppliers_unsettled_po_data()
-    
-    # 2. Rendre le template HTML
-    html_string = render_to_string('fournisseurs/pdf/bc_non_soldes.html', {'data': data})
-    
-    # 3. Convertir en PDF
-    pdf_buffer = BytesIO()
-    pdf_status = pisa.CreatePDF(src=html_string, dest=pdf_buffer, encoding='utf-8')
-    if pdf_status.err:
-        raise ValueError("La generation du PDF BC non soldes a echoue avec xhtml2pdf.")
-
-    pdf_file = pdf_buffer.getvalue()
-    
-    # 4. Préparer l'email
-    sujet = f"Bons de Commande Non Soldés - {data['date_generation'].strftime('%d/%m/%Y')}"
-    corps_email = (
-        "Bonjour,\n\nVeuillez trouver ci-joint le rapport hebdomadaire des bons de commande "
-        "non soldés avec détail de suivi de facturation.\n\nCordialement."
-    )
-
-    to_emails = [email.strip() for email in config('TO_DESTINATAIRES_BC', default='').split(',') if email.strip()]
-    if not to_emails:
-        raise ValueError("Aucun destinataire configure dans TO_DESTINATAIRES_BC.")
-    
-    email = EmailMessage(
-        subject=sujet,
-        body=corps_email,
-        from_email=config('AUTHEMAIL_EMAIL_HOST_USER'),
-        to=to_emails,
-    )
-    
-    # 5. Attacher le PDF
-    nom_fichier = f"bc_non_soldes_{data['date_generation'].strftime('%Y_%m_%d')}.pdf"
-    email.attach(nom_fichier, pdf_file, 'application/pdf')
-    
-    # 6. Envoyer
-    return email.send()
\ No newline at end of file
+    return envoyer_rapport('bc_non_soldes')
@@ -0,0 +1,213 @@
+"""
+Mises en page ReportLab des rapports PDF (voir utils.pdf.DocumentTableaux).
+
+Chaque fonction reprend le template HTML du rapport (clients/pdf, fournisseurs/pdf) à partir
+du même dict de données, avec les filtres Django des templates pour un formatage identique.
+"""
+from django.template.defaultfilters import date, floatformat, truncatechars
+
+from utils.pdf import Colonne, DocumentTableaux, Section
+
+NOTE_SYSTEME = "Rapport généré automatiquement par le système de gestion."
+
+
+def _jour(valeur):
+    return date(valeur, 'd/m/Y')
+
+
+def _montant(valeur, devise):
+    return f"{floatformat(valeur, 2)} {devise}"
+
+
+def dashboard_hebdo(data):
+    """clients/pdf/dashboard_hebdo.html"""
+    retards = Section(
+        titre="Top 10 des Factures en Retard de Paiement",
+        sous_titre="Classement par ancienneté du retard sur les factures non soldées.",
+        colonnes=[
+            Colonne("Client", 0.30, retour_ligne=True),
+            Colonne("N° Facture", 0.17),
+            Colonne("Échéance", 0.18, 'CENTER'),
+            Colonne("Retard", 0.15, 'CENTER'),
+            Colonne("Net à Payer", 0.20, 'RIGHT'),
+        ],
+        lignes=[
+            [
+                str(f['client']),
+                str(f['numero']),
+                _jour(f['date_echeance']),
+                (f"{f['jours_retard']} jours", '#c53030'),
+                _montant(f['net_a_payer'], 'MAD'),
+            ]
+            for f in data['factures_en_retard']
+        ],
+        vide="Aucun retard de paiement actuellement. Félicitations !",
+    )
+    ecarts = Section(
+        titre="Écarts détectés sur Paiements Clients",
+        sous_titre="Paiements non soldés présentant un écart entre encaissement et ventilation attendue.",
+        colonnes=[
+            Colonne("ID Paiement", 0.16),
+            Colonne("Client", 0.29, retour_ligne=True),
+            Colonne("Date Encaissement", 0.18, 'CENTER'),
+            Colonne("Montant Reçu", 0.19, 'RIGHT'),
+            Colonne("Écart", 0.18, 'RIGHT'),
+        ],
+        lignes=[
+            [
+                f"Paiement #{p.id}",
+                str(p.client.nom),
+                _jour(p.date_encaissement),
+                _montant(p.montant_total, 'MAD'),
+                (_montant(p.solde, 'MAD'), '#c53030' if p.solde < 0 else '#2b6cb0'),
+            ]
+            for p in data['paiements_anormaux']
+        ],
+        vide="Aucun écart de lettrage détecté.",
+        vide_positif=False,
+    )
+    return DocumentTableaux(
+        titre="Dashboard Suivi Recouvrement",
+        date_generation=_jour(data['date_generation']),
+        introduction="Synthèse hebdomadaire des encaissements, retards de paiement et écarts de lettrage clients.",
+        indicateurs=[
+            ("Total restant dû", _montant(data['montant_total_du'], 'MAD'), False),
+            ("Montant Échu", _montant(data['montant_echu_retard'], 'MAD'), True),
+            ("Taux de retard", f"{data['taux_retard']} %", True),
+            ("Prévisions 30j", f"+ {_montant(data['previsions_30j'], 'MAD')}", False),
+        ],
+        sections=[retards, ecarts],
+        note="Document généré automatiquement depuis le tableau de bord clients.",
+    )
+
+
+def factures_impayees(data):
+    """fournisseurs/pdf/invoices_impayees.html"""
+    factures = Section(
+        titre="Liste des Factures Impayées",
+        sous_titre="État détaillé de toutes les factures en attente de paiement.",
+        colonnes=[
+            Colonne("Fournisseur", 0.25, retour_ligne=True),
+            Colonne("N° Facture", 0.18),
+            Colonne("Date Facture", 0.15, 'CENTER'),
+            Colonne("Échéance", 0.15, 'CENTER'),
+            Colonne("Statut", 0.15, 'CENTER'),
+            Colonne("Montant", 0.12, 'RIGHT'),
+        ],
+        lignes=[
+            [
+                str(f['beneficiaire']),
+                str(f['num_facture']),
+                _jour(f['date_facture']),
+                _jour(f['date_echeance']),
+                str(f['statut']),
+                _montant(f['montant'], 'DH'),
+            ]
+            for f in data['factures']
+        ],
+        total=("TOTAL", [_montant(data['total_montant'], 'DH')]),
+        vide="Aucune facture impayée. Excellente position !",
+    )
+    return DocumentTableaux(
+        titre="Suivi Factures Impayées - Fournisseurs",
+        date_generation=_jour(data['date_generation']),
+        introduction="Synthèse des factures impayées auprès de vos fournisseurs.",
+        indicateurs=[
+            ("Nombre Factures", str(data['nombre_factures']), False),
+            ("Montant Total", _montant(data['total_montant'], 'DH'), False),
+        ],
+        sections=[factures],
+        note=NOTE_SYSTEME,
+    )
+
+
+def factures_depassement(data):
+    """fournisseurs/pdf/invoices_depassement.html"""
+    factures = Section(
+        titre="Top Factures - Dépassement d'Échéance",
+        sous_titre="Classement par ancienneté du dépassement (15 plus anciennes).",
+        # Largeurs du template (90 %) ramenées à la largeur de la page
+        colonnes=[
+            Colonne("Fournisseur", 0.22, retour_ligne=True),
+            Colonne("N° Facture", 0.20),
+            Colonne("Échéance", 0.17, 'CENTER'),
+            Colonne("Jours Retard", 0.13, 'CENTER'),
+            Colonne("Statut", 0.13, 'CENTER'),
+            Colonne("Montant", 0.15, 'RIGHT'),
+        ],
+        lignes=[
+            [
+                str(f['beneficiaire']),
+                str(f['num_facture']),
+                _jour(f['date_echeance']),
+                (f"{f['jours_retard']} jours", '#c53030') if f['jours_retard'] > 0 else '-',
+                str(f['statut']),
+                _montant(f['montant'], 'DH'),
+            ]
+            for f in data['factures']
+        ],
+        total=("TOTAL DÉPASSEMENT", [_montant(data['montant_depassement'], 'DH')]),
+        vide="Aucune facture en retard. Excellente gestion !",
+    )
+    return DocumentTableaux(
+        titre="Factures - Dépassement d'Échéance",
+        date_generation=_jour(data['date_generation']),
+        introduction="Synthèse des factures dont l'échéance a dépassé ou s'approche (5 prochains jours).",
+        indicateurs=[
+            ("Nombre Factures", str(data['nombre_factures']), False),
+            ("Montant Dépassement", _montant(data['montant_depassement'], 'DH'), True),
+            ("Taux Dépassement", f"{floatformat(data['taux_depassement'], 1)} %", True),
+            ("Total Montant", _montant(data['total_montant'], 'DH'), False),
+        ],
+        sections=[factures],
+        note=NOTE_SYSTEME,
+    )
+
+
+def bc_non_soldes(data):
+    """fournisseurs/pdf/bc_non_soldes.html"""
+    contrats = Section(
+        titre="Liste des Bons de Commande Non Soldés",
+        sous_titre="Détail du suivi de facturation pour chaque bon de commande.",
+        colonnes=[
+            Colonne("N° Contrat", 0.18),
+            Colonne("Libellé", 0.18, retour_ligne=True),
+            Colonne("Fournisseur", 0.15, retour_ligne=True),
+            Colonne("Montant (HT)", 0.12, 'RIGHT'),
+            Colonne("Facturé (HT)", 0.12, 'RIGHT'),
+            Colonne("Reste (HT)", 0.12, 'RIGHT'),
+            Colonne("Avancement", 0.13, 'CENTER'),
+        ],
+        lignes=[
+            [
+                str(c['numero_contrat']),
+                truncatechars(c['objet'], 30),
+                str(c['beneficiaire']),
+                _montant(c['montant_HT'], 'DH'),
+                _montant(c['total_facture'], 'DH'),
+                _montant(c['reste_a_facturer'], 'DH'),
+                (f"{c['taux_avancement']}%", '#2f855a'),
+            ]
+            for c in data['contrats']
+        ],
+        total=("TOTAL", [
+            _montant(data['total_contrats'], 'DH'),
+            _montant(data['total_factures'], 'DH'),
+            _montant(data['total_reste'], 'DH'),
+            f"{floatformat(data['taux_avancement_global'], 1)}%",
+        ]),
+        vide="Tous les bons de commande sont soldés ! Excellente gestion !",
+    )
+    return DocumentTableaux(
+        titre="Bons de Commande Non Soldés",
+        date_generation=_jour(data['date_generation']),
+        introduction="État détaillé des bons de commande en cours avec suivi de facturation.",
+        indicateurs=[
+            ("Nombre BC", str(data['nombre_contrats']), False),
+            ("Montant Total", _montant(data['total_contrats'], 'DH'), False),
+            ("Montant Facturé", _montant(data['total_factures'], 'DH'), False),
+            ("Reste à Facturer", _montant(data['total_reste'], 'DH'), False),
+        ],
+        sections=[contrats],
+        note=NOTE_SYSTEME,
+    )
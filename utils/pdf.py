@@ -0,0 +1,272 @@
+# utils/pdf.py
+"""
+Rendu PDF des rapports.
+
+- html_vers_pdf : template HTML converti par xhtml2pdf (mise en page libre)
+- tableaux_vers_pdf : DocumentTableaux construit directement en flowables ReportLab
+  (LongTable), pour les rapports de plusieurs centaines de lignes
+
+Module sans dépendance à Django : les fonctions sont exécutées dans les processus
+du pool de rendu des rapports (voir utils.emails.executer_rapports).
+"""
+from dataclasses import dataclass, field
+from io import BytesIO
+from time import perf_counter
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.platypus import LongTable, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+from xhtml2pdf import pisa
+
+# Couleurs des templates HTML des rapports
+BLEU = colors.HexColor('#2b6cb0')
+BLEU_FONCE = colors.HexColor('#1a365d')
+GRIS_TEXTE = colors.HexColor('#2d3748')
+GRIS_SECONDAIRE = colors.HexColor('#718096')
+GRIS_LIBELLE = colors.HexColor('#4a5568')
+GRIS_BORDURE = colors.HexColor('#e2e8f0')
+FOND_CLAIR = colors.HexColor('#f7fafc')
+FOND_INTRO = colors.HexColor('#edf2f7')
+FOND_TOTAL = colors.HexColor('#e7f3e7')
+FOND_ALERTE = colors.HexColor('#fff5f5')
+BORDURE_ALERTE = colors.HexColor('#feb2b2')
+ROUGE = colors.HexColor('#c53030')
+VERT = colors.HexColor('#2f855a')
+FOND_VERT = colors.HexColor('#f0fff4')
+
+ALIGNEMENTS = {'LEFT': 0, 'CENTER': TA_CENTER, 'RIGHT': TA_RIGHT}
+
+
+@dataclass
+class Colonne:
+    entete: str
+    largeur: float  # part de la largeur utile (0-1)
+    alignement: str = 'LEFT'  # LEFT, CENTER, RIGHT
+    retour_ligne: bool = False  # texte long : Paragraph (plus lent) plutôt que chaîne brute
+
+
+@dataclass
+class Section:
+    titre: str
+    sous_titre: str
+    colonnes: list
+    lignes: list  # cellules str, ou (str, couleur hex) pour une valeur en gras colorée
+    total: tuple = None  # (libellé sur les premières colonnes, [valeurs des dernières colonnes])
+    vide: str = ''  # message si aucune ligne
+    vide_positif: bool = True  # message vert (tout va bien) ou neutre
+
+
+@dataclass
+class DocumentTableaux:
+    titre: str
+    date_generation: str
+    introduction: str
+    indicateurs: list  # [(libellé, valeur, alerte)]
+    sections: list = field(default_factory=list)
+    note: str = ''
+
+    @property
+    def nombre_lignes(self):
+        return sum(len(section.lignes) for section in self.sections)
+
+
+def html_vers_pdf(html_string):
+    """
+    Returns:
+        bytes: Contenu du PDF, None si xhtml2pdf signale une erreur
+    """
+    pdf_buffer = BytesIO()
+    pdf_status = pisa.CreatePDF(src=html_string, dest=pdf_buffer, encoding='utf-8')
+    if pdf_status.err:
+        return None
+    return pdf_buffer.getvalue()
+
+
+def _style(nom, **kwargs):
+    attributs = {'fontName': 'Helvetica', 'fontSize': 10, 'leading': 12.5, 'textColor': GRIS_TEXTE}
+    return ParagraphStyle(nom, **{**attributs, **kwargs})
+
+
+def _entete(document, largeur):
+    titre = Paragraph(document.titre, _style('titre', fontName='Helvetica-Bold', fontSize=22, leading=26,
+                                             textColor=BLEU_FONCE))
+    date = Paragraph(f"Généré le {document.date_generation}", _style('date', textColor=GRIS_SECONDAIRE,
+                                                                      alignment=TA_RIGHT))
+    table = Table([[titre, date]], colWidths=[largeur * 0.7, largeur * 0.3])
+    table.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'BOTTOM'),
+        ('LINEBELOW', (0, 0), (0, 0), 2, BLEU),
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ]))
+    return table
+
+
+def _encadre(texte, largeur):
+    table = Table([[Paragraph(texte, _style('intro', textColor=GRIS_LIBELLE))]], colWidths=[largeur])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, -1), FOND_INTRO),
+        ('BOX', (0, 0), (-1, -1), 0.75, colors.HexColor('#d6e2ee')),
+        ('TOPPADDING', (0, 0), (-1, -1), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+    ]))
+    return table
+
+
+def _indicateurs(indicateurs, largeur):
+    """Cartes d'indicateurs séparées par un espace de 8 points"""
+    espace = 8
+    largeur_carte = (largeur - espace * (len(indicateurs) - 1)) / len(indicateurs)
+    libelle = _style('kpi_libelle', fontSize=9, textColor=GRIS_LIBELLE, alignment=TA_CENTER)
+    cellules, largeurs, styles = [], [], [('VALIGN', (0, 0), (-1, -1), 'TOP')]
+    for i, (texte, valeur, alerte) in enumerate(indicateurs):
+        if i:
+            cellules.append('')
+            largeurs.append(espace)
+        colonne = len(cellules)
+        valeur_style = _style('kpi_valeur', fontName='Helvetica-Bold', fontSize=15, leading=18,
+                              alignment=TA_CENTER, textColor=ROUGE if alerte else GRIS_TEXTE)
+        cellules.append([Paragraph(texte.upper(), libelle), Spacer(1, 5), Paragraph(valeur, valeur_style)])
+        largeurs.append(largeur_carte)
+        styles += [
+            ('BACKGROUND', (colonne, 0), (colonne, 0), FOND_ALERTE if alerte else FOND_CLAIR),
+            ('BOX', (colonne, 0), (colonne, 0), 0.75, BORDURE_ALERTE if alerte else GRIS_BORDURE),
+            ('TOPPADDING', (colonne, 0), (colonne, 0), 12),
+            ('BOTTOMPADDING', (colonne, 0), (colonne, 0), 12),
+        ]
+    table = Table([cellules], colWidths=largeurs)
+    table.setStyle(TableStyle(styles))
+    return table
+
+
+def _tableau(section, largeur):
+    """LongTable de la section : en-tête répété sur chaque page, lignes alternées, total éventuel"""
+    largeurs = [largeur * colonne.largeur for colonne in section.colonnes]
+    styles_paragraphes = [_style(f'cellule_{i}', alignment=ALIGNEMENTS[colonne.alignement])
+                          for i, colonne in enumerate(section.colonnes)]
+    styles = [
+        ('FONT', (0, 0), (-1, -1), 'Helvetica', 10),
+        ('TEXTCOLOR', (0, 0), (-1, -1), GRIS_TEXTE),
+        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 10),
+        ('BACKGROUND', (0, 0), (-1, 0), BLEU),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('GRID', (0, 0), (-1, -1), 0.75, GRIS_BORDURE),
+        ('BOX', (0, 0), (-1, 0), 0.75, BLEU),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('TOPPADDING', (0, 0), (-1, -1), 6),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ]
+    for i, colonne in enumerate(section.colonnes):
+        styles.append(('ALIGN', (i, 0), (i, -1), colonne.alignement))
+
+    donnees = [[colonne.entete for colonne in section.colonnes]]
+    for ligne in section.lignes:
+        cellules = []
+        for i, cellule in enumerate(ligne):
+            if isinstance(cellule, tuple):
+                texte, couleur = cellule
+                styles += [
+                    ('TEXTCOLOR', (i, len(donnees)), (i, len(donnees)), colors.HexColor(couleur)),
+                    ('FONT', (i, len(donnees)), (i, len(donnees)), 'Helvetica-Bold', 10),
+                ]
+                cellule = texte
+            if section.colonnes[i].retour_ligne:
+                cellule = Paragraph(escape(cellule), styles_paragraphes[i])
+            cellules.append(cellule)
+        donnees.append(cellules)
+
+    if not section.lignes:
+        donnees.append([section.vide] + [''] * (len(section.colonnes) - 1))
+        styles += [
+            ('SPAN', (0, 1), (-1, 1)),
+            ('ALIGN', (0, 1), (-1, 1), 'CENTER'),
+            ('BACKGROUND', (0, 1), (-1, 1), FOND_VERT if section.vide_positif else FOND_CLAIR),
+            ('TEXTCOLOR', (0, 1), (-1, 1), VERT if section.vide_positif else GRIS_LIBELLE),
+        ]
+    else:
+        styles.append(('ROWBACKGROUNDS', (0, 1), (-1, len(donnees) - 1), [colors.white, FOND_CLAIR]))
+        if section.total:
+            libelle, valeurs = section.total
+            fusion = len(section.colonnes) - len(valeurs)
+            donnees.append([libelle] + [''] * (fusion - 1) + list(valeurs))
+            styles += [
+                ('SPAN', (0, -1), (fusion - 1, -1)),
+                ('ALIGN', (0, -1), (fusion - 1, -1), 'RIGHT'),
+                ('BACKGROUND', (0, -1), (-1, -1), FOND_TOTAL),
+                ('FONT', (0, -1), (-1, -1), 'Helvetica-Bold', 10),
+            ]
+
+    table = LongTable(donnees, colWidths=largeurs, repeatRows=1)
+    table.setStyle(TableStyle(styles))
+    return table
+
+
+def _titre_section(section, largeur):
+    titre = Table([[section.titre]], colWidths=[largeur])
+    titre.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, -1), BLEU),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.white),
+        ('FONT', (0, 0), (-1, -1), 'Helvetica-Bold', 12),
+        ('TOPPADDING', (0, 0), (-1, -1), 7),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 7),
+    ]))
+    titre.keepWithNext = True
+    sous_titre = Paragraph(section.sous_titre, _style('sous_titre', fontSize=9, textColor=GRIS_SECONDAIRE,
+                                                      spaceBefore=5, spaceAfter=8))
+    sous_titre.keepWithNext = True
+    return [titre, sous_titre]
+
+
+def tableaux_vers_pdf(document):
+    """
+    Construit le PDF d'un DocumentTableaux avec ReportLab (même présentation que les templates HTML).
+
+    Returns:
+        bytes: Contenu du PDF
+    """
+    tampon = BytesIO()
+    pdf = SimpleDocTemplate(
+        tampon, pagesize=A4, title=document.titre,
+        leftMargin=12 * mm, rightMargin=12 * mm, topMargin=14 * mm, bottomMargin=16 * mm,
+    )
+    largeur = pdf.width
+    elements = [
+        _entete(document, largeur), Spacer(1, 14),
+        _encadre(document.introduction, largeur), Spacer(1, 14),
+    ]
+    if document.indicateurs:
+        elements += [_indicateurs(document.indicateurs, largeur), Spacer(1, 18)]
+    for section in document.sections:
+        elements += _titre_section(section, largeur)
+        elements += [_tableau(section, largeur), Spacer(1, 20)]
+    if document.note:
+        elements.append(Paragraph(document.note, _style('note', fontSize=8.5, textColor=GRIS_SECONDAIRE,
+                                                        alignment=TA_RIGHT)))
+    pdf.build(elements)
+    return tampon.getvalue()
+
+
+def rendre_pdf_chronometre(source):
+    """
+    Rend un rapport et mesure la durée du rendu.
+
+    Args:
+        source: HTML (xhtml2pdf) ou DocumentTableaux (ReportLab)
+
+    Returns:
+        tuple: (pdf ou None si le rendu a échoué, secondes)
+    """
+    debut = perf_counter()
+    if isinstance(source, DocumentTableaux):
+        try:
+            pdf = tableaux_vers_pdf(source)
+        except Exception:
+            # Même contrat que html_vers_pdf : l'échec d'un rapport n'interrompt pas le pool de rendu
+            pdf = None
+    else:
+        pdf = html_vers_pdf(source)
+    return pdf, perf_counter() - debut